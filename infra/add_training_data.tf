@@ -36,6 +36,7 @@ module "add_training_data_lambda" {
     DB_USER : local.rds_secrets.username
     DB_PASSWORD : local.rds_secrets.password
     DB_HOST : local.rds_secrets.host
+    EMBEDDING_DIMENSION : local.rag_embedding_dimension
   }
 
   layers = [
@@ -51,6 +51,10 @@ module "python_dependencies_layer" {
   s3_key          = "lambda_layers/python_dependencies.zip"
 
   dependencies = [
-    "pg8000==1.31.5"
+    "pg8000==1.31.5",
+    "numpy==2.1.3",
+    "sqlglot==30.22.0",
+    "orjson==3.13.0",
+    "asyncpg==0.30.0"
   ]
 }
@@ -1,3 +1,7 @@
 locals {
   account_id = data.aws_caller_identity.current.account_id
+
+  # Dimension of the RAG training embeddings. Changing it requires re-embedding the
+  # stored training data: invoke the rag trainer with {"migrate_embeddings": true}
+  rag_embedding_dimension = 1536
 }
@@ -36,7 +36,11 @@ module "query_listening_data_lambda" {
     DB_USER : local.rds_secrets.username
     DB_PASSWORD : local.rds_secrets.password
     DB_HOST : local.rds_secrets.host
+    EMBEDDING_DIMENSION : local.rag_embedding_dimension
     BEDROCK_LLM_MODEL_ID : "us.amazon.nova-pro-v1:0"
+    RETRIEVAL_ENGINE : "memory"
+    PIPELINE_MODE : "sync"
+    AGGREGATION_STATUS_TABLE_NAME : module.status_timestamps_table.name
   }
 
   layers = [
@@ -68,6 +72,13 @@ resource "aws_iam_policy" "query_listening_data_policy" {
         Resource = [
           "*"
         ]
+      },
+      {
+        Effect = "Allow",
+        Action = [
+          "dynamodb:GetItem"
+        ],
+        Resource = module.status_timestamps_table.arn
       }
     ]
   })
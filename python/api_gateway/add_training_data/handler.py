@@ -1,5 +1,6 @@
 import json
 from rag_trainer import RAGTrainer
+from serializer import dumps
 
 def handler(event, context):
     try:
@@ -16,7 +17,7 @@ def handler(event, context):
         if not question or not sql:
             return {
                 "statusCode": 400,
-                "body": json.dumps({
+                "body": dumps({
                     "error": "Both 'question' and 'sql' are required in request body"
                 }),
             }
@@ -37,16 +38,20 @@ def handler(event, context):
 
         # Connect to postgres and train
         trainer.connect_to_postgres()
-        trainer.train()
-        trainer.close_connection()
+        try:
+            report = trainer.train()
+        finally:
+            # Returns the connection to the pool for the next warm invocation
+            trainer.close_connection()
 
         print("HITL feedback processed successfully!")
 
         return {
             "statusCode": 200,
-            "body": json.dumps({
+            "body": dumps({
                 "message": "Training data added successfully!",
-                "question": question
+                "question": question,
+                "already_trained": report["added"] == 0 and report["unchanged"] > 0
             }),
         }
     
@@ -54,7 +59,7 @@ def handler(event, context):
         print(f"Error processing HITL feedback: {str(e)}")
         return {
             "statusCode": 500,
-            "body": json.dumps({
+            "body": dumps({
                 "error": "Internal server error",
                 "message": str(e)
             }),
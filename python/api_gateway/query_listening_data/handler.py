@@ -1,11 +1,16 @@
+import asyncio
+import hashlib
 import json
 import os
-from typing import Any, Dict, List, TypedDict
-from datetime import date, datetime
+from typing import Any, Dict, List, Optional, TypedDict
 
 import boto3
 from langchain_core.output_parsers import JsonOutputParser
 from langgraph.graph import StateGraph
+from async_sql_generator import AsyncSQLGenerator
+from pagination import PageTokenCodec
+from result_format import RESULT_FORMATS, encode_columnar
+from serializer import dumps
 from sql_generator import SQLGenerator
 
 class AgentState(TypedDict):
@@ -14,72 +19,198 @@ class AgentState(TypedDict):
     query_embedding: List[float]
     question_sql_examples: List[Dict[str, str]]
     ddl_examples: List[Dict[str, str]]
+    documentation_examples: List[Dict[str, str]]
+    entities: List[Dict[str, Any]]
     message_log: List[Dict[str, str]]
     generated_sql: str
-    rds_response: List[Any]
+    optimized_sql: str
+    sql_template: Optional[Dict[str, Any]]
+    sql_cache_source: str
+    rds_response: Any
     text_response: str
     retry_count: int
     validation_error: str
+    page_size: Optional[int]
+    result_format: str
+    next_page_token: str
 
 llm_model_id = os.environ.get(
     "BEDROCK_LLM_MODEL_ID",
     "us.amazon.nova-pro-v1:0"
 )
 
-def serialize_datetime(obj):
+# "pgvector" or "memory" (in-process NumPy snapshot of the training embeddings)
+retrieval_engine = os.environ.get("RETRIEVAL_ENGINE", "pgvector")
+
+# "sync" runs the graph on threads with SQLGenerator; "async" runs it on an
+# event loop with AsyncSQLGenerator (asyncpg)
+pipeline_mode = os.environ.get("PIPELINE_MODE", "sync")
+
+if pipeline_mode == "async" and not AsyncSQLGenerator.available():
+    print("Warning: asyncpg is not installed, using the synchronous pipeline")
+    pipeline_mode = "sync"
+
+# Rows per response; the rest are fetched with next_page_token
+default_page_size = int(os.environ.get("PAGE_SIZE", 100))
+max_page_size = 500
+
+# Page tokens must verify on every container, so without PAGE_TOKEN_SECRET the
+# signing key is derived from the database password they all share
+page_token_secret = os.environ.get("PAGE_TOKEN_SECRET") or (
+    hashlib.sha256(b"page-token:" + os.environ["DB_PASSWORD"].encode("utf-8")).hexdigest()
+    if os.environ.get("DB_PASSWORD") else None
+)
+page_tokens = PageTokenCodec(page_token_secret)
+
+if not page_tokens.has_shared_secret:
+    print("Warning: no page token secret, page tokens only work on the container that issued them")
+
+# Built on first use and reused by warm invocations, so only a cold start pays
+# for the Bedrock client, the generator's caches and compiling the graph
+_generator: Optional[SQLGenerator] = None
+_graph = None
+_async_generator: Optional[AsyncSQLGenerator] = None
+_async_graph = None
+
+# The asyncpg pool belongs to an event loop, so one loop serves every invocation
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_generator() -> SQLGenerator:
+    global _generator
+    if _generator is None:
+        _generator = SQLGenerator({"retrieval_engine": retrieval_engine})
+    return _generator
+
+def get_graph():
+    global _graph
+    if _graph is None:
+        _graph = create_graph()
+    return _graph
+
+def get_async_generator() -> AsyncSQLGenerator:
+    global _async_generator
+    if _async_generator is None:
+        _async_generator = AsyncSQLGenerator({"retrieval_engine": retrieval_engine})
+    return _async_generator
+
+def get_async_graph():
+    global _async_graph
+    if _async_graph is None:
+        _async_graph = create_async_graph()
+    return _async_graph
+
+def run_async(coroutine):
     """
-    Convert datetime objects to ISO format strings for JSON serialization.
+    Run a coroutine to completion on the container's event loop.
     """
-    if isinstance(obj, (date, datetime)):
-        return obj.isoformat()
-    return obj
+    global _event_loop
+    if _event_loop is None:
+        _event_loop = asyncio.new_event_loop()
+    return _event_loop.run_until_complete(coroutine)
 
-def make_json_serializable(data):
+def format_rows(result: Dict[str, Any], result_format: str) -> Any:
     """
-    Recursively convert all datetime objects in a data structure to strings.
+    Shape query results for the response: a list of row dicts ("rows"), or
+    column names plus row arrays with repeated strings dictionary-encoded
+    ("columnar"). Columnar results are read with as_rows, so no row dicts are built.
+    Dates and Decimals are left for the serializer to convert.
     """
-    if isinstance(data, list):
-        return [make_json_serializable(item) for item in data]
-    elif isinstance(data, dict):
-        return {key: make_json_serializable(value) for key, value in data.items()}
-    elif isinstance(data, (date, datetime)):
-        return data.isoformat()
-    else:
-        return data
+    if result_format == "columnar":
+        return encode_columnar(result['columns'], result['data'])
+    return result['data']
 
 
 ## Nodes
 def connect_to_postgres(state: AgentState):
-    state["generator"].connect_to_postgres()
+    # Queries run on pooled connections, which stay open between warm invocations
+    # and are health-checked when taken, so no per-request connection is opened
+    state["generator"].ensure_connection_pool()
     return {}
 
+def match_sql_template(state: AgentState):
+    """
+    Match the question to a verified SQL template, so embedding, retrieval and
+    the LLM call can all be skipped.
+    """
+    template = state["generator"].match_sql_template(state["user_query"])
+    if template is None:
+        return {"sql_template": None}
+
+    print(f"Using SQL template {template['template']} for query")
+    return {
+        "sql_template": template,
+        "generated_sql": template["rendered_sql"],
+        "sql_cache_source": "template"
+    }
+
+def check_sql_template_hit(state: AgentState) -> str:
+    """
+    Router function: go straight to execution when a template matched.
+    """
+    return "hit" if state.get("sql_template") else "miss"
+
 def generate_embedding(state: AgentState):
     user_query = state["user_query"]
     query_embedding = state["generator"].generate_embedding(user_query)
     print(f"Generated embedding for query: {user_query}")
     return {"query_embedding": query_embedding}
 
-def get_similar_question_sql(state: AgentState):
+def retrieve_context(state: AgentState):
     query_embedding = state["query_embedding"]
-    question_sql_examples = state["generator"].get_similar_question_sql(query_embedding, top_k=3)
-    return {"question_sql_examples": question_sql_examples}
+    context = state["generator"].retrieve_context(
+        query_embedding,
+        k_by_type={"question-sql": 3, "ddl": 3, "documentation": 3}
+    )
+    return {
+        "question_sql_examples": context["question-sql"],
+        "ddl_examples": context["ddl"],
+        "documentation_examples": context["documentation"]
+    }
 
-def get_related_ddl(state: AgentState):
-    query_embedding = state["query_embedding"]
-    ddl_examples = state["generator"].get_related_ddl(query_embedding, top_k=3)
-    return {"ddl_examples": ddl_examples}
+def check_sql_cache(state: AgentState):
+    """
+    Look for SQL that already answers the question (a near-identical training pair
+    or a past answer), so the LLM call can be skipped.
+    """
+    cached = state["generator"].lookup_cached_sql(
+        state["user_query"],
+        state["query_embedding"],
+        state["question_sql_examples"]
+    )
+    if cached is None:
+        return {"sql_cache_source": ""}
+
+    print(f"Using {cached['source']} SQL for query (similarity {cached['similarity']:.3f})")
+    return {"generated_sql": cached["sql"], "sql_cache_source": cached["source"]}
+
+def check_sql_cache_hit(state: AgentState) -> str:
+    """
+    Router function: skip SQL generation when a cached answer was found.
+    """
+    return "hit" if state.get("sql_cache_source") else "miss"
+
+def resolve_entities(state: AgentState):
+    """
+    Resolve the artists, albums and tracks named in the question to their IDs,
+    so the generated SQL can filter on the indexed ID columns.
+    """
+    entities = state["generator"].resolve_entities(state["user_query"])
+    return {"entities": entities}
 
 def get_sql_prompt(state: AgentState):
     initial_prompt = None
     question = state["user_query"]
     question_sql_list = state["question_sql_examples"]
     ddl_list = state["ddl_examples"]
+    doc_list = state.get("documentation_examples", [])
 
     message_log = state["generator"].get_sql_prompt(
         initial_prompt=initial_prompt,
         question=question,
         question_sql_list=question_sql_list,
         ddl_list=ddl_list,
+        doc_list=doc_list,
+        entity_list=state.get("entities", []),
     )
     return {"message_log": message_log}
 
@@ -89,7 +220,9 @@ def validate_sql(state: AgentState):
     Returns validation results to state.
     """
     generated_sql = state["generated_sql"]
-    is_valid, error_msg = state["generator"].is_valid_sql(generated_sql)
+    # The cost budgets are checked by execute_query, on the SQL that actually runs
+    # after optimize_sql
+    is_valid, error_msg = state["generator"].is_valid_sql(generated_sql, check_cost=False)
     
     if not is_valid:
         print(f"SQL validation failed: {error_msg}")
@@ -120,10 +253,20 @@ def check_sql_validity(state: AgentState) -> str:
 def increment_retry(state: AgentState):
     """
     Increment the retry counter and prepare for retry.
+    The rejected SQL and the reason are added to the conversation so the LLM can fix it.
     """
     retry_count = state.get("retry_count", 0) + 1
     print(f"Incrementing retry count to {retry_count}")
-    return {"retry_count": retry_count}
+
+    generator = state["generator"]
+    message_log = state["message_log"] + [
+        generator.assistant_message(state["generated_sql"]),
+        generator.user_message(
+            f"That SQL query was rejected: {state['validation_error']}\n"
+            "Please return a corrected SQL query only."
+        ),
+    ]
+    return {"retry_count": retry_count, "message_log": message_log}
 
 def handle_validation_failure(state: AgentState):
     """
@@ -136,29 +279,36 @@ def handle_validation_failure(state: AgentState):
         "rds_response": []
     }
 
+def optimize_sql(state: AgentState):
+    """
+    Rewrite the SQL to read monthly/yearly aggregates where the question covers
+    whole months or years. The SQL as generated is kept for the response and caches.
+    """
+    generated_sql = state["generated_sql"]
+    optimized_sql = state["generator"].optimize_sql(generated_sql)
+    if optimized_sql != generated_sql:
+        print(f"Optimized SQL: {optimized_sql}")
+    return {"optimized_sql": optimized_sql}
+
 def call_llm(state: AgentState):
     message_log = state["message_log"]
     generated_sql = state["generator"].call_llm(message_log)
     return {"generated_sql": generated_sql}
 
 
-def execute_query(state: AgentState):
+def query_response(state: AgentState, result: Dict[str, Any], executed_sql: str, params: Optional[Dict]) -> Dict[str, Any]:
     """
-    Execute the validated SQL query and format the response.
+    Format the result of the executed query for the response, with a page
+    token when more rows are available.
     """
     generated_sql = state["generated_sql"]
+    page_size = state.get("page_size")
 
-    print(f"Executing SQL: {generated_sql}")
-    
-    # Execute query using the generator's execute_query method
-    result = state["generator"].execute_query(generated_sql)
-    
     if result['success']:
         # Format successful response
         print(f"Query executed successfully: {result['row_count']} rows returned")
         
-        # Convert datetime objects to strings for JSON serialization
-        serializable_data = make_json_serializable(result['data'])
+        serializable_data = format_rows(result, state.get("result_format", "rows"))
         
         # Create a formatted text response
         text_response = f"Query executed successfully. Retrieved {result['row_count']} rows.\n\n"
@@ -170,12 +320,26 @@ def execute_query(state: AgentState):
         else:
             text_response += "No rows returned."
 
+        # The next page re-runs the same SQL from where this one ended
+        next_page_token = ""
+        if result.get('has_more'):
+            next_page_token = page_tokens.encode({
+                "sql": executed_sql,
+                "params": params,
+                "display_sql": generated_sql,
+                "offset": result['next_offset'],
+                "page_size": page_size,
+                "format": state.get("result_format", "rows"),
+            })
+            text_response += "\nMore rows are available."
+
         print(text_response)
-        print(f"RDS Response: {serializable_data[:5]}")  # Print first 5 rows of data
+        print(f"RDS Response: {result['data'][:5]}")  # Print first 5 rows of data
         
         return {
             "rds_response": serializable_data,
-            "text_response": text_response
+            "text_response": text_response,
+            "next_page_token": next_page_token
         }
     else:
         # Handle execution error
@@ -187,8 +351,45 @@ def execute_query(state: AgentState):
             "text_response": error_msg
         }
 
+def execute_query(state: AgentState):
+    """
+    Execute the validated SQL query and format the response.
+    """
+    generated_sql = state["generated_sql"]
+    template = state.get("sql_template")
+
+    print(f"Executing SQL: {generated_sql}")
+    
+    page_size = state.get("page_size")
+    as_rows = state.get("result_format") == "columnar"
+
+    # Execute query using the generator's execute_query method, binding template slots as parameters
+    if template:
+        executed_sql, params = template["sql"], template["params"]
+        result = state["generator"].execute_query(executed_sql, params, page_size=page_size, as_rows=as_rows)
+    elif state.get("optimized_sql") and state["optimized_sql"] != generated_sql:
+        executed_sql, params = state["optimized_sql"], None
+        result = state["generator"].execute_query(executed_sql, page_size=page_size, as_rows=as_rows)
+        if not result['success']:
+            print(f"Optimized SQL failed, running it as generated: {result['error']}")
+            executed_sql = generated_sql
+            result = state["generator"].execute_query(executed_sql, page_size=page_size, as_rows=as_rows)
+    else:
+        executed_sql, params = generated_sql, None
+        result = state["generator"].execute_query(executed_sql, page_size=page_size, as_rows=as_rows)
+    
+    if result['success']:
+        # Remember freshly generated SQL that worked, so the question can skip the LLM next time
+        if not state.get("sql_cache_source"):
+            state["generator"].cache_sql_answer(state["user_query"], state["query_embedding"], generated_sql)
+    elif state.get("sql_cache_source") == "cache":
+        state["generator"].invalidate_cached_sql(generated_sql)
+    
+    return query_response(state, result, executed_sql, params)
+
 def close_connection(state: AgentState):
     state["generator"].close_connection()
+    print(f"Connection pool: {SQLGenerator.pool_metrics()}")
     return {}
 
 def create_graph():
@@ -196,32 +397,50 @@ def create_graph():
 
     # Add all nodes
     workflow.add_node("connect_to_postgres", connect_to_postgres)
+    workflow.add_node("match_sql_template", match_sql_template)
     workflow.add_node("generate_embedding", generate_embedding)
-    workflow.add_node("get_similar_question_sql", get_similar_question_sql)
-    workflow.add_node("get_related_ddl", get_related_ddl)
+    workflow.add_node("retrieve_context", retrieve_context)
+    workflow.add_node("check_sql_cache", check_sql_cache)
+    workflow.add_node("resolve_entities", resolve_entities)
     workflow.add_node("get_sql_prompt", get_sql_prompt)
     workflow.add_node("call_llm", call_llm)
     workflow.add_node("validate_sql", validate_sql)
     workflow.add_node("increment_retry", increment_retry)
     workflow.add_node("handle_validation_failure", handle_validation_failure)
+    workflow.add_node("optimize_sql", optimize_sql)
     workflow.add_node("execute_query", execute_query)
     workflow.add_node("close_connection", close_connection)
 
     # Set entry point
     workflow.set_entry_point("connect_to_postgres")
 
-    # Linear flow up to embedding
-    workflow.add_edge("connect_to_postgres", "generate_embedding")
+    # Answer from a SQL template when one fits, otherwise embed the question
+    workflow.add_edge("connect_to_postgres", "match_sql_template")
+    workflow.add_conditional_edges(
+        "match_sql_template",
+        check_sql_template_hit,
+        {
+            "hit": "execute_query",
+            "miss": "generate_embedding"
+        }
+    )
 
-    # Parallel retrieval of examples
-    workflow.add_edge("generate_embedding", "get_similar_question_sql")
-    workflow.add_edge("generate_embedding", "get_related_ddl")
-    
-    # All three retrieval nodes converge to get_sql_prompt
-    workflow.add_edge("get_similar_question_sql", "get_sql_prompt")
-    workflow.add_edge("get_related_ddl", "get_sql_prompt")
+    # Retrieve question-SQL examples, DDL and documentation in one round trip
+    workflow.add_edge("generate_embedding", "retrieve_context")
+    workflow.add_edge("retrieve_context", "check_sql_cache")
+
+    # Reuse cached SQL when available, otherwise generate it with the LLM
+    workflow.add_conditional_edges(
+        "check_sql_cache",
+        check_sql_cache_hit,
+        {
+            "hit": "optimize_sql",
+            "miss": "resolve_entities"
+        }
+    )
 
     # LLM call and validation
+    workflow.add_edge("resolve_entities", "get_sql_prompt")
     workflow.add_edge("get_sql_prompt", "call_llm")
     workflow.add_edge("call_llm", "validate_sql")
 
@@ -230,12 +449,15 @@ def create_graph():
         "validate_sql",
         check_sql_validity,
         {
-            "valid": "execute_query",
+            "valid": "optimize_sql",
             "retry": "increment_retry",
             "failed": "handle_validation_failure"
         }
     )
 
+    # Read the coarsest aggregate tables before executing
+    workflow.add_edge("optimize_sql", "execute_query")
+
     # Retry loop: increment counter then go back to call_llm
     workflow.add_edge("increment_retry", "call_llm")
 
@@ -250,41 +472,259 @@ def create_graph():
 
     return app
 
-def run_agent(user_query: str) -> Dict[str, Any]:
+## Async nodes, run by the AsyncSQLGenerator graph. The steps without I/O reuse the nodes above
+async def aconnect_to_postgres(state: AgentState):
+    await state["generator"].aconnect()
+    return {}
+
+def route_template_hit_async(state: AgentState) -> List[str]:
+    """
+    Router function: go straight to execution when a template matched, otherwise
+    retrieve context and resolve entities concurrently.
+    """
+    if state.get("sql_template"):
+        return ["execute_query"]
+    return ["generate_embedding", "resolve_entities"]
+
+async def agenerate_embedding(state: AgentState):
+    user_query = state["user_query"]
+    query_embedding = await state["generator"].agenerate_embedding(user_query)
+    print(f"Generated embedding for query: {user_query}")
+    return {"query_embedding": query_embedding}
+
+async def aretrieve_context(state: AgentState):
+    context = await state["generator"].aretrieve_context(
+        state["query_embedding"],
+        k_by_type={"question-sql": 3, "ddl": 3, "documentation": 3}
+    )
+    return {
+        "question_sql_examples": context["question-sql"],
+        "ddl_examples": context["ddl"],
+        "documentation_examples": context["documentation"]
+    }
+
+async def acheck_sql_cache(state: AgentState):
+    cached = await state["generator"].alookup_cached_sql(
+        state["user_query"],
+        state["query_embedding"],
+        state["question_sql_examples"]
+    )
+    if cached is None:
+        return {"sql_cache_source": ""}
+
+    print(f"Using {cached['source']} SQL for query (similarity {cached['similarity']:.3f})")
+    return {"generated_sql": cached["sql"], "sql_cache_source": cached["source"]}
+
+async def aresolve_entities(state: AgentState):
+    entities = await state["generator"].aresolve_entities(state["user_query"])
+    return {"entities": entities}
+
+async def acall_llm(state: AgentState):
+    generated_sql = await state["generator"].acall_llm(state["message_log"])
+    return {"generated_sql": generated_sql}
+
+async def avalidate_sql(state: AgentState):
+    is_valid, error_msg = await state["generator"].ais_valid_sql(state["generated_sql"], check_cost=False)
+    
+    if not is_valid:
+        print(f"SQL validation failed: {error_msg}")
+        return {"validation_error": error_msg}
+    
+    print("SQL validation passed")
+    return {"validation_error": ""}
+
+async def aexecute_query(state: AgentState):
+    """
+    execute_query on AsyncSQLGenerator.
+    """
+    generator = state["generator"]
+    generated_sql = state["generated_sql"]
+    template = state.get("sql_template")
+
+    print(f"Executing SQL: {generated_sql}")
+
+    page_size = state.get("page_size")
+    as_rows = state.get("result_format") == "columnar"
+
+    if template:
+        executed_sql, params = template["sql"], template["params"]
+        result = await generator.aexecute_query(executed_sql, params, page_size=page_size, as_rows=as_rows)
+    elif state.get("optimized_sql") and state["optimized_sql"] != generated_sql:
+        executed_sql, params = state["optimized_sql"], None
+        result = await generator.aexecute_query(executed_sql, page_size=page_size, as_rows=as_rows)
+        if not result['success']:
+            print(f"Optimized SQL failed, running it as generated: {result['error']}")
+            executed_sql = generated_sql
+            result = await generator.aexecute_query(executed_sql, page_size=page_size, as_rows=as_rows)
+    else:
+        executed_sql, params = generated_sql, None
+        result = await generator.aexecute_query(executed_sql, page_size=page_size, as_rows=as_rows)
+
+    if result['success']:
+        if not state.get("sql_cache_source"):
+            await generator.acache_sql_answer(state["user_query"], state["query_embedding"], generated_sql)
+    elif state.get("sql_cache_source") == "cache":
+        await generator.ainvalidate_cached_sql(generated_sql)
+
+    return query_response(state, result, executed_sql, params)
+
+def create_async_graph():
+    """
+    The graph of create_graph for AsyncSQLGenerator, run with ainvoke. Entity
+    resolution runs alongside embedding and context retrieval instead of after
+    the SQL cache check.
+    """
+    workflow = StateGraph(AgentState)
+
+    workflow.add_node("connect_to_postgres", aconnect_to_postgres)
+    workflow.add_node("match_sql_template", match_sql_template)
+    workflow.add_node("generate_embedding", agenerate_embedding)
+    workflow.add_node("retrieve_context", aretrieve_context)
+    workflow.add_node("resolve_entities", aresolve_entities)
+    workflow.add_node("check_sql_cache", acheck_sql_cache)
+    workflow.add_node("get_sql_prompt", get_sql_prompt)
+    workflow.add_node("call_llm", acall_llm)
+    workflow.add_node("validate_sql", avalidate_sql)
+    workflow.add_node("increment_retry", increment_retry)
+    workflow.add_node("handle_validation_failure", handle_validation_failure)
+    workflow.add_node("optimize_sql", optimize_sql)
+    workflow.add_node("execute_query", aexecute_query)
+    workflow.add_node("close_connection", close_connection)
+
+    workflow.set_entry_point("connect_to_postgres")
+
+    workflow.add_edge("connect_to_postgres", "match_sql_template")
+    workflow.add_conditional_edges(
+        "match_sql_template",
+        route_template_hit_async,
+        ["execute_query", "generate_embedding", "resolve_entities"]
+    )
+
+    # The SQL cache check waits for both branches
+    workflow.add_edge("generate_embedding", "retrieve_context")
+    workflow.add_edge(["retrieve_context", "resolve_entities"], "check_sql_cache")
+
+    workflow.add_conditional_edges(
+        "check_sql_cache",
+        check_sql_cache_hit,
+        {
+            "hit": "optimize_sql",
+            "miss": "get_sql_prompt"
+        }
+    )
+
+    workflow.add_edge("get_sql_prompt", "call_llm")
+    workflow.add_edge("call_llm", "validate_sql")
+    workflow.add_conditional_edges(
+        "validate_sql",
+        check_sql_validity,
+        {
+            "valid": "optimize_sql",
+            "retry": "increment_retry",
+            "failed": "handle_validation_failure"
+        }
+    )
+    workflow.add_edge("optimize_sql", "execute_query")
+    workflow.add_edge("increment_retry", "call_llm")
+    workflow.add_edge("execute_query", "close_connection")
+    workflow.add_edge("handle_validation_failure", "close_connection")
+
+    return workflow.compile()
+
+def initial_state(generator: SQLGenerator, user_query: str, page_size: Optional[int], result_format: str) -> AgentState:
+    return {
+        "generator": generator,
+        "user_query": user_query,
+        "query_embedding": [],
+        "question_sql_examples": [],
+        "ddl_examples": [],
+        "documentation_examples": [],
+        "entities": [],
+        "message_log": [],
+        "generated_sql": "",
+        "optimized_sql": "",
+        "sql_template": None,
+        "sql_cache_source": "",
+        "rds_response": [],
+        "text_response": "",
+        "retry_count": 0,  # Initialize retry_count
+        "validation_error": "",  # Initialize validation_error
+        "page_size": page_size,
+        "result_format": result_format,
+        "next_page_token": ""
+    }
+
+def agent_response(llm_response: Dict[str, Any]) -> Dict[str, Any]:
+    generated_sql = llm_response.get("generated_sql", "")
+    text_response = llm_response.get("text_response", "")
+    rds_response = llm_response.get("rds_response", [])  # Get the actual data
+    
+    print(f"Agent response - SQL: {generated_sql}")
+    print(f"Agent response - Data rows: {len(rds_response['rows'] if isinstance(rds_response, dict) else rds_response)}")
+    
+    return {
+        "sql": generated_sql,
+        "response": text_response,
+        "data": rds_response,  # Include the actual query results
+        "next_page_token": llm_response.get("next_page_token", "")
+    }
+
+def run_agent(user_query: str, page_size: Optional[int] = None, result_format: str = "rows") -> Dict[str, Any]:
     try:
-        generator = SQLGenerator()
-        app = create_graph()
+        generator = get_generator()
+        app = get_graph()
         print(f"Running agent with user query: {user_query}")
-        llm_response = app.invoke(
-            {
-                "generator": generator,
-                "user_query": user_query,
-                "query_embedding": [],
-                "question_sql_examples": [],
-                "ddl_examples": [],
-                "message_log": [],
-                "generated_sql": "",
-                "rds_response": [],
-                "text_response": "",
-                "retry_count": 0,  # Initialize retry_count
-                "validation_error": ""  # Initialize validation_error
-            }
-        )
-        generated_sql = llm_response.get("generated_sql", "")
-        text_response = llm_response.get("text_response", "")
-        rds_response = llm_response.get("rds_response", [])  # Get the actual data
-        
-        print(f"Agent response - SQL: {generated_sql}")
-        print(f"Agent response - Data rows: {len(rds_response)}")
-        
-        return {
-            "sql": generated_sql,
-            "response": text_response,
-            "data": rds_response  # Include the actual query results
-        }
+        llm_response = app.invoke(initial_state(generator, user_query, page_size, result_format))
+        return agent_response(llm_response)
     except Exception as e:
         print(f"Error during agent execution: {e}")
         return {"error": str(e)}
+
+async def run_agent_async(user_query: str, page_size: Optional[int] = None, result_format: str = "rows") -> Dict[str, Any]:
+    """
+    run_agent on the async graph. Many questions can be answered concurrently
+    on one event loop, e.g. with asyncio.gather.
+    """
+    try:
+        generator = get_async_generator()
+        app = get_async_graph()
+        print(f"Running async agent with user query: {user_query}")
+        llm_response = await app.ainvoke(initial_state(generator, user_query, page_size, result_format))
+        return agent_response(llm_response)
+    except Exception as e:
+        print(f"Error during agent execution: {e}")
+        return {"error": str(e)}
+
+def fetch_page(page: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fetch the next page of a previous answer from a decoded page token. The token
+    carries the SQL, so the question isn't answered again.
+    """
+    generator = get_generator()
+    generator.ensure_connection_pool()
+    result = generator.execute_query(
+        page["sql"],
+        page["params"],
+        page_size=page["page_size"],
+        offset=page["offset"],
+        as_rows=page.get("format") == "columnar"
+    )
+
+    if not result['success']:
+        return {"error": f"Query execution failed: {result['error']}"}
+
+    next_page_token = ""
+    if result['has_more']:
+        next_page_token = page_tokens.encode({**page, "offset": result['next_offset']})
+
+    print(f"Fetched {result['row_count']} rows from offset {page['offset']}")
+
+    return {
+        "sql": page["display_sql"],
+        "response": f"Retrieved {result['row_count']} more rows.",
+        "data": format_rows(result, page.get("format", "rows")),
+        "next_page_token": next_page_token
+    }
     
 def handler(event, context):
     try:
@@ -296,24 +736,67 @@ def handler(event, context):
         
         # Extract user_query from the body
         user_query = body.get('user_query') or body.get('query')
+        page_token = body.get('page_token')
+
+        try:
+            page_size = min(max(int(body.get('page_size') or default_page_size), 1), max_page_size)
+        except (TypeError, ValueError):
+            return {
+                "statusCode": 400,
+                "body": dumps({
+                    "error": "page_size must be a number"
+                }),
+            }
+
+        # "rows" (default) returns a dict per row; "columnar" is smaller for large answers
+        result_format = body.get('format') or "rows"
+        if result_format not in RESULT_FORMATS:
+            return {
+                "statusCode": 400,
+                "body": dumps({
+                    "error": f"format must be one of {', '.join(RESULT_FORMATS)}"
+                }),
+            }
+
+        # Later pages of an answer only need the token
+        if page_token:
+            try:
+                page = page_tokens.decode(page_token)
+            except ValueError as e:
+                return {
+                    "statusCode": 400,
+                    "body": dumps({
+                        "error": str(e)
+                    }),
+                }
+
+            return {
+                "statusCode": 200,
+                "body": dumps({
+                    "response": fetch_page(page),
+                }),
+            }
         
         if not user_query:
             return {
                 "statusCode": 400,
-                "body": json.dumps({
+                "body": dumps({
                     "error": "user_query is required in request body"
                 }),
             }
 
         print(f"Processing request with user_query: {user_query}")
 
-        response = run_agent(user_query=user_query)
+        if pipeline_mode == "async":
+            response = run_async(run_agent_async(user_query=user_query, page_size=page_size, result_format=result_format))
+        else:
+            response = run_agent(user_query=user_query, page_size=page_size, result_format=result_format)
 
-        print(f"Returning response: {json.dumps(response) if not isinstance(response, dict) or 'error' not in response else 'Error response'}")
+        print(f"Returning response: {dumps(response) if not isinstance(response, dict) or 'error' not in response else 'Error response'}")
 
         return {
             "statusCode": 200,
-            "body": json.dumps({
+            "body": dumps({
                 "response": response,
             }),
         }
@@ -322,7 +805,7 @@ def handler(event, context):
         print(f"Error processing request: {str(e)}")
         return {
             "statusCode": 500,
-            "body": json.dumps({
+            "body": dumps({
                 "error": "Internal server error",
                 "message": str(e)
             }),
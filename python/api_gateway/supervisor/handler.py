@@ -9,6 +9,7 @@ from langchain_core.messages import AIMessage, HumanMessage, ToolMessage, BaseMe
 from langchain_aws import ChatBedrockConverse
 from langgraph.graph import END, StateGraph
 from langgraph.graph.message import add_messages
+from serializer import dumps
 
 lambda_client = boto3.client("lambda")
 bedrock_client = boto3.client("bedrock-runtime")
@@ -20,11 +21,11 @@ class AgentState(TypedDict):
 
 def call_lambda_function(function_arn: str, data: any) -> any:
     try:
-        print(f"Calling lambda function: {function_arn} with data: {json.dumps(data)}")
+        print(f"Calling lambda function: {function_arn} with data: {dumps(data)}")
         response = lambda_client.invoke(
             FunctionName=function_arn,
             InvocationType="RequestResponse",
-            Payload=json.dumps({"body": json.dumps(data)}),
+            Payload=dumps({"body": dumps(data)}),
         )
         response_payload = json.loads(response["Payload"].read().decode("utf-8"))
         
@@ -32,11 +33,11 @@ def call_lambda_function(function_arn: str, data: any) -> any:
         body = json.loads(response_payload["body"]) if isinstance(response_payload["body"], str) else response_payload["body"]
         response_data = body["response"]
         
-        print(f"Lambda function response from {function_arn}: {json.dumps(response_data)}")
+        print(f"Lambda function response from {function_arn}: {dumps(response_data)}")
         return response_data
     except Exception as e:
         print(f"Error calling lambda function {function_arn}: {e}")
-        return json.dumps({"error": str(e)})
+        return dumps({"error": str(e)})
 
 # Store the user query globally for tool access
 _current_user_query = ""
@@ -63,11 +64,11 @@ def tool_query_listening_data() -> str:
             raise ValueError("No response from listening history tool")
         
         print(f"tool_query_listening_data response type: {type(response)}")
-        print(f"tool_query_listening_data response: {json.dumps(response) if isinstance(response, dict) else response}")
+        print(f"tool_query_listening_data response: {dumps(response) if isinstance(response, dict) else response}")
         
         # Ensure we return a string
         if isinstance(response, dict):
-            return json.dumps(response)
+            return dumps(response)
         elif isinstance(response, str):
             return response
         else:
@@ -75,7 +76,7 @@ def tool_query_listening_data() -> str:
             
     except Exception as e:
         print(f"Error in tool_query_listening_data: {e}")
-        return json.dumps({"error": f"Failed to query listening history: {str(e)}"})
+        return dumps({"error": f"Failed to query listening history: {str(e)}"})
     
 @tool
 def tool_control_playback(track_ids: List[str], action: str = "add_to_queue") -> str:
@@ -100,7 +101,7 @@ def tool_control_playback(track_ids: List[str], action: str = "add_to_queue") ->
         print(f"Executing tool_control_playback with {len(track_ids)} tracks and action={action}")
         
         if not track_ids:
-            return json.dumps({"error": "No track IDs provided"})
+            return dumps({"error": "No track IDs provided"})
         
         response = call_lambda_function(
             os.getenv("PLAYBACK_CONTROLLER_LAMBDA_ARN", ""),
@@ -110,11 +111,11 @@ def tool_control_playback(track_ids: List[str], action: str = "add_to_queue") ->
             },
         )
         
-        print(f"tool_control_playback response: {json.dumps(response) if isinstance(response, dict) else response}")
+        print(f"tool_control_playback response: {dumps(response) if isinstance(response, dict) else response}")
         
         # Ensure we return a string
         if isinstance(response, dict):
-            return json.dumps(response)
+            return dumps(response)
         elif isinstance(response, str):
             return response
         else:
@@ -122,7 +123,7 @@ def tool_control_playback(track_ids: List[str], action: str = "add_to_queue") ->
             
     except Exception as e:
         print(f"Error in tool_control_playback: {e}")
-        return json.dumps({"error": f"Failed to control playback: {str(e)}"})
+        return dumps({"error": f"Failed to control playback: {str(e)}"})
 
 
 @tool
@@ -147,7 +148,7 @@ def tool_create_playlist(track_ids: List[str], playlist_name: str = "") -> str:
         print(f"Executing tool_create_playlist with {len(track_ids)} tracks and name='{playlist_name}'")
         
         if not track_ids:
-            return json.dumps({"error": "No track IDs provided"})
+            return dumps({"error": "No track IDs provided"})
         
         response = call_lambda_function(
             os.getenv("CREATE_PLAYLIST_LAMBDA_ARN", ""),
@@ -158,11 +159,11 @@ def tool_create_playlist(track_ids: List[str], playlist_name: str = "") -> str:
             },
         )
         
-        print(f"tool_create_playlist response: {json.dumps(response) if isinstance(response, dict) else response}")
+        print(f"tool_create_playlist response: {dumps(response) if isinstance(response, dict) else response}")
         
         # Ensure we return a string
         if isinstance(response, dict):
-            return json.dumps(response)
+            return dumps(response)
         elif isinstance(response, str):
             return response
         else:
@@ -170,7 +171,7 @@ def tool_create_playlist(track_ids: List[str], playlist_name: str = "") -> str:
             
     except Exception as e:
         print(f"Error in tool_create_playlist: {e}")
-        return json.dumps({"error": f"Failed to create playlist: {str(e)}"})
+        return dumps({"error": f"Failed to create playlist: {str(e)}"})
 
 tools = [tool_query_listening_data, tool_control_playback, tool_create_playlist]
 
@@ -224,7 +225,7 @@ def execute_tools(state: AgentState) -> Dict[str, List[BaseMessage]]:
                 except Exception as e:
                     print(f"Error executing tool {tool_name}: {e}")
                     error_message = ToolMessage(
-                        content=json.dumps({"error": str(e)}),
+                        content=dumps({"error": str(e)}),
                         tool_call_id=tool_call_id,
                         name=tool_name,
                         status="error"
@@ -233,7 +234,7 @@ def execute_tools(state: AgentState) -> Dict[str, List[BaseMessage]]:
             else:
                 print(f"Tool {tool_name} not found")
                 error_message = ToolMessage(
-                    content=json.dumps({"error": f"Tool {tool_name} not found"}),
+                    content=dumps({"error": f"Tool {tool_name} not found"}),
                     tool_call_id=tool_call_id,
                     name=tool_name,
                     status="error"
@@ -385,24 +386,24 @@ def run_agent(user_query: str) -> Dict[str, Any]:
     }
 
 def handler(event, context):
-    print(f"Received event: {json.dumps(event)}")
+    print(f"Received event: {dumps(event)}")
     body = json.loads(event.get("body", "{}"))
     user_query = body.get("user_query", "")
     if not user_query:
         return {
             "statusCode": 400,
-            "body": json.dumps({"error": "user_query is required"}),
+            "body": dumps({"error": "user_query is required"}),
         }
     
     try:
         result = run_agent(user_query)
         return {
             "statusCode": 200,
-            "body": json.dumps(result),
+            "body": dumps(result),
         }
     except Exception as e:
         print(f"Error in handler: {e}")
         return {
             "statusCode": 500,
-            "body": json.dumps({"error": str(e)}),
+            "body": dumps({"error": str(e)}),
         }
\ No newline at end of file
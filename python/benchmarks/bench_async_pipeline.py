@@ -0,0 +1,148 @@
+"""
+Benchmark: answering many questions at once with the synchronous pipeline
+(one thread per question, pg8000 pool) and the asyncio pipeline (one event
+loop, asyncpg pool).
+
+Runs read-only against the database configured through DB_HOST / DB_USER /
+DB_PASSWORD, and calls Bedrock for one embedding per question. Each question
+embeds its text, retrieves context and runs a query, like an answer from the
+SQL cache does. Caches are disabled so every step reaches Bedrock and the
+database. Reports wall time for the whole batch, per-question latency, and
+the most threads alive at once.
+
+Usage:
+    python benchmarks/bench_async_pipeline.py [--questions 32] [--pool-size 5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+
+from async_sql_generator import AsyncSQLGenerator
+from sql_generator import SQLGenerator
+
+QUESTIONS = [
+    "What were my top tracks last month?",
+    "Which artists did I listen to most this year?",
+    "How many plays did I have per month in 2024?",
+    "What albums did I replay the most last week?",
+]
+
+SQL = """
+    SELECT track_id, track_name, artist_name, SUM(daily_play_count) AS total_plays
+    FROM daily_track_aggregates
+    WHERE date >= CURRENT_DATE - INTERVAL '30 days'
+    GROUP BY track_id, track_name, artist_name
+    ORDER BY total_plays DESC
+    LIMIT 10
+"""
+
+CONFIG = {
+    "retrieval_engine": "pgvector",
+    "result_cache_enabled": False,
+    "embedding_cache_persistent": False,
+}
+
+
+class ThreadCounter():
+    # Samples threading.active_count() in the background
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def answer_sync(generator: SQLGenerator, question: str) -> float:
+    started = time.perf_counter()
+    embedding = generator.generate_embedding(question)
+    generator.retrieve_context(embedding, {"question-sql": 3, "ddl": 3, "documentation": 3})
+    result = generator.execute_query(SQL)
+    assert result["success"], result["error"]
+    return time.perf_counter() - started
+
+
+async def answer_async(generator: AsyncSQLGenerator, question: str) -> float:
+    started = time.perf_counter()
+    embedding = await generator.agenerate_embedding(question)
+    await generator.aretrieve_context(embedding, {"question-sql": 3, "ddl": 3, "documentation": 3})
+    result = await generator.aexecute_query(SQL)
+    assert result["success"], result["error"]
+    return time.perf_counter() - started
+
+
+def report(name: str, wall: float, latencies, threads: int):
+    latencies = sorted(latencies)
+    p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+    print(
+        f"{name:<8} {wall * 1e3:>9.0f} {statistics.median(latencies) * 1e3:>8.0f} "
+        f"{p95 * 1e3:>8.0f} {threads:>12}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=32)
+    parser.add_argument("--pool-size", type=int, default=5)
+    args = parser.parse_args()
+
+    if not AsyncSQLGenerator.available():
+        sys.exit("asyncpg is not installed")
+
+    questions = [f"{QUESTIONS[i % len(QUESTIONS)]} ({i})" for i in range(args.questions)]
+    config = {**CONFIG, "pool_min_size": args.pool_size, "pool_max_size": args.pool_size}
+
+    print(f"{'pipeline':<8} {'wall ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'peak threads':>12}")
+
+    generator = SQLGenerator(config)
+    generator.ensure_connection_pool()
+    try:
+        answer_sync(generator, QUESTIONS[0])  # warm up
+        with ThreadCounter() as threads:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.questions) as executor:
+                latencies = list(executor.map(lambda question: answer_sync(generator, question), questions))
+            wall = time.perf_counter() - started
+        report("sync", wall, latencies, threads.peak)
+    finally:
+        SQLGenerator.close_connection_pool()
+
+    async def run_async():
+        async_generator = AsyncSQLGenerator(config)
+        await async_generator.aconnect()
+        try:
+            await answer_async(async_generator, QUESTIONS[0])  # warm up
+            with ThreadCounter() as threads:
+                started = time.perf_counter()
+                latencies = await asyncio.gather(*(answer_async(async_generator, question) for question in questions))
+                wall = time.perf_counter() - started
+            report("async", wall, latencies, threads.peak)
+        finally:
+            await AsyncSQLGenerator.aclose_pool()
+            AsyncSQLGenerator.close_connection_pool()
+
+    asyncio.run(run_async())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark: per-row INSERT loop vs. RAGTrainer's chunked multi-row bulk insert.
+
+Runs against the database configured through DB_HOST / DB_USER / DB_PASSWORD.
+Rows are written to a TEMP table named training_embeddings, which shadows the
+real table for this session only, so no training data is touched.
+
+Usage:
+    python benchmarks/bench_bulk_insert.py [--rows 1000 10000] [--chunk-size 500]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+
+from rag_trainer import RAGTrainer
+
+DIMENSION = 1536
+
+
+def make_training_data(row_count: int):
+    return [
+        {
+            "content": f"Benchmark question {i}?",
+            "embedding": [random.uniform(-1, 1) for _ in range(DIMENSION)],
+            "type": "question-sql",
+            "sql": f"SELECT {i};",
+            "content_hash": f"{i:064x}"
+        }
+        for i in range(row_count)
+    ]
+
+
+def reset_table(trainer: RAGTrainer, cursor):
+    cursor.execute("DROP TABLE IF EXISTS pg_temp.training_embeddings")
+    cursor.execute(f"""
+        CREATE TEMP TABLE training_embeddings (
+            id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            content TEXT NOT NULL,
+            embedding vector({DIMENSION}),
+            type VARCHAR(50) NOT NULL,
+            sql TEXT,
+            content_hash CHAR(64) UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    trainer.connection.commit()
+
+
+def per_row_insert(trainer: RAGTrainer, cursor, training_data):
+    insert_sql = """
+        INSERT INTO training_embeddings (content, embedding, type, sql)
+        VALUES (%s, %s, %s, %s)
+    """
+    for datum in training_data:
+        embedding_str = '[' + ','.join(map(str, datum['embedding'])) + ']'
+        cursor.execute(insert_sql, (datum['content'], embedding_str, datum['type'], datum['sql']))
+    trainer.connection.commit()
+
+
+def bulk_insert(trainer: RAGTrainer, cursor, training_data):
+    trainer._bulk_insert_training_data(cursor, training_data)
+    trainer.connection.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+
+    trainer = RAGTrainer({"insert_chunk_size": args.chunk_size})
+    trainer.connect_to_postgres()
+
+    try:
+        with trainer.connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS vector")
+            trainer.connection.commit()
+
+            print(f"{'rows':>8} {'per-row (s)':>12} {'bulk (s)':>10} {'speedup':>8}")
+            for row_count in args.rows:
+                training_data = make_training_data(row_count)
+
+                reset_table(trainer, cursor)
+                start = time.perf_counter()
+                per_row_insert(trainer, cursor, training_data)
+                per_row_seconds = time.perf_counter() - start
+
+                reset_table(trainer, cursor)
+                start = time.perf_counter()
+                bulk_insert(trainer, cursor, training_data)
+                bulk_seconds = time.perf_counter() - start
+
+                print(
+                    f"{row_count:>8} {per_row_seconds:>12.2f} {bulk_seconds:>10.2f} "
+                    f"{per_row_seconds / bulk_seconds:>7.1f}x"
+                )
+    finally:
+        trainer.close_connection()
+        RAGTrainer.close_connection_pool()
+
+
+if __name__ == "__main__":
+    main()
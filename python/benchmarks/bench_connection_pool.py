@@ -0,0 +1,127 @@
+"""
+Benchmark: connection setup, per-query latency and checkout waits with the
+previous fixed pool (a Queue of 3 connections opened one after another, each
+validated with SELECT 1 on checkout) and with ConnectionPool.
+
+Uses fake connections that sleep for a simulated network round trip per
+statement and several round trips per connect, so it needs no database. The
+concurrent case runs several queries at once, as parallel graph branches and
+embedding batches do.
+
+Usage:
+    python benchmarks/bench_connection_pool.py [--rtt-ms 2] [--query-ms 5] [--threads 6] [--queries 200]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from queue import Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+
+from connection_pool import ConnectionPool
+
+
+class FakeConnection():
+    # Startup, authentication and parameter status messages
+    connect_round_trips = 4
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        time.sleep(rtt * self.connect_round_trips)
+
+    def ping(self) -> bool:
+        time.sleep(self.rtt)
+        return True
+
+    def query(self, seconds: float):
+        time.sleep(self.rtt + seconds)
+
+    def close(self):
+        pass
+
+
+class FixedPool():
+    # The pool RAGBase used before ConnectionPool
+
+    def __init__(self, connect, size: int = 3):
+        self.connect = connect
+        self.queue = Queue(maxsize=size)
+        for _ in range(size):
+            self.queue.put(connect())
+
+    def acquire(self, timeout: float = 30):
+        conn = self.queue.get(timeout=timeout)
+        conn.ping()
+        return conn
+
+    def release(self, conn):
+        self.queue.put(conn, block=False)
+
+
+def run_queries(pool, queries: int, threads: int, query_seconds: float):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(count):
+        for _ in range(count):
+            started = time.perf_counter()
+            conn = pool.acquire()
+            try:
+                conn.query(query_seconds)
+            finally:
+                pool.release(conn)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    workers = [threading.Thread(target=worker, args=(queries // threads,)) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rtt-ms", type=float, default=2.0)
+    parser.add_argument("--query-ms", type=float, default=5.0)
+    parser.add_argument("--threads", type=int, default=6)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rtt = args.rtt_ms / 1000
+    query_seconds = args.query_ms / 1000
+
+    def connect():
+        return FakeConnection(rtt)
+
+    def make_fixed():
+        return FixedPool(connect)
+
+    def make_adaptive():
+        pool = ConnectionPool(connect, min_size=1, max_size=5, validate=FakeConnection.ping)
+        pool.warm()
+        return pool
+
+    print(f"{'pool':<10} {'case':<12} {'setup ms':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, make in (("fixed", make_fixed), ("adaptive", make_adaptive)):
+        for case, threads in (("sequential", 1), (f"{args.threads} threads", args.threads)):
+            started = time.perf_counter()
+            pool = make()
+            setup = time.perf_counter() - started
+
+            latencies = sorted(run_queries(pool, args.queries, threads, query_seconds))
+            p50 = statistics.median(latencies)
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            print(f"{name:<10} {case:<12} {setup * 1e3:>9.1f} {p50 * 1e3:>8.2f} {p95 * 1e3:>8.2f}")
+
+            if isinstance(pool, ConnectionPool):
+                metrics = pool.metrics()
+                print(f"{'':<10} created {metrics['created']}, waits {metrics['waits']}, validations {metrics['validations']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark: retrieval recall and latency per embedding dimension.
+
+Runs against the database configured through DB_HOST / DB_USER / DB_PASSWORD and
+calls Bedrock. The stored training contents are re-embedded at each dimension
+into a TEMP table, indexed the way VectorIndexManager would index them, and
+searched with a sample of stored questions embedded as queries. Recall@k is the
+overlap with the results of the full 1536-dimension search. No stored training
+data is modified.
+
+Usage:
+    python benchmarks/bench_embedding_dimensions.py [--dimensions 256 512 1024 1536] [--queries 50] [--k 10]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+
+from rag_trainer import RAGTrainer
+from vector_codec import encode_vector
+from vector_index import VectorIndexManager
+
+REFERENCE_DIMENSION = 1536
+
+
+def load_corpus(trainer: RAGTrainer, cursor):
+    cursor.execute("SELECT type, content FROM training_embeddings ORDER BY created_at")
+    corpus = cursor.fetchall()
+    trainer.connection.commit()
+    return corpus
+
+
+def build_table(trainer: RAGTrainer, cursor, dimension: int, corpus, embeddings):
+    cursor.execute("DROP TABLE IF EXISTS pg_temp.bench_embeddings")
+    cursor.execute(f"""
+        CREATE TEMP TABLE bench_embeddings (
+            id SERIAL PRIMARY KEY,
+            type VARCHAR(50) NOT NULL,
+            content TEXT NOT NULL,
+            embedding vector({dimension})
+        )
+    """)
+    rows = [
+        (datum_type, content, encode_vector(embedding))
+        for (datum_type, content), embedding in zip(corpus, embeddings)
+        if embedding
+    ]
+    for start in range(0, len(rows), trainer.insert_chunk_size):
+        chunk = rows[start:start + trainer.insert_chunk_size]
+        cursor.execute(
+            "INSERT INTO bench_embeddings (type, content, embedding) VALUES "
+            + ", ".join(["(%s, %s, %s::vector)"] * len(chunk)),
+            [value for row in chunk for value in row]
+        )
+
+    definition = VectorIndexManager(trainer.connection).choose_index(len(rows), "question-sql")["definition"]
+    cursor.execute(f"CREATE INDEX bench_embeddings_idx ON bench_embeddings {definition}")
+    cursor.execute("ANALYZE bench_embeddings")
+    cursor.execute("SELECT pg_relation_size('pg_temp.bench_embeddings_idx'::regclass)")
+    index_bytes = cursor.fetchone()[0]
+    trainer.connection.commit()
+    return index_bytes
+
+
+def search(cursor, query_embedding, k: int):
+    cursor.execute(
+        """
+        SELECT content FROM bench_embeddings
+        WHERE type = 'question-sql'
+        ORDER BY embedding <=> %s::vector
+        LIMIT %s
+        """,
+        (encode_vector(query_embedding), k)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[256, 512, 1024, 1536])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    trainer = RAGTrainer({"embedding_dimension": REFERENCE_DIMENSION})
+    trainer.connect_to_postgres()
+
+    try:
+        with trainer.connection.cursor() as cursor:
+            corpus = load_corpus(trainer, cursor)
+            questions = [content for datum_type, content in corpus if datum_type == "question-sql"]
+            questions = random.sample(questions, min(args.queries, len(questions)))
+
+            results = {}
+            print(f"{'dimension':>9} {'index size (KB)':>16} {'embed ms/query':>15} {'search ms/query':>16} {'recall@k':>9}")
+            for dimension in sorted(set(args.dimensions) | {REFERENCE_DIMENSION}, reverse=True):
+                document_embedder = RAGTrainer({"embedding_dimension": dimension})
+                query_embedder = RAGTrainer({"embedding_dimension": dimension})
+                query_embedder.embedding_input_type = "search_query"
+
+                embeddings = document_embedder.generate_embeddings([content for _, content in corpus])
+                index_bytes = build_table(trainer, cursor, dimension, corpus, embeddings)
+
+                start = time.perf_counter()
+                query_embeddings = [query_embedder.generate_embedding(question) for question in questions]
+                embed_seconds = time.perf_counter() - start
+
+                start = time.perf_counter()
+                results[dimension] = [search(cursor, embedding, args.k) for embedding in query_embeddings]
+                search_seconds = time.perf_counter() - start
+                trainer.connection.commit()
+
+                reference = results[REFERENCE_DIMENSION]
+                hits = sum(len(set(found) & set(expected)) for found, expected in zip(results[dimension], reference))
+                recall = hits / max(1, sum(len(expected) for expected in reference))
+
+                if dimension in args.dimensions:
+                    print(
+                        f"{dimension:>9} {index_bytes / 1024:>16.0f} "
+                        f"{embed_seconds / max(1, len(questions)) * 1000:>15.1f} "
+                        f"{search_seconds / max(1, len(questions)) * 1000:>16.2f} {recall:>9.3f}"
+                    )
+    finally:
+        trainer.close_connection()
+        RAGTrainer.close_connection_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark: rows read and execution time of generated SQL before and after the
+granularity router rewrites it to monthly/yearly aggregate tables.
+
+Runs read-only against the database configured through DB_HOST / DB_USER /
+DB_PASSWORD. Each query is run with EXPLAIN (ANALYZE, FORMAT JSON) as written
+and as rewritten, and the rows read by the scans in each plan are summed.
+Results of the two versions are compared to check the rewrite is exact.
+
+Usage:
+    python benchmarks/bench_granularity_router.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+
+from granularity_router import GranularityRouter
+from sql_generator import SQLGenerator
+
+QUERIES = {
+    "top tracks of last year": """
+        SELECT track_id, track_name, artist_name, SUM(daily_play_count) AS total_plays
+        FROM daily_track_aggregates
+        WHERE date >= DATE_TRUNC('year', CURRENT_DATE) - INTERVAL '1 year'
+            AND date < DATE_TRUNC('year', CURRENT_DATE)
+        GROUP BY track_id, track_name, artist_name
+        ORDER BY total_plays DESC
+        LIMIT 10
+    """,
+    "top artists, last 6 months": """
+        SELECT artist_id, artist_name, SUM(daily_play_count) AS total_plays
+        FROM daily_artist_aggregates
+        WHERE date >= CURRENT_DATE - INTERVAL '6 months' AND date <= CURRENT_DATE
+        GROUP BY artist_id, artist_name
+        ORDER BY total_plays DESC
+        LIMIT 10
+    """,
+    "unique albums, all time": """
+        SELECT COUNT(DISTINCT album_id) AS count
+        FROM daily_album_aggregates
+    """,
+    "plays this year": """
+        SELECT SUM(daily_play_count) AS total_plays
+        FROM daily_track_aggregates
+        WHERE date >= DATE_TRUNC('year', CURRENT_DATE)
+    """,
+}
+
+_SCAN_NODES = ("Seq Scan", "Index Scan", "Index Only Scan", "Bitmap Heap Scan")
+
+
+def rows_read(plan) -> int:
+    rows = plan.get("Actual Rows", 0) * plan.get("Actual Loops", 1) if plan["Node Type"] in _SCAN_NODES else 0
+    return rows + sum(rows_read(child) for child in plan.get("Plans", []))
+
+
+def explain(cursor, sql: str):
+    cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql)
+    result = cursor.fetchone()[0]
+    plan = (json.loads(result) if isinstance(result, str) else result)[0]
+    return rows_read(plan["Plan"]), plan["Execution Time"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if not GranularityRouter.available():
+        sys.exit("sqlglot is not installed")
+
+    generator = SQLGenerator()
+    generator.connect_to_postgres()
+
+    try:
+        with generator.connection.cursor() as cursor:
+            print(f"{'query':<28} {'rows (daily)':>13} {'rows (routed)':>14} {'ms (daily)':>11} {'ms (routed)':>12} {'same result':>12}")
+            for name, sql in QUERIES.items():
+                rewritten = generator.optimize_sql(sql)
+                if rewritten == sql:
+                    print(f"{name:<28} not rewritten")
+                    continue
+
+                timings = {"daily": [], "routed": []}
+                for _ in range(args.runs):
+                    daily_rows, daily_ms = explain(cursor, sql)
+                    routed_rows, routed_ms = explain(cursor, rewritten)
+                    timings["daily"].append(daily_ms)
+                    timings["routed"].append(routed_ms)
+
+                cursor.execute(sql)
+                expected = sorted(map(tuple, cursor.fetchall()))
+                cursor.execute(rewritten)
+                same = sorted(map(tuple, cursor.fetchall())) == expected
+                generator.connection.rollback()
+
+                print(
+                    f"{name:<28} {daily_rows:>13} {routed_rows:>14} "
+                    f"{statistics.median(timings['daily']):>11.2f} {statistics.median(timings['routed']):>12.2f} "
+                    f"{str(same):>12}"
+                )
+    finally:
+        generator.close_connection()
+        SQLGenerator.close_connection_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark: execution time of representative chatbot name searches with and
+without the pg_trgm GIN indexes from scripts/005.sql.
+
+Runs read-only against the database configured through DB_HOST / DB_USER /
+DB_PASSWORD. GIN indexes are only used through bitmap scans, so each query is
+run with EXPLAIN (ANALYZE, FORMAT JSON) once as is and once with
+enable_bitmapscan off, which gives the plan it had before the migration: the
+btree name indexes from scripts/003.sql can't serve ILIKE '%name%'.
+
+Usage:
+    python benchmarks/bench_name_search.py [--runs 5] [--name "taylor"]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+
+from sql_generator import SQLGenerator
+
+QUERIES = {
+    "artist plays, all time": """
+        SELECT artist_name, SUM(yearly_play_count) AS total_plays
+        FROM yearly_artist_aggregates
+        WHERE artist_name ILIKE %s
+        GROUP BY artist_name
+    """,
+    "artist plays, last 30 days": """
+        SELECT artist_name, SUM(daily_play_count) AS total_plays
+        FROM daily_artist_aggregates
+        WHERE artist_name ILIKE %s AND date >= CURRENT_DATE - INTERVAL '30 days'
+        GROUP BY artist_name
+    """,
+    "artist's top tracks": """
+        SELECT track_name, SUM(daily_play_count) AS total_plays
+        FROM daily_track_aggregates
+        WHERE artist_name ILIKE %s
+        GROUP BY track_id, track_name
+        ORDER BY total_plays DESC
+        LIMIT 10
+    """,
+    "track by name": """
+        SELECT track_name, artist_name, SUM(monthly_play_count) AS total_plays
+        FROM monthly_track_aggregates
+        WHERE track_name ILIKE %s
+        GROUP BY track_id, track_name, artist_name
+    """,
+    "album by name": """
+        SELECT album_name, artist_name, SUM(daily_play_count) AS total_plays
+        FROM daily_album_aggregates
+        WHERE album_name ILIKE %s
+        GROUP BY album_id, album_name, artist_name
+    """,
+}
+
+
+def explain(cursor, sql: str, params: tuple):
+    cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+    result = cursor.fetchone()[0]
+    plan = (json.loads(result) if isinstance(result, str) else result)[0]
+    return plan["Execution Time"], uses_index(plan["Plan"])
+
+
+def uses_index(plan) -> bool:
+    if plan.get("Index Name", "").endswith("_trgm"):
+        return True
+    return any(uses_index(child) for child in plan.get("Plans", []))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--name", default="taylor", help="Name fragment searched for")
+    args = parser.parse_args()
+
+    params = (f"%{args.name}%",)
+
+    generator = SQLGenerator()
+    generator.connect_to_postgres()
+
+    try:
+        with generator.connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM pg_indexes WHERE RIGHT(indexname, 5) = '_trgm'")
+            if not cursor.fetchone()[0]:
+                sys.exit("No trigram indexes found, run scripts/005.sql first")
+
+            print(f"{'query':<28} {'ms (no trgm)':>13} {'ms (trgm)':>10} {'speedup':>8} {'trgm used':>10}")
+            for name, sql in QUERIES.items():
+                timings = {"before": [], "after": []}
+                for _ in range(args.runs):
+                    cursor.execute("SET LOCAL enable_bitmapscan = off")
+                    before_ms, _ = explain(cursor, sql, params)
+                    generator.connection.rollback()
+
+                    after_ms, used = explain(cursor, sql, params)
+                    generator.connection.rollback()
+
+                    timings["before"].append(before_ms)
+                    timings["after"].append(after_ms)
+
+                before = statistics.median(timings["before"])
+                after = statistics.median(timings["after"])
+                print(f"{name:<28} {before:>13.2f} {after:>10.2f} {before / max(after, 0.001):>7.1f}x {str(used):>10}")
+    finally:
+        generator.close_connection()
+        SQLGenerator.close_connection_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark: response payload size and serialization time of query results in
+the default row-dict format and the columnar format.
+
+Uses synthetic playlist-style results (track, artist and album names and cover
+URLs, with artists and albums repeating across rows), so it needs no database.
+The row-dict timing covers building a dict per row and serializing it; the
+columnar timing covers encode_columnar and serializing it. Both serialize with
+the serializer module, as the handler does.
+
+Usage:
+    python benchmarks/bench_result_format.py [--rows 50] [--artists 8] [--runs 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+
+from result_format import decode_columnar, encode_columnar
+from serializer import dumps, loads
+
+COLUMNS = ["track_id", "track_name", "artist_id", "artist_name", "album_id", "album_name", "album_cover_url", "last_played", "total_plays"]
+
+
+def make_rows(count: int, artists: int, seed: int = 0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        artist = rng.randrange(artists)
+        album = artist * 3 + rng.randrange(3)
+        rows.append((
+            f"{rng.getrandbits(80):022x}",
+            f"Track number {i} with a reasonably long title",
+            f"artist{artist:018d}",
+            f"Artist Name {artist}",
+            f"album{album:019d}",
+            f"Album Title {album} (Deluxe Edition)",
+            f"https://i.scdn.co/image/ab67616d0000b273{album:024x}",
+            date(2025, 1 + i % 12, 1 + i % 28),
+            rng.randrange(1, 500),
+        ))
+    return rows
+
+
+def as_row_dicts(rows):
+    return dumps([dict(zip(COLUMNS, row)) for row in rows])
+
+
+def as_columnar(rows):
+    return dumps(encode_columnar(COLUMNS, rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--artists", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows, args.artists)
+
+    # The columnar payload must decode to the same rows
+    expected = loads(as_row_dicts(rows))
+    assert decode_columnar(loads(as_columnar(rows))) == expected
+
+    print(f"{'format':<10} {'bytes':>8} {'us / response':>14}")
+    for name, encode in (("rows", as_row_dicts), ("columnar", as_columnar)):
+        size = len(encode(rows).encode("utf-8"))
+        seconds = min(timeit.repeat(lambda: encode(rows), number=args.runs, repeat=5)) / args.runs
+        print(f"{name:<10} {size:>8} {seconds * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
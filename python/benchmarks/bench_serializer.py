@@ -0,0 +1,94 @@
+"""
+Benchmark: serializing query results for a handler response with the previous
+two-pass approach (make_json_serializable, then json.dumps) and with the
+shared serializer module, on its orjson backend and its stdlib fallback.
+
+Uses synthetic rows of the shape query_listening_data returns: IDs, names,
+cover URLs, a date and a play count. The previous approach can't serialize
+Decimal, so the rows hold ints; the serializer also handles SUM() results
+returned as Decimal, which is timed separately.
+
+Usage:
+    python benchmarks/bench_serializer.py [--rows 50] [--runs 2000]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import date, datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+
+import serializer
+from serializer import encode_value
+
+
+def make_rows(count: int, plays_type=int):
+    return [
+        {
+            "track_id": f"{i:022x}",
+            "track_name": f"Track number {i} with a reasonably long title",
+            "artist_name": f"Artist Name {i % 8}",
+            "album_cover_url": f"https://i.scdn.co/image/ab67616d0000b273{i % 24:024x}",
+            "date": date(2025, 1 + i % 12, 1 + i % 28),
+            "total_plays": plays_type(i * 7),
+        }
+        for i in range(count)
+    ]
+
+
+def make_json_serializable(data):
+    # The helper query_listening_data used before the serializer module
+    if isinstance(data, list):
+        return [make_json_serializable(item) for item in data]
+    elif isinstance(data, dict):
+        return {key: make_json_serializable(value) for key, value in data.items()}
+    elif isinstance(data, (date, datetime)):
+        return data.isoformat()
+    else:
+        return data
+
+
+def two_pass(body):
+    return json.dumps(make_json_serializable(body))
+
+
+def stdlib_single_pass(body):
+    return json.dumps(body, default=encode_value, separators=(",", ":"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=2000)
+    args = parser.parse_args()
+
+    cases = [
+        ("two-pass (previous)", two_pass, make_rows(args.rows)),
+        ("stdlib single pass", stdlib_single_pass, make_rows(args.rows)),
+        ("stdlib, Decimal plays", stdlib_single_pass, make_rows(args.rows, Decimal)),
+    ]
+    if serializer.orjson is not None:
+        cases += [
+            ("orjson", serializer.dumps, make_rows(args.rows)),
+            ("orjson, Decimal plays", serializer.dumps, make_rows(args.rows, Decimal)),
+        ]
+    else:
+        print("orjson is not installed, serializer.dumps uses the stdlib fallback\n")
+
+    # Every backend must produce the same document
+    expected = json.loads(two_pass({"data": make_rows(args.rows)}))
+    for name, encode, rows in cases:
+        assert json.loads(encode({"data": rows})) == expected, name
+
+    print(f"{'serializer':<24} {'us / response':>14}")
+    for name, encode, rows in cases:
+        body = {"response": {"sql": "SELECT ...", "data": rows}}
+        seconds = min(timeit.repeat(lambda: encode(body), number=args.runs, repeat=5)) / args.runs
+        print(f"{name:<24} {seconds * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
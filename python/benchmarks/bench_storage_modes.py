@@ -0,0 +1,128 @@
+"""
+Benchmark: index size, query latency and recall of each embedding storage mode.
+
+Runs against the database configured through DB_HOST / DB_USER / DB_PASSWORD.
+The stored training_embeddings rows are copied into a TEMP table of the same
+name, which shadows the real table for this session only, so no training data
+is touched. For each storage mode the quantized column is added and per-type
+indexes are built with the definitions VectorIndexManager would choose, then a
+sample of stored embeddings is used as queries. Recall@k is measured against
+an exact full-precision search.
+
+Usage:
+    python benchmarks/bench_storage_modes.py [--queries 50] [--k 10]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-west-2")
+
+from rag_trainer import RAGTrainer
+from sql_generator import SQLGenerator
+from vector_index import STORAGE_MODES, TRAINING_DATA_TYPES, VectorIndexManager
+
+
+def copy_table(trainer: RAGTrainer, cursor):
+    cursor.execute("DROP TABLE IF EXISTS pg_temp.training_embeddings")
+    cursor.execute("""
+        CREATE TEMP TABLE training_embeddings AS
+        SELECT id, content, embedding, type, sql, content_hash, created_at
+        FROM public.training_embeddings
+    """)
+    trainer.connection.commit()
+
+
+def exact_neighbors(cursor, embedding_str: str, datum_type: str, k: int):
+    cursor.execute(
+        """
+        SELECT content FROM training_embeddings
+        WHERE type = %s
+        ORDER BY embedding <=> %s::vector
+        LIMIT %s
+        """,
+        (datum_type, embedding_str, k)
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    trainer = RAGTrainer()
+    trainer.connect_to_postgres()
+
+    try:
+        with trainer.connection.cursor() as cursor:
+            copy_table(trainer, cursor)
+
+            cursor.execute("SELECT type, COUNT(*) FROM training_embeddings GROUP BY type")
+            row_counts = dict(cursor.fetchall())
+
+            cursor.execute("SELECT type, embedding::text FROM training_embeddings")
+            samples = cursor.fetchall()
+            samples = random.sample(samples, min(args.queries, len(samples)))
+            truth = [
+                (datum_type, embedding_str, exact_neighbors(cursor, embedding_str, datum_type, args.k))
+                for datum_type, embedding_str in samples
+            ]
+            trainer.connection.rollback()
+
+            print(f"{'mode':>8} {'index size (KB)':>16} {'ms/query':>9} {'recall@k':>9}")
+            for mode in STORAGE_MODES:
+                trainer.storage_mode = mode
+                trainer._migrate_storage_mode(cursor)
+
+                # Build on the temp table under benchmark-only names, so the real indexes are never touched
+                manager = VectorIndexManager(trainer.connection, {"storage_mode": mode}, trainer.log)
+                index_bytes = 0
+                for datum_type, row_count in row_counts.items():
+                    index_name = f"bench_{datum_type.replace('-', '_')}_idx"
+                    cursor.execute(f"DROP INDEX IF EXISTS pg_temp.{index_name}")
+                    cursor.execute(
+                        f"CREATE INDEX {index_name} ON training_embeddings "
+                        f"{manager.choose_index(row_count, datum_type)['definition']}"
+                    )
+                    cursor.execute(f"SELECT pg_relation_size('pg_temp.{index_name}'::regclass)")
+                    index_bytes += cursor.fetchone()[0]
+                cursor.execute("ANALYZE training_embeddings")
+                trainer.connection.commit()
+
+                generator = SQLGenerator({"storage_mode": mode})
+                generator._apply_search_params(
+                    trainer.connection,
+                    ef_search=max(generator.hnsw_ef_search, args.k * generator.rerank_candidates_factor)
+                )
+                statement = trainer.connection.prepare(generator.retrieve_context_sql)
+
+                hits = 0
+                start = time.perf_counter()
+                for datum_type, embedding_str, expected in truth:
+                    params = {"embedding": embedding_str}
+                    for candidate_type in TRAINING_DATA_TYPES:
+                        k = args.k if candidate_type == datum_type else 0
+                        params[f"k_{candidate_type.replace('-', '_')}"] = k
+                        params[f"candidates_{candidate_type.replace('-', '_')}"] = k * generator.rerank_candidates_factor
+                    rows = statement.run(**params)
+                    hits += len(expected & {row[1] for row in rows})
+                elapsed = time.perf_counter() - start
+                trainer.connection.rollback()
+
+                recall = hits / max(1, sum(len(expected) for _, _, expected in truth))
+                print(
+                    f"{mode:>8} {index_bytes / 1024:>16.0f} "
+                    f"{elapsed / max(1, len(truth)) * 1000:>9.2f} {recall:>9.3f}"
+                )
+    finally:
+        trainer.close_connection()
+        RAGTrainer.close_connection_pool()
+
+
+if __name__ == "__main__":
+    main()
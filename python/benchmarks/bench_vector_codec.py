@@ -0,0 +1,53 @@
+"""
+Benchmark: repr()-based vector literals vs. the vector_codec encoder and decoders.
+
+Runs entirely in process, no database needed. Reports the size of the text sent
+per vector and the time to encode it, and the time to decode a returned vector
+from its text literal and from vector_send() output (hex-encoded bytea, as
+pg8000 receives it).
+
+Usage:
+    python benchmarks/bench_vector_codec.py [--dimension 1536] [--iterations 1000]
+"""
+import argparse
+import os
+import random
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+
+from vector_codec import decode_vector, decode_vector_binary, encode_vector
+
+
+def repr_encode(embedding):
+    return '[' + ','.join(map(str, embedding)) + ']'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    embedding = [random.uniform(-0.1, 0.1) for _ in range(args.dimension)]
+    text = encode_vector(embedding)
+    binary = struct.pack(f">HH{args.dimension}f", args.dimension, 0, *embedding)
+    wire_hex = "\\x" + binary.hex()
+
+    def per_call(func):
+        return timeit.timeit(func, number=args.iterations) / args.iterations * 1e6
+
+    print(f"{'operation':<28} {'bytes':>8} {'us/vector':>10}")
+    print(f"{'encode repr()':<28} {len(repr_encode(embedding)):>8} {per_call(lambda: repr_encode(embedding)):>10.0f}")
+    print(f"{'encode encode_vector':<28} {len(text):>8} {per_call(lambda: encode_vector(embedding)):>10.0f}")
+    print(f"{'decode text literal':<28} {len(text):>8} {per_call(lambda: decode_vector(text)):>10.0f}")
+    print(
+        f"{'decode vector_send bytea':<28} {len(wire_hex):>8} "
+        f"{per_call(lambda: decode_vector_binary(bytes.fromhex(wire_hex[2:]))):>10.0f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
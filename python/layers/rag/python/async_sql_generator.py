@@ -0,0 +1,470 @@
+import asyncio
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+from result_cache import ResultCache
+from sql_generator import SQLGenerator
+
+try:
+    import asyncpg
+except ImportError:  # asyncpg is optional; the synchronous SQLGenerator is used instead
+    asyncpg = None
+
+# :name placeholders, not :: casts or the colons of time literals
+_NAMED_PARAMETER_PATTERN = re.compile(r"(?<![:\w]):(\w+)")
+
+
+def to_positional(sql: str, params: Dict[str, Any], casts: Optional[Dict[str, str]] = None) -> tuple[str, List[Any]]:
+    """
+    Rewrite SQL with :name placeholders to asyncpg's $n placeholders.
+    
+    Args:
+        sql: SQL with :name placeholders
+        params: Values for the placeholders
+        casts: Types to cast parameters to, by name, e.g. so a vector passed as
+            text can be cast to both vector and halfvec in one statement
+            
+    Returns:
+        Tuple of (SQL with $n placeholders, values in $n order)
+    """
+    casts = casts or {}
+    positions: Dict[str, int] = {}
+    
+    def replace(match):
+        name = match.group(1)
+        if name not in positions:
+            positions[name] = len(positions) + 1
+        cast = f"::{casts[name]}" if name in casts else ""
+        return f"${positions[name]}{cast}"
+    
+    positional_sql = _NAMED_PARAMETER_PATTERN.sub(replace, sql)
+    return positional_sql, [params[name] for name in positions]
+
+
+class AsyncSQLGenerator(SQLGenerator):
+    """
+    SQLGenerator for asyncio. Its a-prefixed coroutines run the pipeline's steps
+    without holding a thread each, so one container can answer many questions
+    concurrently and independent steps of one question can overlap.
+    
+    Context retrieval, the EXPLAIN cost check and query execution run on asyncpg
+    against a connection pool owned by the event loop. Bedrock calls, which boto3
+    only offers as blocking calls, and the lookups backed by the synchronous
+    connection pool (entity dictionary and in-memory index refreshes, the SQL
+    answer and result caches' shared tiers) run on a bounded thread pool shared
+    by all instances, so the threads used don't grow with the number of
+    questions in flight.
+    """
+    
+    # asyncpg pool shared by all instances, bound to the event loop that created it
+    _async_pool = None
+    _async_pool_loop: Optional[asyncio.AbstractEventLoop] = None
+    _async_pool_lock = threading.Lock()
+    
+    # Threads for blocking calls, shared by all instances
+    _executor: Optional[ThreadPoolExecutor] = None
+    _executor_lock = threading.Lock()
+    
+    def __init__(self, config=None):
+        super().__init__(config)
+        
+        # Blocking calls (mostly Bedrock) that can be in flight at once
+        self.blocking_call_concurrency = self.config.get("blocking_call_concurrency", 16)
+    
+    @staticmethod
+    def available() -> bool:
+        return asyncpg is not None
+    
+    @classmethod
+    def _get_executor(cls, max_workers: int) -> ThreadPoolExecutor:
+        """
+        Get the shared thread pool for blocking calls, creating it on first use.
+        """
+        with AsyncSQLGenerator._executor_lock:
+            if AsyncSQLGenerator._executor is None:
+                AsyncSQLGenerator._executor = ThreadPoolExecutor(
+                    max_workers=max_workers,
+                    thread_name_prefix="async-sql-generator"
+                )
+            return AsyncSQLGenerator._executor
+    
+    async def _run_blocking(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking call on the shared thread pool without blocking the event loop.
+        """
+        executor = self._get_executor(self.blocking_call_concurrency)
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(func, *args, **kwargs))
+    
+    def _with_connection(self, func: Callable, *args) -> Any:
+        """
+        Call func with a connection from the synchronous pool as its first argument.
+        Blocks, so it is run with _run_blocking.
+        """
+        with self.pooled_connection() as conn:
+            return func(conn, *args)
+    
+    async def aconnect(self):
+        """
+        Create the asyncpg pool for the running event loop if it doesn't exist
+        yet, and the synchronous pool used by the blocking lookups.
+        
+        Raises:
+            RuntimeError: If asyncpg is not installed
+        """
+        if asyncpg is None:
+            raise RuntimeError("asyncpg is not installed")
+        
+        loop = asyncio.get_running_loop()
+        with AsyncSQLGenerator._async_pool_lock:
+            pool = AsyncSQLGenerator._async_pool
+            if pool is not None and AsyncSQLGenerator._async_pool_loop is loop:
+                creating = None
+            else:
+                # A pool can't be used from another event loop, so it is replaced.
+                # Coroutines arriving while it is created wait for this future
+                creating = loop.create_future()
+                AsyncSQLGenerator._async_pool = creating
+                AsyncSQLGenerator._async_pool_loop = loop
+        
+        if creating is None:
+            if isinstance(pool, asyncio.Future):
+                await pool
+            return
+        
+        try:
+            self.log(f"Creating asyncpg pool with {self.pool_min_size}-{self.pool_max_size} connections")
+            pool = await asyncpg.create_pool(
+                host=os.environ.get('DB_HOST'),
+                port=int(os.environ.get('DB_PORT', '5432')),
+                database='postgres',
+                user=os.environ.get('DB_USER'),
+                password=os.environ.get('DB_PASSWORD'),
+                min_size=self.pool_min_size,
+                max_size=self.pool_max_size,
+                max_inactive_connection_lifetime=self.pool_max_lifetime_seconds
+            )
+        except Exception as e:
+            with AsyncSQLGenerator._async_pool_lock:
+                AsyncSQLGenerator._async_pool = None
+                AsyncSQLGenerator._async_pool_loop = None
+            creating.set_exception(e)
+            # Mark the exception retrieved, in case no other coroutine is waiting for the pool
+            creating.exception()
+            self.log(f"Error creating asyncpg pool: {e}", title="Error")
+            raise e
+        
+        with AsyncSQLGenerator._async_pool_lock:
+            AsyncSQLGenerator._async_pool = pool
+        creating.set_result(pool)
+        
+        await self._run_blocking(self.ensure_connection_pool)
+    
+    async def _get_async_pool(self):
+        await self.aconnect()
+        return AsyncSQLGenerator._async_pool
+    
+    @classmethod
+    async def aclose_pool(cls):
+        """
+        Close the asyncpg pool. Must be awaited on the event loop that created it.
+        """
+        with cls._async_pool_lock:
+            pool = cls._async_pool
+            cls._async_pool = None
+            cls._async_pool_loop = None
+        
+        if pool is not None and not isinstance(pool, asyncio.Future):
+            await pool.close()
+            print("Info: Closed asyncpg pool")
+    
+    async def agenerate_embedding(self, data: str, **kwargs) -> List[float]:
+        """
+        generate_embedding, without blocking the event loop.
+        """
+        return await self._run_blocking(self.generate_embedding, data, **kwargs)
+    
+    async def acall_llm(self, message_log: List[Dict], **kwargs) -> str:
+        """
+        call_llm, without blocking the event loop.
+        """
+        return await self._run_blocking(self.call_llm, message_log, **kwargs)
+    
+    async def aresolve_entities(self, question: str) -> List[Dict]:
+        """
+        resolve_entities, without blocking the event loop.
+        """
+        return await self._run_blocking(self.resolve_entities, question)
+    
+    async def alookup_cached_sql(
+        self,
+        question: str,
+        query_embedding: List[float],
+        question_sql_examples: Optional[List[Dict]] = None
+    ) -> Optional[Dict]:
+        """
+        lookup_cached_sql, without blocking the event loop.
+        """
+        return await self._run_blocking(self.lookup_cached_sql, question, query_embedding, question_sql_examples)
+    
+    async def acache_sql_answer(self, question: str, query_embedding: List[float], sql: str):
+        """
+        cache_sql_answer, without blocking the event loop.
+        """
+        await self._run_blocking(self.cache_sql_answer, question, query_embedding, sql)
+    
+    async def ainvalidate_cached_sql(self, sql: str):
+        """
+        invalidate_cached_sql, without blocking the event loop.
+        """
+        await self._run_blocking(self.invalidate_cached_sql, sql)
+    
+    async def aretrieve_context(
+        self,
+        query_embedding: List[float],
+        k_by_type: Optional[Dict[str, int]] = None,
+        probes: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ) -> Dict[str, List[Dict]]:
+        """
+        retrieve_context on asyncpg. With the "memory" retrieval engine the search
+        runs in-process, and only a due snapshot refresh goes to the thread pool.
+        
+        Args:
+            query_embedding: The embedding vector for the user's question
+            k_by_type: Number of results per training data type (defaults to self.top_k each)
+            probes: IVFFlat lists to scan for this query (defaults to self.ivfflat_probes)
+            ef_search: HNSW candidate list size for this query (defaults to self.hnsw_ef_search)
+            
+        Returns:
+            Dict keyed by training data type, as returned by retrieve_context
+        """
+        if k_by_type is None:
+            k_by_type = {"question-sql": self.top_k, "ddl": self.top_k, "documentation": self.top_k}
+        
+        if self.retrieval_engine == "memory":
+            index = self._get_memory_index(self.memory_index_refresh_seconds, self.log)
+            if index.is_stale() or index.needs_dimension_reload(len(query_embedding)):
+                return await self._run_blocking(self._retrieve_context_from_memory, query_embedding, k_by_type)
+            return self._retrieve_context_from_memory(query_embedding, k_by_type)
+        
+        params, ef_search = self._retrieve_context_params(query_embedding, k_by_type, ef_search)
+        probes = probes if probes is not None else self.ivfflat_probes
+        ef_search = ef_search if ef_search is not None else self.hnsw_ef_search
+        
+        # The vector is sent as text and cast by the statement, so no codec is needed
+        sql, args = to_positional(self.retrieve_context_sql, params, casts={"embedding": "text"})
+        
+        pool = await self._get_async_pool()
+        try:
+            async with pool.acquire() as conn:
+                async with conn.transaction(readonly=True):
+                    # Set for every query: the pool's RESET ALL on release drops session settings
+                    await conn.execute(
+                        "SELECT set_config('ivfflat.probes', $1, true), set_config('hnsw.ef_search', $2, true)",
+                        str(probes),
+                        str(ef_search)
+                    )
+                    rows = await conn.fetch(sql, *args)
+        except asyncpg.PostgresError as e:
+            self.log(f"Database error during context retrieval: {e}", title="Error")
+            raise e
+        except Exception as e:
+            self.log(f"Unexpected error during context retrieval: {e}", title="Error")
+            raise e
+        
+        return self._context_from_rows(rows)
+    
+    async def _acheck_query_cost(self, conn, sql: str) -> str:
+        """
+        _check_query_cost on an asyncpg connection.
+        """
+        try:
+            result = await conn.fetchval("EXPLAIN (FORMAT JSON) " + sql)
+        except asyncpg.PostgresError as e:
+            return f"Database rejected the query: {e}"
+        
+        return self._plan_budget_error(result)
+    
+    async def ais_valid_sql(self, sql: str, check_cost: bool = True) -> tuple[bool, str]:
+        """
+        is_valid_sql, with the cost check on asyncpg.
+        """
+        tree, error_msg = self.sql_validator.check(sql)
+        if error_msg:
+            return False, error_msg
+        
+        if check_cost and (self.max_query_cost or self.max_query_rows):
+            pool = await self._get_async_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction(readonly=True):
+                    error_msg = await self._acheck_query_cost(conn, self.sql_validator.apply_limit(sql, tree))
+            if error_msg:
+                return False, error_msg
+        
+        return True, ""
+    
+    async def _afetch_rows(self, conn, sql: str, offset: int, limit: Optional[int], as_rows: bool = False) -> tuple[List, List[str], bool]:
+        """
+        _fetch_rows on an asyncpg connection, reading through a server-side
+        cursor fetch_batch_size rows at a time. Must run inside a transaction.
+        """
+        statement = await conn.prepare(sql.strip().rstrip(';'))
+        columns = [attribute.name for attribute in statement.get_attributes()]
+        
+        cursor = await statement.cursor()
+        if offset:
+            await cursor.forward(offset)
+        
+        data = []
+        has_more = False
+        while True:
+            # Reading one row past the limit tells whether another page exists
+            batch_size = self.fetch_batch_size
+            if limit is not None:
+                batch_size = min(batch_size, limit + 1 - len(data))
+            rows = await cursor.fetch(batch_size)
+            
+            for row in rows:
+                if len(data) == limit:
+                    has_more = True
+                    break
+                data.append(list(row) if as_rows else dict(zip(columns, row)))
+            
+            if has_more or len(rows) < batch_size:
+                break
+        
+        return data, columns, has_more
+    
+    def _query_error(self, error_msg: str) -> Dict:
+        return {
+            'success': False,
+            'data': None,
+            'columns': None,
+            'row_count': 0,
+            'has_more': False,
+            'next_offset': None,
+            'error': error_msg
+        }
+    
+    async def aexecute_query(
+        self,
+        sql: str,
+        params: Optional[Dict] = None,
+        page_size: Optional[int] = None,
+        offset: int = 0,
+        as_rows: bool = False
+    ) -> Dict:
+        """
+        execute_query on asyncpg: the same validation, row caps, paging, read-only
+        transaction and statement timeout, and result caching. asyncpg prepares
+        and caches statements per connection itself.
+        
+        Args:
+            sql: The SQL query string to execute
+            params: Values for the :name placeholders in sql
+            page_size: Rows per page, or None for all rows up to max_result_rows
+            offset: Rows to skip, the previous page's next_offset
+            as_rows: Return 'data' as lists of values in column order
+            
+        Returns:
+            Dict with the structure execute_query returns
+        """
+        is_valid, error_msg = await self.ais_valid_sql(sql, check_cost=False)
+        if not is_valid:
+            self.log(f"Invalid SQL query: {error_msg}", title="Error")
+            return self._query_error(error_msg)
+        
+        if params is None:
+            sql = self.sql_validator.apply_limit(sql)
+        
+        # Rows this page may return without passing the total row cap
+        offset = max(0, int(offset))
+        limit = self.max_result_rows - offset if self.max_result_rows else None
+        if page_size:
+            limit = min(page_size, limit) if limit is not None else page_size
+        if limit is not None and limit <= 0:
+            return {
+                'success': True,
+                'data': [],
+                'columns': [],
+                'row_count': 0,
+                'has_more': False,
+                'next_offset': None,
+                'error': None
+            }
+        
+        watermark = await self._run_blocking(self._get_aggregation_watermark) if self.result_cache_enabled else None
+        cache_key = ResultCache.cache_key(sql, watermark, params, (offset, limit), as_rows) if watermark else None
+        
+        if cache_key:
+            if self.result_cache_shared:
+                cached = await self._run_blocking(self._with_connection, self._get_cached_result, cache_key, watermark)
+            else:
+                cached = self._get_cached_result(None, cache_key, watermark)
+            if cached is not None:
+                return cached
+        
+        pool = await self._get_async_pool()
+        try:
+            async with pool.acquire() as conn:
+                async with conn.transaction(readonly=True):
+                    if self.statement_timeout_ms:
+                        await conn.execute(f"SET LOCAL statement_timeout = {int(self.statement_timeout_ms)}")
+                    
+                    # Templates are verified and bounded; generated SQL must fit the planner budgets
+                    if params is None and (self.max_query_cost or self.max_query_rows):
+                        error_msg = await self._acheck_query_cost(conn, sql)
+                        if error_msg:
+                            self.log(f"Rejected SQL query: {error_msg}", title="Error")
+                            return self._query_error(error_msg)
+                    
+                    self.log(f"Executing SQL query: {sql[:100]}...")
+                    if params is not None:
+                        # Template results are small, so they are paged in memory
+                        positional_sql, args = to_positional(sql, params)
+                        statement = await conn.prepare(positional_sql)
+                        columns = [attribute.name for attribute in statement.get_attributes()]
+                        results = await statement.fetch(*args)
+                        end = offset + limit if limit is not None else len(results)
+                        data = [list(row) if as_rows else dict(zip(columns, row)) for row in results[offset:end]]
+                        has_more = len(results) > end
+                    else:
+                        data, columns, has_more = await self._afetch_rows(conn, sql, offset, limit, as_rows)
+        
+        except asyncpg.PostgresError as e:
+            error_msg = f"Database error executing query: {e}"
+            self.log(error_msg, title="Error")
+            return self._query_error(error_msg)
+        except Exception as e:
+            error_msg = f"Unexpected error executing query: {e}"
+            self.log(error_msg, title="Error")
+            return self._query_error(error_msg)
+        
+        row_count = len(data)
+        self.log(f"Query executed successfully. Retrieved {row_count} rows")
+        
+        if has_more and self.max_result_rows and offset + row_count >= self.max_result_rows:
+            self.log(f"Result truncated at max_result_rows ({self.max_result_rows})", title="Warning")
+            has_more = False
+        
+        result = {
+            'success': True,
+            'data': data,
+            'columns': columns,
+            'row_count': row_count,
+            'has_more': has_more,
+            'next_offset': offset + row_count if has_more else None,
+            'error': None
+        }
+        
+        if cache_key:
+            if self.result_cache_shared:
+                await self._run_blocking(self._with_connection, self._cache_result, cache_key, watermark, result)
+            else:
+                self._cache_result(None, cache_key, watermark, result)
+        
+        return result
@@ -0,0 +1,310 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection can be checked out within the timeout.
+    """
+
+
+class _PooledConnection():
+    __slots__ = ("conn", "created_at", "last_used", "broken")
+
+    def __init__(self, conn: Any):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.broken = False
+
+
+class ConnectionPool():
+    """
+    Thread-safe pool of database connections that grows on demand.
+
+    Connections are opened when a checkout finds none idle, up to `max_size`,
+    and outside the pool's lock, so concurrent checkouts open theirs in
+    parallel instead of queueing behind one another. warm() opens the first
+    `min_size` connections up front, also in parallel.
+
+    A connection is only validated (with `validate`, e.g. a SELECT 1) when it
+    has sat idle for longer than `validate_after_idle_seconds`, e.g. across a
+    frozen Lambda container; a connection used moments ago is handed out
+    without a round trip. Connections older than `max_lifetime_seconds` are
+    closed and replaced when they are next checked out or returned.
+
+    Idle connections are reused most recently used first, so a burst's extra
+    connections are the ones that go idle and age out.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        min_size: int = 1,
+        max_size: int = 5,
+        validate: Optional[Callable[[Any], bool]] = None,
+        validate_after_idle_seconds: float = 30.0,
+        max_lifetime_seconds: float = 1800.0,
+        log: Optional[Callable[..., None]] = None
+    ):
+        if max_size < 1 or not 0 <= min_size <= max_size:
+            raise ValueError(f"Invalid pool sizes: min_size={min_size}, max_size={max_size}")
+
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.validate = validate
+        self.validate_after_idle_seconds = validate_after_idle_seconds
+        self.max_lifetime_seconds = max_lifetime_seconds
+        self.log = log or (lambda message, title="Info": None)
+
+        self._idle: "deque[_PooledConnection]" = deque()
+        self._in_use: Dict[int, _PooledConnection] = {}
+        # Open connections plus those being opened, which count against max_size
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+
+        self._stats = {
+            "checkouts": 0,
+            "created": 0,
+            "closed": 0,
+            "validations": 0,
+            "failed_validations": 0,
+            "expired": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def warm(self):
+        """
+        Open connections in parallel until the pool holds `min_size`. Failures
+        are logged, not raised; the connections are opened on demand instead.
+        """
+        with self._cond:
+            count = max(self.min_size - self._size, 0)
+            self._size += count
+
+        if count == 0:
+            return
+
+        def open_one(_):
+            try:
+                return self._open()
+            except Exception as e:
+                self.log(f"Failed to open pooled connection: {e}", title="Error")
+                return None
+
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            entries = list(executor.map(open_one, range(count)))
+
+        with self._cond:
+            for entry in entries:
+                if entry is None:
+                    self._size -= 1
+                else:
+                    self._idle.append(entry)
+            self._cond.notify_all()
+
+        self.log(f"Connection pool warmed with {sum(entry is not None for entry in entries)}/{count} connections")
+
+    def acquire(self, timeout: float = 30) -> Any:
+        """
+        Check out a connection, opening one if none is idle and the pool is
+        below max_size, and otherwise waiting for one to be released.
+
+        Args:
+            timeout: Maximum time to wait for a connection (seconds)
+
+        Returns:
+            A connection, to be handed back with release()
+
+        Raises:
+            PoolTimeout: If no connection is available within the timeout
+            Exception: Whatever `connect` raises if opening a connection fails
+        """
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    entry = None
+                    self._size += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"No database connection available after {timeout} seconds")
+                waited = True
+                self._cond.wait(remaining)
+
+            self._stats["checkouts"] += 1
+            if waited:
+                wait_seconds = time.monotonic() - started
+                self._stats["waits"] += 1
+                self._stats["wait_seconds_total"] += wait_seconds
+                self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], wait_seconds)
+
+        try:
+            if entry is not None:
+                entry = self._check(entry)
+            if entry is None:
+                entry = self._open()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._in_use[id(entry.conn)] = entry
+
+        return entry.conn
+
+    def invalidate(self, conn: Any):
+        """
+        Mark a checked-out connection as broken, so it is closed rather than
+        reused when it is released, whoever releases it.
+
+        Args:
+            conn: Connection from acquire()
+        """
+        with self._cond:
+            entry = self._in_use.get(id(conn))
+            if entry is not None:
+                entry.broken = True
+
+    def release(self, conn: Any, discard: bool = False):
+        """
+        Return a checked-out connection to the pool.
+
+        Args:
+            conn: Connection from acquire()
+            discard: Close the connection instead, e.g. after it failed
+        """
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+            if entry is None:
+                # Not checked out from this pool (or already released)
+                self._close(conn)
+                return
+
+            now = time.monotonic()
+            expired = now - entry.created_at > self.max_lifetime_seconds
+            if discard or entry.broken or expired or self._closed:
+                self._size -= 1
+                if expired:
+                    self._stats["expired"] += 1
+            else:
+                entry.last_used = now
+                self._idle.append(entry)
+                conn = None
+            self._cond.notify()
+
+        if conn is not None:
+            self._close(conn)
+
+    @contextmanager
+    def connection(self, timeout: float = 30) -> Iterator[Any]:
+        """
+        Check out a connection for the duration of a with block. If the block
+        raises, the connection's transaction is rolled back, and the connection
+        is discarded if that fails too.
+
+        Args:
+            timeout: Maximum time to wait for a connection (seconds)
+        """
+        conn = self.acquire(timeout)
+        discard = False
+        try:
+            yield conn
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def close(self):
+        """
+        Close idle connections and close checked-out ones as they are released.
+        """
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+
+        for entry in idle:
+            self._close(entry.conn)
+
+        self.log(f"Closed {len(idle)} idle pooled connections")
+
+    def metrics(self) -> Dict:
+        """
+        Pool size and usage counters, e.g. for logging after a request.
+        """
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "max_size": self.max_size,
+                **self._stats,
+            }
+
+    def _open(self) -> _PooledConnection:
+        conn = self.connect()
+        with self._cond:
+            self._stats["created"] += 1
+        return _PooledConnection(conn)
+
+    def _check(self, entry: _PooledConnection) -> Optional[_PooledConnection]:
+        """
+        Return the entry if its connection can be handed out, or close it and
+        return None if it has expired or fails validation after sitting idle.
+        """
+        now = time.monotonic()
+        if now - entry.created_at > self.max_lifetime_seconds:
+            with self._cond:
+                self._stats["expired"] += 1
+            self._close(entry.conn)
+            return None
+
+        if self.validate is not None and now - entry.last_used > self.validate_after_idle_seconds:
+            valid = self.validate(entry.conn)
+            with self._cond:
+                self._stats["validations"] += 1
+                if not valid:
+                    self._stats["failed_validations"] += 1
+            if not valid:
+                self.log("Pooled connection was stale, opening a new one")
+                self._close(entry.conn)
+                return None
+
+        return entry
+
+    def _close(self, conn: Any):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats["closed"] += 1
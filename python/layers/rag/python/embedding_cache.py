@@ -0,0 +1,175 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from vector_codec import decode_vector_binary, encode_vector
+
+# Trailing characters that don't change what a question asks
+_TRAILING_PUNCTUATION = "?!.,;: "
+
+
+class EmbeddingCache():
+    """
+    Two-tier cache of embeddings keyed by (model_id, input_type, dimension,
+    normalized text).
+
+    The first tier is an in-process LRU bounded by `max_entries`. The second is
+    the UNLOGGED embedding_cache table, which survives container recycling and is
+    shared by every Lambda using the database. Being unlogged it skips the WAL,
+    and losing it on a crash only costs re-embedding.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_days: int = 30):
+        self.max_entries = max_entries
+        self.ttl_days = ttl_days
+
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._table_ready = False
+
+        self._stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0}
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """
+        Normalize text so trivially different inputs share a cache entry: case,
+        runs of whitespace and trailing punctuation are ignored.
+        """
+        return " ".join(text.casefold().split()).rstrip(_TRAILING_PUNCTUATION)
+
+    @classmethod
+    def cache_key(cls, model_id: str, input_type: str, dimension: int, text: str) -> str:
+        """
+        Hex-encoded SHA-256 digest identifying an embedding.
+        """
+        parts = [model_id, input_type, str(dimension), cls.normalize_text(text)]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        """
+        Look up an embedding in the in-process tier, marking it recently used.
+        """
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+            return embedding
+
+    def put(self, key: str, embedding: List[float]):
+        """
+        Store an embedding in the in-process tier, evicting the least recently used
+        entries beyond max_entries.
+        """
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, outcome: str):
+        """
+        Count a lookup outcome ('memory_hits', 'persistent_hits' or 'misses').
+        """
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def stats(self) -> Dict:
+        """
+        Hit/miss counters since the container started, with the overall hit rate
+        and the number of entries held in memory.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+
+        lookups = stats["memory_hits"] + stats["persistent_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["persistent_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def ensure_table(self, conn):
+        """
+        Create the persistent tier if needed and expire entries older than ttl_days.
+        Runs once per container.
+
+        Args:
+            conn: An open database connection
+        """
+        if self._table_ready:
+            return
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                CREATE UNLOGGED TABLE IF NOT EXISTS embedding_cache (
+                    cache_key CHAR(64) PRIMARY KEY,
+                    embedding vector NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            cursor.execute(
+                "DELETE FROM embedding_cache WHERE created_at < CURRENT_TIMESTAMP - make_interval(days => %s);",
+                (self.ttl_days,)
+            )
+            conn.commit()
+        finally:
+            cursor.close()
+
+        self._table_ready = True
+
+    def get_persistent(self, conn, key: str) -> Optional[List[float]]:
+        """
+        Look up an embedding in the persistent tier.
+
+        Args:
+            conn: An open database connection
+            key: The cache key
+
+        Returns:
+            The embedding, or None if it isn't cached
+        """
+        self.ensure_table(conn)
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT vector_send(embedding) FROM embedding_cache WHERE cache_key = %s;",
+                (key,)
+            )
+            row = cursor.fetchone()
+            conn.commit()
+        finally:
+            cursor.close()
+
+        if row is None:
+            return None
+
+        embedding = decode_vector_binary(row[0])
+        return embedding.tolist() if hasattr(embedding, "tolist") else embedding
+
+    def put_persistent(self, conn, key: str, embedding: List[float]):
+        """
+        Store an embedding in the persistent tier.
+
+        Args:
+            conn: An open database connection
+            key: The cache key
+            embedding: The embedding to store
+        """
+        self.ensure_table(conn)
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """
+                INSERT INTO embedding_cache (cache_key, embedding)
+                VALUES (%s, %s::vector)
+                ON CONFLICT (cache_key) DO NOTHING;
+                """,
+                (key, encode_vector(embedding))
+            )
+            conn.commit()
+        finally:
+            cursor.close()
@@ -0,0 +1,192 @@
+import pg8000
+from typing import Dict
+from rag_trainer import RAGTrainer
+from vector_codec import encode_vector
+from vector_index import VectorIndexManager
+
+class EmbeddingMigrator(RAGTrainer):
+    """
+    Re-embeds the stored training data at the configured embedding_dimension and
+    swaps the new vectors in.
+    
+    New embeddings are written to a staging column in committed chunks, so an
+    interrupted migration resumes where it stopped. The swap (replacing the
+    embedding column, re-adding the quantized storage column and rebuilding the
+    vector indexes) runs in a single transaction, so readers see either the old
+    or the new embeddings, never a mix.
+    """
+    
+    # Column the new embeddings are written to until the swap
+    staging_column = "embedding_migration"
+    
+    def migrate(self) -> Dict:
+        """
+        Migrate training_embeddings to self.embedding_dimension.
+        
+        Returns:
+            Report dict with 'from_dimension', 'to_dimension', 'reembedded' and
+            'failed' counts, and 'swapped' (whether the new embeddings are live).
+            'index' maps each training data type to the action taken on its
+            vector index when the swap happened.
+            
+        Raises:
+            ValueError: If connection is not established or training_embeddings does not exist
+            pg8000.Error: If database operations fail
+        """
+        if not self.connection:
+            raise ValueError("Database connection not established. Call connect_to_postgres() first.")
+        
+        try:
+            with self.connection.cursor() as cursor:
+                current_dimension = self.get_stored_embedding_dimension(cursor)
+                if current_dimension is None:
+                    raise ValueError("training_embeddings does not exist, nothing to migrate")
+                
+                report = {
+                    "from_dimension": current_dimension,
+                    "to_dimension": self.embedding_dimension,
+                    "reembedded": 0,
+                    "failed": 0,
+                    "swapped": False
+                }
+                
+                # Step 1: Create the staging column, discarding one left by a migration to another dimension
+                staged_dimension = self.get_stored_embedding_dimension(cursor, self.staging_column)
+                
+                if current_dimension == self.embedding_dimension and staged_dimension is None:
+                    self.log(f"Embeddings are already {self.embedding_dimension}-dimensional, nothing to migrate")
+                    self.connection.commit()
+                    return report
+                
+                if staged_dimension is not None and staged_dimension != self.embedding_dimension:
+                    self.log(f"Discarding staged {staged_dimension}-dimensional embeddings")
+                    cursor.execute(f"ALTER TABLE training_embeddings DROP COLUMN {self.staging_column};")
+                
+                cursor.execute(
+                    f"ALTER TABLE training_embeddings ADD COLUMN IF NOT EXISTS "
+                    f"{self.staging_column} vector({self.embedding_dimension});"
+                )
+                self.connection.commit()
+                
+                self.log(
+                    f"Migrating embeddings from {current_dimension} to "
+                    f"{self.embedding_dimension} dimensions"
+                )
+                
+                # Step 2: Re-embed every row that doesn't have a staged embedding yet
+                report["reembedded"], report["failed"] = self._reembed_pending(cursor)
+                
+                if report["failed"]:
+                    self.log(
+                        f"{report['failed']} training examples could not be re-embedded; "
+                        "run the migration again to retry before the swap",
+                        title="Error"
+                    )
+                    return report
+                
+                # Step 3: Swap the new embeddings in
+                report["index"] = self._swap_embedding_column(cursor)
+                self.connection.commit()
+                report["swapped"] = True
+                
+                self.log(
+                    f"Migration complete: {report['reembedded']} training examples re-embedded "
+                    f"at {self.embedding_dimension} dimensions"
+                )
+                return report
+        
+        except pg8000.Error as e:
+            self.log(f"Database error during embedding migration: {e}", title="Error")
+            if self.connection:
+                self.connection.rollback()
+            raise e
+        except Exception as e:
+            self.log(f"Unexpected error during embedding migration: {e}", title="Error")
+            if self.connection:
+                self.connection.rollback()
+            raise e
+    
+    def _reembed_pending(self, cursor) -> tuple[int, int]:
+        """
+        Embed the rows that have no staged embedding, committing each chunk.
+        
+        Args:
+            cursor: An open cursor on the training connection
+            
+        Returns:
+            Tuple of (rows re-embedded, rows that failed to embed)
+        """
+        cursor.execute(f"""
+            SELECT id, content
+            FROM training_embeddings
+            WHERE {self.staging_column} IS NULL
+            ORDER BY created_at;
+        """)
+        pending = cursor.fetchall()
+        self.connection.commit()
+        
+        reembedded = 0
+        failed = 0
+        for start in range(0, len(pending), self.insert_chunk_size):
+            chunk = pending[start:start + self.insert_chunk_size]
+            embeddings = self.generate_embeddings([content for _, content in chunk])
+            
+            updates = []
+            for (row_id, _), embedding in zip(chunk, embeddings):
+                if not embedding:
+                    failed += 1
+                    continue
+                updates.extend((str(row_id), encode_vector(embedding)))
+            
+            if updates:
+                cursor.execute(
+                    f"UPDATE training_embeddings AS t SET {self.staging_column} = v.embedding FROM (VALUES "
+                    + ", ".join(["(%s::uuid, %s::vector)"] * (len(updates) // 2))
+                    + ") AS v(id, embedding) WHERE t.id = v.id",
+                    updates
+                )
+                self.connection.commit()
+                reembedded += len(updates) // 2
+            
+            self.log(f"Re-embedded {reembedded}/{len(pending)} training examples")
+        
+        return reembedded, failed
+    
+    def _swap_embedding_column(self, cursor) -> Dict[str, str]:
+        """
+        Replace the embedding column with the staging column and rebuild what
+        depends on it. Does not commit.
+        
+        Args:
+            cursor: An open cursor on the training connection
+            
+        Returns:
+            Dict mapping each training data type to the action taken on its vector index
+            
+        Raises:
+            ValueError: If rows were added since the re-embedding pass
+        """
+        cursor.execute("LOCK TABLE training_embeddings IN ACCESS EXCLUSIVE MODE;")
+        
+        cursor.execute(f"SELECT COUNT(*) FROM training_embeddings WHERE {self.staging_column} IS NULL;")
+        missing = cursor.fetchone()[0]
+        if missing:
+            raise ValueError(
+                f"{missing} training examples were added during the migration; "
+                "run it again to re-embed them"
+            )
+        
+        # CASCADE also drops the generated quantized column and the vector indexes
+        cursor.execute("ALTER TABLE training_embeddings DROP COLUMN embedding CASCADE;")
+        cursor.execute(f"ALTER TABLE training_embeddings RENAME COLUMN {self.staging_column} TO embedding;")
+        self._migrate_storage_mode(cursor)
+        
+        # Cached SQL answers are looked up by embeddings of the old dimension
+        cursor.execute("DROP TABLE IF EXISTS sql_answer_cache;")
+        
+        index_manager = VectorIndexManager(self.connection, self.config, self.log)
+        index_manager.ensure_state_table(cursor)
+        cursor.execute("DELETE FROM vector_index_state;")
+        
+        index_results = index_manager.ensure_indexes()
+        return {datum_type: result["action"] for datum_type, result in index_results.items()}
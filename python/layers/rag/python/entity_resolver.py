@@ -0,0 +1,305 @@
+import difflib
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Words that never identify an entity on their own
+_STOPWORDS = frozenset("""
+    a about after all am an and any are as at be been before between by can
+    compare day days did do does during each ever for from had has have how i
+    in is it last least listen listened listening me month months more most
+    much music my of on or over past play played plays song songs streamed
+    than that the their this times to top track tracks was week weeks were
+    what when which who with year years you your album albums artist artists
+    many show list give tell since until favorite favourite time first
+""".split())
+
+# Everyday words that are also common one-word titles ("Yesterday", "Hours",
+# "Weekend"). A one-word name that is one of these only matches when the
+# question marks it as a name (see _has_name_cue)
+_COMMON_WORDS = frozenset("""
+    again alive alone always angel away baby back bad beautiful best better big
+    birthday blue body boy breathe broken call change chill christmas city clean
+    closer cold come crazy dance dancing dark daylight days dead dream dreams
+    drive drunk easy electric else end enough escape everything everyday evening
+    faded fake falling famous fire forever free friday friends fun gold golden
+    gone good goodbye got great green happy heart heaven hello help here high
+    holiday home honest hope hot hours house human hurt intro jealous just kids
+    king last late lately later life light like little lonely long lose lost loud
+    love lovely lucky mad magic man mine money monday moon morning mood more
+    never new next nice night nobody nothing now numb ocean old once one only
+    outro paradise party peace perfect play playlist please power pray pretty
+    queen rain ready real red remember rich ride right rise road run sad saturday
+    say sea shine sky slow smile snow someone something sometimes soon sorry
+    stay stop story summer sunday sunshine sweet talk tears thunder together
+    tomorrow tonight today true trouble tuesday up wait wake walk want water
+    weekend welcome white wild winter wish woman wonderful work world yeah yes
+    yesterday young youth
+""".split())
+
+# Words before a name that mark it as one ("by Drake", "the song called Yesterday")
+_NAME_CUE_WORDS = r"(?:by|from|called|named|titled)"
+
+# Longest entity name matched, in words
+_MAX_NAME_WORDS = 8
+
+# Tokens shared by more names than this are too common to find candidates with
+_MAX_POSTINGS = 500
+
+_NON_ALPHANUMERIC = re.compile(r"[^\w]+")
+
+# One dictionary row per (type, id): the name, the artist for albums and tracks, and all-time plays
+_LOAD_SQL = """
+    SELECT 'artist', artist_id, MAX(artist_name), NULL, SUM(yearly_play_count)
+    FROM yearly_artist_aggregates GROUP BY artist_id
+    UNION ALL
+    SELECT 'album', album_id, MAX(album_name), MAX(artist_name), SUM(yearly_play_count)
+    FROM yearly_album_aggregates GROUP BY album_id
+    UNION ALL
+    SELECT 'track', track_id, MAX(track_name), MAX(artist_name), SUM(yearly_play_count)
+    FROM yearly_track_aggregates GROUP BY track_id;
+"""
+
+
+def _trigrams(word: str) -> set:
+    """
+    Character trigrams of a word, padded so its start and end count.
+    """
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _has_name_cue(question: str, word: str) -> bool:
+    """
+    Whether the original question marks a one-word name as a name rather than
+    an everyday word: quoted, capitalized other than at the start, or after
+    "by", "from", "called" and the like.
+    """
+    pattern = re.compile(rf"\b{re.escape(word)}\b", re.IGNORECASE)
+    for match in pattern.finditer(question):
+        before = question[:match.start()].rstrip()
+        if before[-1:] in ("\"", "'", "\u201c", "\u2018"):
+            return True
+        if match.group(0)[0].isupper() and before and before[-1] not in ".!?":
+            return True
+        if re.search(rf"\b{_NAME_CUE_WORDS}(?: the)?$", before, re.IGNORECASE):
+            return True
+    return False
+
+
+def normalize_name(text: str) -> str:
+    """
+    Casefold, strip accents and replace punctuation with spaces, so "Beyoncé"
+    and "beyonce", or "AC/DC" and "ac dc", compare equal.
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(_NON_ALPHANUMERIC.sub(" ", text.casefold()).replace("_", " ").split())
+
+
+class EntityResolver():
+    """
+    In-memory dictionary of the artists, albums and tracks in the listening
+    history, used to find the entities a question mentions and hand their IDs
+    to the prompt, so the generated SQL filters on the indexed ID columns
+    instead of ILIKE on names.
+
+    The dictionary is loaded from the yearly aggregate tables, which have one
+    row per entity per year. It is reloaded when the aggregation watermark
+    changes, or after `refresh_seconds` when the watermark is unknown.
+
+    Matching is fuzzy: names sharing a word, or a close spelling of one found
+    through a trigram index, with the question are scored against the
+    question's word n-grams with difflib, and kept above `threshold`.
+    """
+
+    def __init__(self, refresh_seconds: float = 900.0, threshold: float = 0.88, log: Callable = print):
+        self.refresh_seconds = refresh_seconds
+        self.threshold = threshold
+        self.log = log
+
+        # (entries, postings, trigram_postings) snapshot, replaced as a whole
+        self._snapshot: Optional[Tuple] = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._snapshot is not None
+
+    def is_stale(self, version: Optional[str] = None) -> bool:
+        """
+        Whether the dictionary is missing, was loaded at another aggregation
+        watermark or, when the watermark is unknown, is older than refresh_seconds.
+        """
+        if self._snapshot is None:
+            return True
+        if version is not None:
+            return version != self._version
+        return time.monotonic() - self._loaded_at >= self.refresh_seconds
+
+    def refresh(self, conn, version: Optional[str] = None, force: bool = False) -> bool:
+        """
+        Reload the dictionary if it is stale.
+
+        Args:
+            conn: An open database connection
+            version: The current aggregation watermark, if known
+            force: Reload regardless
+
+        Returns:
+            True if the dictionary was reloaded
+        """
+        with self._lock:
+            if not force and not self.is_stale(version):
+                return False
+
+            cursor = conn.cursor()
+            try:
+                cursor.execute(_LOAD_SQL)
+                rows = cursor.fetchall()
+                conn.commit()
+            finally:
+                cursor.close()
+
+            self._snapshot = self._build(rows)
+            self._version = version
+            self._loaded_at = time.monotonic()
+
+        self.log(f"Loaded {len(rows)} artists, albums and tracks into the entity dictionary")
+        return True
+
+    @staticmethod
+    def _build(rows: List[Tuple]) -> Tuple:
+        """
+        Index dictionary rows by name word, and name words by trigram.
+        """
+        entries = []
+        postings = defaultdict(list)
+        trigram_postings = defaultdict(set)
+
+        for entity_type, entity_id, name, artist_name, plays in rows:
+            normalized = normalize_name(name or "")
+            if not normalized:
+                continue
+
+            index = len(entries)
+            entries.append({
+                "type": entity_type,
+                "id": entity_id,
+                "name": name,
+                "artist_name": artist_name,
+                "plays": int(plays or 0),
+                "normalized": normalized,
+                "words": len(normalized.split()),
+            })
+            for word in set(normalized.split()):
+                if word not in postings:
+                    for trigram in _trigrams(word):
+                        trigram_postings[trigram].add(word)
+                postings[word].append(index)
+
+        return entries, dict(postings), dict(trigram_postings)
+
+    @staticmethod
+    def _close_spellings(word: str, trigram_postings: Dict[str, set]) -> List[str]:
+        """
+        Dictionary words spelled like `word`: sharing at least two trigrams and
+        with a difflib ratio of 0.8 or more.
+        """
+        shared = Counter()
+        for trigram in _trigrams(word):
+            shared.update(trigram_postings.get(trigram, ()))
+
+        return [
+            known
+            for known, count in shared.items()
+            if count >= 2
+            and abs(len(known) - len(word)) <= 2
+            and difflib.SequenceMatcher(None, word, known).ratio() >= 0.8
+        ]
+
+    def resolve(self, question: str, max_entities: int = 5) -> List[Dict]:
+        """
+        Find the artists, albums and tracks a question mentions.
+
+        Args:
+            question: The user's question
+            max_entities: Most entities returned
+
+        Returns:
+            List of dicts with 'type' ('artist', 'album' or 'track'), 'id',
+            'name', 'artist_name', 'matched' (the words of the question that
+            matched) and 'score' keys, best match first
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return []
+        entries, postings, trigram_postings = snapshot
+
+        words = normalize_name(question).split()
+        if not words:
+            return []
+
+        # Names sharing a word, or a close spelling of one, with the question
+        candidates = set()
+        for word in set(words):
+            if word in _STOPWORDS:
+                continue
+            spellings = {word} if word in postings else set()
+            if len(word) >= 4 and not word.isdigit():
+                spellings.update(self._close_spellings(word, trigram_postings))
+
+            for spelling in spellings:
+                if len(postings.get(spelling, ())) <= _MAX_POSTINGS:
+                    candidates.update(postings[spelling])
+
+        # Score each candidate against the question's n-grams of about its length
+        matches = []
+        for index in candidates:
+            entry = entries[index]
+            best_score, best_span = 0.0, ""
+            for size in range(max(1, entry["words"] - 1), min(entry["words"] + 1, _MAX_NAME_WORDS) + 1):
+                for start in range(0, len(words) - size + 1):
+                    span_words = words[start:start + size]
+                    if all(word in _STOPWORDS for word in span_words):
+                        continue
+                    span = " ".join(span_words)
+                    if span == entry["normalized"]:
+                        score = 1.0
+                    elif len(entry["normalized"]) < 4:
+                        # Short names like "U2" only match exactly
+                        continue
+                    else:
+                        score = difflib.SequenceMatcher(None, span, entry["normalized"]).ratio()
+                    if score > best_score:
+                        best_score, best_span = score, span
+
+            # One everyday word is only a name if the question says so
+            if (
+                entry["words"] == 1
+                and entry["normalized"] in _COMMON_WORDS
+                and not _has_name_cue(question, best_span)
+            ):
+                continue
+
+            if best_score >= self.threshold:
+                matches.append((best_score, entry["plays"], entry, best_span))
+
+        matches.sort(key=lambda match: (match[0], len(match[3]), match[1]), reverse=True)
+
+        return [
+            {
+                "type": entry["type"],
+                "id": entry["id"],
+                "name": entry["name"],
+                "artist_name": entry["artist_name"],
+                "matched": span,
+                "score": round(score, 3),
+            }
+            for score, _, entry, span in matches[:max_entities]
+        ]
@@ -0,0 +1,468 @@
+import calendar
+import re
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+
+try:
+    import sqlglot
+    from sqlglot import exp
+except ImportError:  # sqlglot is optional; generated SQL then runs as written
+    sqlglot = None
+    exp = None
+
+# Columns each daily aggregate table shares with its monthly and yearly counterparts
+AGGREGATE_COLUMNS = {
+    "track": ["track_id", "artist_id", "album_id", "track_name", "artist_name", "album_name", "album_cover_url"],
+    "artist": ["artist_id", "genre", "artist_name", "artist_image_url"],
+    "album": ["album_id", "artist_id", "album_name", "artist_name", "album_cover_url"],
+}
+
+_DAILY_TABLE_PATTERN = re.compile(r"daily_(track|artist|album)_aggregates")
+_ISO_DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+_INTERVAL_PATTERN = re.compile(r"(\d+)\s*(day|week|month|year)s?")
+
+# Comparison as seen with the date column on the right-hand side
+_FLIPPED = {"GTE": "LTE", "GT": "LT", "LTE": "GTE", "LT": "GT", "EQ": "EQ"}
+
+# A date range, start inclusive and end exclusive; None is unbounded
+DateRange = Tuple[Optional[date], Optional[date]]
+
+
+def _shift_months(day: date, months: int) -> date:
+    """
+    Move a date by a number of months, clamping the day to the target month's length.
+    """
+    month_index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(month_index, 12)
+    return date(year, month + 1, min(day.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def _next_month_start(day: date) -> date:
+    """
+    The first day of the month after `day`, or `day` itself if it starts a month.
+    """
+    return day if day.day == 1 else _shift_months(day.replace(day=1), 1)
+
+
+def _next_year_start(day: date) -> date:
+    """
+    The first day of the year after `day`, or `day` itself if it starts a year.
+    """
+    return day if (day.month, day.day) == (1, 1) else date(day.year + 1, 1, 1)
+
+
+class GranularityRouter():
+    """
+    Rewrites SQL that scans a daily_*_aggregates table over whole months or
+    years to read the monthly_*/yearly_* tables for those periods instead.
+
+    The aggregator updates the daily, monthly and yearly tables in the same
+    transaction with UTC dates, so a monthly row holds the sum of the month's
+    daily rows, including for the current month. A query qualifies when:
+
+    - it reads one daily table, with no joins, subqueries, SELECT * or windows
+    - its date filter is a conjunction of bounds on the date column, with
+      literal dates or CURRENT_DATE arithmetic, or EXTRACT(YEAR/MONTH FROM date)
+    - the date column appears nowhere else
+    - it aggregates (GROUP BY, DISTINCT or aggregate functions), and its only
+      aggregates are SUM(daily_play_count), COUNT(DISTINCT ...) and MIN/MAX of
+      other columns, so the result doesn't depend on how many rows a period is
+      stored in
+
+    The daily table is then replaced by a UNION ALL of yearly rows for the
+    whole years in the range, monthly rows for the remaining whole months and
+    daily rows for the edges, under the daily table's name and column names.
+    """
+
+    def __init__(self, log=print):
+        self.log = log
+
+    @staticmethod
+    def available() -> bool:
+        """
+        Whether sqlglot is installed and SQL can be rewritten.
+        """
+        return sqlglot is not None
+
+    def rewrite(self, sql: str, today: Optional[date] = None) -> Optional[str]:
+        """
+        Rewrite SQL to read the coarsest aggregate tables that answer it.
+
+        Args:
+            sql: The generated SQL
+            today: The date CURRENT_DATE resolves to (default: today, UTC on Lambda)
+
+        Returns:
+            The rewritten SQL, or None if the query doesn't qualify or only daily
+            rows would be read anyway
+        """
+        if sqlglot is None:
+            return None
+
+        today = today or date.today()
+
+        try:
+            tree = sqlglot.parse_one(sql, read="postgres")
+        except sqlglot.errors.ParseError:
+            return None
+
+        table = self._single_daily_table(tree)
+        if table is None:
+            return None
+        entity = _DAILY_TABLE_PATTERN.fullmatch(table.name).group(1)
+
+        # Row-level results would come back one row per month or year instead of per day
+        if not (tree.args.get("group") or tree.args.get("distinct") or any(
+            select.find(exp.AggFunc) for select in tree.expressions
+        )):
+            return None
+        if not self._aggregates_are_additive(tree):
+            return None
+
+        where = tree.args.get("where")
+        if where is None:
+            conjuncts = []
+        elif isinstance(where.this, exp.And):
+            conjuncts = list(where.this.flatten())
+        else:
+            conjuncts = [where.this]
+        date_range, remaining = self._extract_date_range(conjuncts, today)
+        if date_range is None:
+            return None
+
+        # The date column may only be used by the range being replaced
+        for conjunct in remaining:
+            if any(column.name == "date" for column in conjunct.find_all(exp.Column)):
+                return None
+        for column in tree.find_all(exp.Column):
+            if column.name == "date" and not self._is_within(column, where):
+                return None
+
+        parts = self.split_range(*date_range, today=today)
+        if all(granularity == "daily" for granularity, _ in parts):
+            return None
+
+        source = self._union_sql(entity, parts)
+        alias = table.alias or table.name
+        table.replace(exp.paren(sqlglot.parse_one(source, read="postgres"), copy=False).as_(alias))
+
+        if remaining:
+            tree.set("where", exp.Where(this=exp.and_(*remaining)))
+        else:
+            tree.set("where", None)
+
+        rewritten = tree.sql(dialect="postgres")
+        self.log(f"Rewrote {table.name} scan as {', '.join(granularity for granularity, _ in parts)} reads")
+        return rewritten
+
+    @staticmethod
+    def split_range(start: Optional[date], end: Optional[date], today: date) -> List[Tuple[str, DateRange]]:
+        """
+        Split a date range into whole years, whole months and leftover days.
+
+        There is no data after today, so a range ending after today (or not at
+        all) covers the current month and year in full.
+
+        Args:
+            start: First date in the range, or None for all history
+            end: Day after the last date in the range, or None for no end
+            today: The current date
+
+        Returns:
+            List of (granularity, (start, end)) pairs with granularity 'yearly',
+            'monthly' or 'daily', covering the range without overlap
+        """
+        if end is not None and end > today:
+            end = None
+
+        # Whole years, ignoring years that haven't started
+        first_year = None if start is None else _next_year_start(start)
+        end_year = None if end is None else date(end.year, 1, 1)
+
+        if first_year is not None and first_year.year > today.year:
+            return GranularityRouter._split_months(start, end, today)
+        if first_year is not None and end_year is not None and first_year >= end_year:
+            return GranularityRouter._split_months(start, end, today)
+
+        parts = []
+        if start is not None and start < first_year:
+            parts.extend(GranularityRouter._split_months(start, first_year, today))
+        parts.append(("yearly", (first_year, end_year)))
+        if end is not None and end_year < end:
+            parts.extend(GranularityRouter._split_months(end_year, end, today))
+        return parts
+
+    @staticmethod
+    def _split_months(start: Optional[date], end: Optional[date], today: date) -> List[Tuple[str, DateRange]]:
+        """
+        Split a range with no whole years into whole months and leftover days,
+        ignoring months that haven't started.
+        """
+        first_month = None if start is None else _next_month_start(start)
+        end_month = None if end is None else end.replace(day=1)
+
+        if first_month is not None and first_month > today:
+            return [("daily", (start, end))]
+        if first_month is not None and end_month is not None and first_month >= end_month:
+            return [("daily", (start, end))]
+
+        parts = []
+        if start is not None and start < first_month:
+            parts.append(("daily", (start, first_month)))
+        parts.append(("monthly", (first_month, end_month)))
+        if end is not None and end_month < end:
+            parts.append(("daily", (end_month, end)))
+        return parts
+
+    @staticmethod
+    def _union_sql(entity: str, parts: List[Tuple[str, DateRange]]) -> str:
+        """
+        SQL reading each part of a range from its table, shaped like the daily table.
+        """
+        columns = ", ".join(AGGREGATE_COLUMNS[entity])
+        branches = []
+        for granularity, (start, end) in parts:
+            if granularity == "yearly":
+                count = "yearly_play_count"
+                bounds = [
+                    start is not None and f"year >= {start.year}",
+                    end is not None and f"year < {end.year}",
+                ]
+            elif granularity == "monthly":
+                count = "monthly_play_count"
+                bounds = [
+                    start is not None and f"year_month >= '{start:%Y-%m}'",
+                    end is not None and f"year_month < '{end:%Y-%m}'",
+                ]
+            else:
+                count = "daily_play_count"
+                bounds = [
+                    start is not None and f"date >= '{start.isoformat()}'",
+                    end is not None and f"date < '{end.isoformat()}'",
+                ]
+
+            if count != "daily_play_count":
+                count = f"{count} AS daily_play_count"
+            branch = f"SELECT {columns}, {count} FROM {granularity}_{entity}_aggregates"
+            bounds = [bound for bound in bounds if bound]
+            if bounds:
+                branch += " WHERE " + " AND ".join(bounds)
+            branches.append(branch)
+
+        return " UNION ALL ".join(branches)
+
+    @staticmethod
+    def _single_daily_table(tree) -> Optional["exp.Table"]:
+        """
+        The daily aggregate table a plain single-table SELECT reads, if that's what the query is.
+        """
+        if not isinstance(tree, exp.Select):
+            return None
+        if any(tree.find_all(exp.Join, exp.Subquery, exp.With, exp.Union, exp.Window, exp.Star)):
+            return None
+
+        tables = list(tree.find_all(exp.Table))
+        if len(tables) != 1 or tables[0].args.get("db"):
+            return None
+        if not _DAILY_TABLE_PATTERN.fullmatch(tables[0].name):
+            return None
+        return tables[0]
+
+    @staticmethod
+    def _aggregates_are_additive(tree) -> bool:
+        """
+        Whether every aggregate is SUM(daily_play_count), COUNT(DISTINCT ...) or
+        MIN/MAX of a column other than the play count, and play counts appear
+        nowhere else. Functions sqlglot doesn't know (e.g. JSONB_AGG) and
+        ordered-set aggregates are rejected, since they may be aggregates too.
+        """
+        if any(tree.find_all(exp.Anonymous, exp.WithinGroup)):
+            return False
+
+        for function in tree.find_all(exp.AggFunc):
+            if isinstance(function, exp.Sum):
+                argument = function.this
+                while isinstance(argument, exp.Paren):
+                    argument = argument.this
+                if not (isinstance(argument, exp.Column) and argument.name == "daily_play_count"):
+                    return False
+            elif isinstance(function, exp.Count):
+                if not isinstance(function.this, exp.Distinct):
+                    return False
+            elif not isinstance(function, (exp.Min, exp.Max)):
+                return False
+
+        # Play counts outside SUM: MIN/MAX(daily_play_count), filters on it and the like
+        for column in tree.find_all(exp.Column):
+            if column.name != "daily_play_count":
+                continue
+            parent = column.parent
+            while isinstance(parent, exp.Paren):
+                parent = parent.parent
+            if not isinstance(parent, exp.Sum):
+                return False
+
+        return True
+
+    @staticmethod
+    def _is_within(node, ancestor) -> bool:
+        while node is not None:
+            if node is ancestor:
+                return True
+            node = node.parent
+        return False
+
+    def _extract_date_range(self, conjuncts: List, today: date) -> Tuple[Optional[DateRange], List]:
+        """
+        Intersect the bounds the WHERE conjuncts put on the date column.
+
+        Returns:
+            Tuple of ((start, end) range or None if the date filter can't be
+            understood, conjuncts that don't filter on date). A query without a
+            date filter has the range (None, None).
+        """
+        start, end = None, None
+        extracted_year, extracted_month = None, None
+        remaining = []
+
+        def narrow(lower: Optional[date], upper: Optional[date]):
+            nonlocal start, end
+            if lower is not None:
+                start = lower if start is None else max(start, lower)
+            if upper is not None:
+                end = upper if end is None else min(end, upper)
+
+        for conjunct in conjuncts:
+            if isinstance(conjunct, exp.Between) and self._is_date_column(conjunct.this):
+                low = self._evaluate_date(conjunct.args["low"], today)
+                high = self._evaluate_date(conjunct.args["high"], today)
+                if low is None or high is None:
+                    return None, conjuncts
+                narrow(low, high + timedelta(days=1))
+                continue
+
+            operator = type(conjunct).__name__
+            if operator not in _FLIPPED:
+                remaining.append(conjunct)
+                continue
+
+            left, right = conjunct.this, conjunct.expression
+            if self._is_date_column(right):
+                left, right, operator = right, left, _FLIPPED[operator]
+
+            if self._is_date_column(left):
+                bound = self._evaluate_date(right, today)
+                if bound is None:
+                    return None, conjuncts
+                if operator == "GTE":
+                    narrow(bound, None)
+                elif operator == "GT":
+                    narrow(bound + timedelta(days=1), None)
+                elif operator == "LT":
+                    narrow(None, bound)
+                elif operator == "LTE":
+                    narrow(None, bound + timedelta(days=1))
+                else:
+                    narrow(bound, bound + timedelta(days=1))
+                continue
+
+            if operator == "EQ" and isinstance(left, exp.Extract) and self._is_date_column(left.expression):
+                unit = left.this.name.upper()
+                if not isinstance(right, exp.Literal) or right.is_string or unit not in ("YEAR", "MONTH"):
+                    return None, conjuncts
+                if unit == "YEAR":
+                    extracted_year = int(right.this)
+                else:
+                    extracted_month = int(right.this)
+                continue
+
+            remaining.append(conjunct)
+
+        if extracted_month is not None:
+            if extracted_year is None or not 1 <= extracted_month <= 12:
+                return None, conjuncts
+            month_start = date(extracted_year, extracted_month, 1)
+            narrow(month_start, _shift_months(month_start, 1))
+        elif extracted_year is not None:
+            narrow(date(extracted_year, 1, 1), date(extracted_year + 1, 1, 1))
+
+        if start is not None and end is not None and start >= end:
+            return None, conjuncts
+
+        return (start, end), remaining
+
+    @staticmethod
+    def _is_date_column(node) -> bool:
+        return isinstance(node, exp.Column) and node.name == "date"
+
+    def _evaluate_date(self, node, today: date) -> Optional[date]:
+        """
+        Evaluate a date literal or CURRENT_DATE expression, or return None.
+        """
+        if isinstance(node, exp.Paren):
+            return self._evaluate_date(node.this, today)
+
+        if isinstance(node, exp.Cast):
+            if not node.to.is_type("date", "timestamp"):
+                return None
+            return self._evaluate_date(node.this, today)
+
+        if isinstance(node, exp.Literal) and node.is_string:
+            if not _ISO_DATE_PATTERN.fullmatch(node.this):
+                return None
+            try:
+                return date.fromisoformat(node.this)
+            except ValueError:
+                return None
+
+        if isinstance(node, exp.CurrentDate):
+            return today
+
+        if isinstance(node, (exp.TimestampTrunc, exp.DateTrunc)):
+            day = self._evaluate_date(node.this, today)
+            unit = node.args.get("unit")
+            unit = unit.name.upper() if unit is not None else ""
+            if day is None:
+                return None
+            if unit == "YEAR":
+                return date(day.year, 1, 1)
+            if unit == "MONTH":
+                return day.replace(day=1)
+            return None
+
+        if isinstance(node, (exp.Add, exp.Sub)):
+            day = self._evaluate_date(node.this, today)
+            amount = self._evaluate_interval(node.expression)
+            if day is None or amount is None:
+                return None
+            count, unit = amount
+            if isinstance(node, exp.Sub):
+                count = -count
+            if unit == "day":
+                return day + timedelta(days=count)
+            if unit == "week":
+                return day + timedelta(weeks=count)
+            return _shift_months(day, count * (12 if unit == "year" else 1))
+
+        return None
+
+    @staticmethod
+    def _evaluate_interval(node) -> Optional[Tuple[int, str]]:
+        """
+        Evaluate an INTERVAL (or a bare integer number of days) as (count, unit).
+        """
+        if isinstance(node, exp.Literal) and not node.is_string:
+            return int(node.this), "day"
+
+        if not isinstance(node, exp.Interval):
+            return None
+
+        text = node.this.name if node.this is not None else ""
+        unit = node.args.get("unit")
+        if unit is not None:
+            text = f"{text} {unit.name}"
+
+        match = _INTERVAL_PATTERN.fullmatch(text.strip().lower())
+        if match is None:
+            return None
+        return int(match.group(1)), match.group(2)
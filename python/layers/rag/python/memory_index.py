@@ -0,0 +1,249 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from vector_codec import decode_vector_binary
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; callers fall back to pgvector
+    np = None
+
+
+class MemoryVectorIndex():
+    """
+    In-process snapshot of training_embeddings for exact nearest neighbor search.
+
+    The corpus is small enough to hold in memory, so the whole table is loaded,
+    in pgvector's binary format, into one contiguous float32 matrix with
+    unit-length rows, sorted by type so each type is a contiguous slice. A query is then a single matrix-vector
+    product followed by an argpartition per type, with no database round trip.
+
+    The snapshot is tagged with the table's (row count, max(created_at)) version,
+    plus the embedding column's attribute number and type modifier, which an
+    embedding migration's column swap changes. The version is re-checked at most
+    every `refresh_seconds`, and the snapshot is reloaded when the trainer has
+    added or removed rows or the embeddings were migrated.
+    """
+
+    def __init__(self, refresh_seconds: float = 60.0, log: Callable = print):
+        self.refresh_seconds = refresh_seconds
+        self.log = log
+
+        # (matrix, rows, slices) snapshot, replaced as a whole so searches
+        # never see a matrix from one load with rows from another
+        self._snapshot: Optional[Tuple] = None
+        self._version = None
+        self._checked_at = 0.0
+        # (version, query dimension) the snapshot was last force-reloaded for
+        self._dimension_reload = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available() -> bool:
+        """
+        Whether numpy is installed and the in-memory engine can be used.
+        """
+        return np is not None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._snapshot is not None
+
+    @property
+    def dimension(self) -> Optional[int]:
+        """
+        Dimension of the loaded embeddings, or None if none are loaded.
+        """
+        snapshot = self._snapshot
+        if snapshot is None or snapshot[0].shape[0] == 0:
+            return None
+        return snapshot[0].shape[1]
+
+    def needs_dimension_reload(self, dimension: int) -> bool:
+        """
+        Whether query embeddings of `dimension` dimensions don't match the
+        snapshot, e.g. one loaded before an embedding migration, and it hasn't
+        already been force-reloaded for that.
+        """
+        loaded = self.dimension
+        return loaded is not None and loaded != dimension and self._dimension_reload != (self._version, dimension)
+
+    def reload_for_dimension(self, conn, dimension: int) -> bool:
+        """
+        Force-reload a snapshot whose dimension doesn't match query embeddings
+        of `dimension` dimensions. Done once per snapshot version, so queries
+        that can't match the stored embeddings don't reload the table every time.
+
+        Args:
+            conn: An open database connection
+            dimension: The query embedding's dimension
+
+        Returns:
+            True if the snapshot was reloaded
+        """
+        if not self.needs_dimension_reload(dimension):
+            return False
+        self._dimension_reload = (self._version, dimension)
+        self.log(f"In-memory vector index has {self.dimension}-dimensional embeddings, reloading")
+        return self.refresh(conn, force=True)
+
+    def is_stale(self) -> bool:
+        """
+        Whether the snapshot is missing or due for a version check.
+        """
+        return not self.is_loaded or time.monotonic() - self._checked_at >= self.refresh_seconds
+
+    def refresh(self, conn, force: bool = False) -> bool:
+        """
+        Check the table version and reload the snapshot if it changed.
+
+        Args:
+            conn: An open database connection
+            force: Reload even if the version is unchanged
+
+        Returns:
+            True if the snapshot was (re)loaded
+        """
+        with self._lock:
+            if not force and not self.is_stale():
+                return False
+
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    SELECT COUNT(*), MAX(created_at), (
+                        SELECT ARRAY[attnum, atttypmod]
+                        FROM pg_attribute
+                        WHERE attrelid = 'training_embeddings'::regclass
+                          AND attname = 'embedding'
+                          AND NOT attisdropped
+                    )
+                    FROM training_embeddings;
+                """)
+                count, created_at, column = cursor.fetchone()
+                version = (count, created_at, tuple(column or ()))
+
+                if not force and self.is_loaded and version == self._version:
+                    self._checked_at = time.monotonic()
+                    return False
+
+                cursor.execute("""
+                    SELECT type, content, sql, vector_send(embedding)
+                    FROM training_embeddings
+                    WHERE embedding IS NOT NULL
+                    ORDER BY type;
+                """)
+                results = cursor.fetchall()
+
+                # End the read-only transaction so a pooled connection isn't left idle in it
+                conn.commit()
+            except Exception:
+                # Keep serving the loaded snapshot until the next check is due,
+                # rather than every request retrying while the database is failing
+                if self.is_loaded:
+                    self._checked_at = time.monotonic()
+                raise
+            finally:
+                cursor.close()
+
+            self._load(results, version)
+            return True
+
+    def _load(self, results: List[Tuple], version: Tuple):
+        """
+        Build the normalized embedding matrix and per-type slices from query rows.
+        """
+        start = time.perf_counter()
+
+        rows = []
+        slices = {}
+        vectors = []
+        for datum_type, content, sql, embedding_bytes in results:
+            if datum_type not in slices:
+                slices[datum_type] = (len(rows), len(rows))
+            slices[datum_type] = (slices[datum_type][0], len(rows) + 1)
+            rows.append((content, sql))
+            vectors.append(decode_vector_binary(embedding_bytes))
+
+        if vectors:
+            matrix = np.ascontiguousarray(np.vstack(vectors))
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+
+        self._snapshot = (matrix, rows, slices)
+        self._version = version
+        self._checked_at = time.monotonic()
+
+        self.log(
+            f"Loaded {len(rows)} embeddings into memory "
+            f"({matrix.nbytes / 1024 / 1024:.1f} MiB) in {time.perf_counter() - start:.2f}s"
+        )
+
+    def search(self, query_embedding: List[float], k_by_type: Dict[str, int]) -> Dict[str, List[Dict]]:
+        """
+        Exact cosine similarity search over the snapshot.
+
+        Args:
+            query_embedding: The embedding vector for the user's question
+            k_by_type: Number of results per training data type
+
+        Returns:
+            Dict keyed by training data type, in the same shape as
+            SQLGenerator.retrieve_context
+
+        Raises:
+            ValueError: If the snapshot has not been loaded or the query embedding's
+                dimension doesn't match it
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            raise ValueError("In-memory vector index is not loaded. Call refresh() first.")
+
+        matrix, rows, slices = snapshot
+
+        context = {"question-sql": [], "ddl": [], "documentation": []}
+        if matrix.shape[0] == 0:
+            return context
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape[0] != matrix.shape[1]:
+            raise ValueError(
+                f"Query embedding has {query.shape[0]} dimensions, stored embeddings have {matrix.shape[1]}"
+            )
+
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        # Cosine similarity against every stored embedding in one product
+        similarities = matrix @ query
+
+        for datum_type, k in k_by_type.items():
+            if k <= 0 or datum_type not in slices:
+                continue
+
+            start, end = slices[datum_type]
+            scores = similarities[start:end]
+            k = min(k, end - start)
+
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            for index in top:
+                content, sql = rows[start + index]
+                if datum_type == "question-sql":
+                    context[datum_type].append({
+                        "question": content,
+                        "sql": sql,
+                        "similarity": float(scores[index])
+                    })
+                else:
+                    context[datum_type].append({
+                        "content": content,
+                        "similarity": float(scores[index])
+                    })
+
+        return context
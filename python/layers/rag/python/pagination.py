@@ -0,0 +1,72 @@
+import base64
+import hashlib
+import hmac
+import os
+import time
+from typing import Dict, Optional, Union
+
+from serializer import dumps_bytes, loads
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class PageTokenCodec():
+    """
+    Opaque continuation tokens for paging through query results across
+    requests. A token carries the query to re-run and where the next page
+    starts, and is signed with HMAC-SHA256 so clients can't alter it to run
+    other SQL. Tokens expire after `ttl_seconds`.
+
+    Every container of a function must share the secret for tokens to work
+    across invocations; without one, a random secret is used and tokens only
+    work on the container that issued them.
+    """
+
+    def __init__(self, secret: Optional[Union[str, bytes]] = None, ttl_seconds: int = 3600):
+        if isinstance(secret, str):
+            secret = secret.encode("utf-8")
+        self.has_shared_secret = bool(secret)
+        self.secret = secret or os.urandom(32)
+        self.ttl_seconds = ttl_seconds
+
+    def _sign(self, body: str) -> str:
+        return _b64encode(hmac.new(self.secret, body.encode("ascii"), hashlib.sha256).digest())
+
+    def encode(self, payload: Dict) -> str:
+        """
+        Sign a JSON-serializable payload into a token. Dates are encoded as ISO strings.
+        """
+        body = _b64encode(dumps_bytes({"p": payload, "exp": int(time.time()) + self.ttl_seconds}))
+        return f"{body}.{self._sign(body)}"
+
+    def decode(self, token: str) -> Dict:
+        """
+        Verify a token and return its payload.
+
+        Raises:
+            ValueError: If the token is malformed, was not signed with this
+                codec's secret, or has expired
+        """
+        try:
+            body, signature = token.split(".")
+        except (AttributeError, ValueError):
+            raise ValueError("Invalid page token")
+
+        if not hmac.compare_digest(signature, self._sign(body)):
+            raise ValueError("Invalid page token")
+
+        try:
+            data = loads(_b64decode(body))
+        except ValueError:
+            raise ValueError("Invalid page token")
+
+        if data.get("exp", 0) < time.time():
+            raise ValueError("Page token has expired")
+
+        return data["p"]
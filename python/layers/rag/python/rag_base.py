@@ -3,8 +3,16 @@ import boto3
 import os
 import pg8000
 import threading
-from queue import Queue, Empty
-from typing import List, Dict, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator, List, Dict, Optional, Tuple
+from botocore.exceptions import ClientError
+from connection_pool import ConnectionPool
+from rate_limiter import TokenBucket, backoff_delay
+from vector_codec import register_vector_types
+from vector_index import STORAGE_MODES
+from embedding_cache import EmbeddingCache
 
 class RAGBase():
     """
@@ -13,11 +21,31 @@ class RAGBase():
     """
     
     # Class-level connection pool (shared across all instances)
-    _connection_pool = None
+    _connection_pool: Optional[ConnectionPool] = None
     _pool_lock = threading.Lock()
-    _pool_size = 3 
     _pool_initialized = False
     
+    # Maximum number of texts the embedding model accepts per request
+    _max_embedding_batch_size = 96
+    
+    # Output dimensions supported by the embedding model (Matryoshka truncations of 1536)
+    _supported_embedding_dimensions = (256, 512, 1024, 1536)
+    
+    # Class-level embedding rate limiters, one per model (shared across all instances and threads)
+    _rate_limiters: Dict[str, TokenBucket] = {}
+    _rate_limiter_lock = threading.Lock()
+    
+    # Class-level generate_embedding cache (shared across all instances and threads)
+    _embedding_cache: Optional[EmbeddingCache] = None
+    _embedding_cache_lock = threading.Lock()
+    
+    # Bedrock error codes that are retried with backoff
+    _throttling_error_codes = ("ThrottlingException", "TooManyRequestsException")
+    
+    # Class-level Bedrock runtime client (shared across all instances, reused by warm invocations)
+    _bedrock_runtime = None
+    _bedrock_runtime_lock = threading.Lock()
+    
     def __init__(self, config=None):
         if config is None:
             config = {}
@@ -27,23 +55,75 @@ class RAGBase():
         # Embedding configuration
         self.model_id = "us.cohere.embed-v4:0"
         
+        # Embedding size requested from the model and stored in training_embeddings.
+        # Every Lambda sharing the table must use the same value (EMBEDDING_DIMENSION)
+        self.embedding_dimension = int(
+            self.config.get("embedding_dimension", os.environ.get("EMBEDDING_DIMENSION", 1536))
+        )
+        if self.embedding_dimension not in self._supported_embedding_dimensions:
+            raise ValueError(
+                f"Unsupported embedding dimension: {self.embedding_dimension} "
+                f"(expected one of {self._supported_embedding_dimensions})"
+            )
+        
+        # How embeddings are indexed for ANN search: "full" precision vectors, or
+        # "halfvec"/"binary" quantized copies reranked against the full vectors
+        self.storage_mode = self.config.get("storage_mode", "full")
+        if self.storage_mode not in STORAGE_MODES:
+            raise ValueError(f"Unsupported storage mode: {self.storage_mode}")
+        
         # Default embedding input type (can be overridden by subclasses)
         self.embedding_input_type = "search_document"
         
-        # Initialize the Bedrock client
-        self.bedrock_runtime = boto3.client(
-            service_name='bedrock-runtime',
+        # Number of texts sent per Bedrock call (Cohere embed accepts at most 96)
+        self.embedding_batch_size = min(
+            self.config.get("embedding_batch_size", self._max_embedding_batch_size),
+            self._max_embedding_batch_size
+        )
+        
+        # Concurrency and throttling for batched embedding requests
+        self.embedding_max_workers = self.config.get("embedding_max_workers", 1)
+        self.embedding_max_retries = self.config.get("embedding_max_retries", 5)
+        self.embedding_rate_limiter = self._get_rate_limiter(
+            self.model_id,
+            self.config.get("embedding_requests_per_second", 10)
+        )
+        
+        # generate_embedding cache: an in-process LRU, backed by a shared UNLOGGED table
+        self.embedding_cache = self._get_embedding_cache(
+            self.config.get("embedding_cache_size", 1024),
+            self.config.get("embedding_cache_ttl_days", 30)
         )
+        self.embedding_cache_persistent = self.config.get("embedding_cache_persistent", True)
+        
+        # Initialize the Bedrock client
+        self.bedrock_runtime = self._get_bedrock_runtime()
         
         # Database connection (initialized as None, connected later)
-        # This is kept for backward compatibility with old single-connection approach
+        # This is kept for backward compatibility with old single-connection approach.
+        # It is checked out of the pool and held until close_connection()
         self.connection: Optional[pg8000.Connection] = None
         
-        # Initialize pool on first use
-        if RAGBase._connection_pool is None:
-            with RAGBase._pool_lock:
-                if RAGBase._connection_pool is None:
-                    RAGBase._connection_pool = Queue(maxsize=self._pool_size)
+        # Connection pool settings. The pool is shared by all instances, so the
+        # first instance to connect decides them
+        self.pool_min_size = self.config.get("pool_min_size", 1)  # Opened up front, in parallel
+        self.pool_max_size = self.config.get("pool_max_size", 5)  # Further connections are opened on demand
+        self.pool_validate_after_idle_seconds = self.config.get("pool_validate_after_idle_seconds", 30)
+        self.pool_max_lifetime_seconds = self.config.get("pool_max_lifetime_seconds", 1800)
+    
+    @classmethod
+    def _get_bedrock_runtime(cls):
+        """
+        Get the shared Bedrock runtime client, creating it on first use. boto3
+        clients are thread-safe, and creating one costs tens of milliseconds.
+        """
+        if RAGBase._bedrock_runtime is None:
+            with RAGBase._bedrock_runtime_lock:
+                if RAGBase._bedrock_runtime is None:
+                    RAGBase._bedrock_runtime = boto3.client(
+                        service_name='bedrock-runtime',
+                    )
+        return RAGBase._bedrock_runtime
     
     def log(self, message: str, title: str = "Info"):
         """
@@ -58,6 +138,8 @@ class RAGBase():
     def generate_embedding(self, data: str, **kwargs) -> List[float]:
         """
         Generates an embedding for a given text using the configured Bedrock Cohere model.
+        Embeddings are cached by (model, input type, dimension, normalized text), so a
+        repeated question skips the Bedrock call.
         
         Args:
             data: The text to generate an embedding for
@@ -70,67 +152,254 @@ class RAGBase():
             self.log("Empty input text provided", title="Error")
             return []
 
-        body = json.dumps({
-            "texts": [data],
-            "input_type": kwargs.get("input_type", self.embedding_input_type)
-        })
+        input_type = kwargs.get("input_type", self.embedding_input_type)
+        cache_key = EmbeddingCache.cache_key(self.model_id, input_type, self.embedding_dimension, data)
+
+        embedding = self._get_cached_embedding(cache_key)
+        if embedding is not None:
+            return embedding
 
         try:
-            response = self.bedrock_runtime.invoke_model(
-                body=body,
-                modelId=self.model_id,
-                accept='application/json',
-                contentType='application/json'
-            )
+            embedding = self._invoke_embedding_model([data], input_type)[0]
+
+        except Exception as e:
+            self.log(f"Error generating embedding: {e}", title="Error")
+            return []
 
-            response_body = json.loads(response.get('body').read())
+        self._cache_embedding(cache_key, embedding)
+        return embedding
 
-            embedding = response_body.get('embeddings')['float'][0]
+    @classmethod
+    def _get_embedding_cache(cls, max_entries: int, ttl_days: int) -> EmbeddingCache:
+        """
+        Get the shared embedding cache, creating it on first use.
+        
+        Args:
+            max_entries: Size bound of the in-process tier
+            ttl_days: Age after which persistent entries are expired
+            
+        Returns:
+            The EmbeddingCache shared by all instances
+        """
+        with RAGBase._embedding_cache_lock:
+            if RAGBase._embedding_cache is None:
+                RAGBase._embedding_cache = EmbeddingCache(max_entries, ttl_days)
+            return RAGBase._embedding_cache
 
+    def _get_cached_embedding(self, cache_key: str) -> Optional[List[float]]:
+        """
+        Look up an embedding in the in-process tier, then in the persistent tier if
+        the connection pool is up. Persistent tier errors, including failing to
+        check out a connection, are logged and treated as a miss.
+        
+        Args:
+            cache_key: Key from EmbeddingCache.cache_key
+            
+        Returns:
+            The cached embedding, or None on a miss
+        """
+        embedding = self.embedding_cache.get(cache_key)
+        if embedding is not None:
+            self.embedding_cache.record("memory_hits")
+            self.log(f"Embedding cache hit (memory): {self.embedding_cache.stats()}")
             return embedding
 
-        except Exception as e:
-            self.log(f"Error generating embedding: {e}", title="Error")
-            return []
+        if self.embedding_cache_persistent and RAGBase._pool_initialized:
+            # Checkout failures (e.g. a pool timeout) are a miss too
+            try:
+                with self.pooled_connection() as conn:
+                    embedding = self.embedding_cache.get_persistent(conn, cache_key)
+            except Exception as e:
+                self.log(f"Error reading embedding cache: {e}", title="Warning")
+                embedding = None
+
+            if embedding is not None:
+                self.embedding_cache.put(cache_key, embedding)
+                self.embedding_cache.record("persistent_hits")
+                self.log(f"Embedding cache hit (persistent): {self.embedding_cache.stats()}")
+                return embedding
+
+        self.embedding_cache.record("misses")
+        self.log(f"Embedding cache miss: {self.embedding_cache.stats()}")
+        return None
+
+    def _cache_embedding(self, cache_key: str, embedding: List[float]):
+        """
+        Store a freshly generated embedding in both cache tiers.
+        
+        Args:
+            cache_key: Key from EmbeddingCache.cache_key
+            embedding: The embedding to cache
+        """
+        self.embedding_cache.put(cache_key, embedding)
+
+        if self.embedding_cache_persistent and RAGBase._pool_initialized:
+            try:
+                with self.pooled_connection() as conn:
+                    self.embedding_cache.put_persistent(conn, cache_key, embedding)
+            except Exception as e:
+                self.log(f"Error writing embedding cache: {e}", title="Warning")
+
+    def generate_embeddings(self, texts: List[str], **kwargs) -> List[List[float]]:
+        """
+        Generates embeddings for a list of texts, packing up to the model's per-request
+        limit into each Bedrock call.
+        
+        Args:
+            texts: The texts to generate embeddings for
+            **kwargs: Additional options, including 'input_type' to override default
+            
+        Returns:
+            List of embeddings in the same order as texts. Items that could not be
+            embedded (empty input or a failed request) are returned as empty lists.
+        """
+        input_type = kwargs.get("input_type", self.embedding_input_type)
+        embeddings: List[List[float]] = [[] for _ in texts]
+
+        # Only send non-empty texts, remembering their original positions
+        pending = [(i, text) for i, text in enumerate(texts) if text and text.strip()]
+        if len(pending) < len(texts):
+            self.log(f"Skipping {len(texts) - len(pending)} empty input texts", title="Warning")
+
+        batches = [
+            pending[start:start + self.embedding_batch_size]
+            for start in range(0, len(pending), self.embedding_batch_size)
+        ]
+
+        def embed_batch(batch: List[Tuple[int, str]]) -> Tuple[List[List[float]], int]:
+            try:
+                return self._invoke_embedding_model([text for _, text in batch], input_type), 1
+            except Exception as e:
+                self.log(f"Error generating batch of {len(batch)} embeddings: {e}", title="Error")
+                if len(batch) == 1:
+                    return [[]], 1
+
+                # Retry one at a time so a single bad input doesn't fail the whole batch
+                return [self.generate_embedding(text, input_type=input_type) for _, text in batch], 1 + len(batch)
+
+        # Results are collected in submission order, so output order is deterministic
+        max_workers = max(1, min(self.embedding_max_workers, len(batches)))
+        if max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(embed_batch, batches))
+        else:
+            results = [embed_batch(batch) for batch in batches]
+
+        request_count = 0
+        for batch, (batch_embeddings, batch_requests) in zip(batches, results):
+            request_count += batch_requests
+            for (i, _), embedding in zip(batch, batch_embeddings):
+                embeddings[i] = embedding
+
+        failed_count = sum(1 for embedding in embeddings if not embedding)
+        self.log(
+            f"Generated {len(texts) - failed_count}/{len(texts)} embeddings "
+            f"in {request_count} request(s)"
+        )
+
+        return embeddings
+
+    @classmethod
+    def _get_rate_limiter(cls, model_id: str, requests_per_second: float) -> TokenBucket:
+        """
+        Get the shared rate limiter for a model, creating it on first use. The
+        model's quota is shared, so the first rate requested for a model applies
+        to every instance using it; a different rate requested later is logged
+        and ignored.
+        
+        Args:
+            model_id: The Bedrock model ID the limiter applies to
+            requests_per_second: Sustained request rate (also used as burst size)
+            
+        Returns:
+            TokenBucket: The rate limiter shared by all instances using this model
+        """
+        with cls._rate_limiter_lock:
+            if model_id not in cls._rate_limiters:
+                cls._rate_limiters[model_id] = TokenBucket(requests_per_second)
+            limiter = cls._rate_limiters[model_id]
+        
+        if float(requests_per_second) != limiter.rate:
+            print(
+                f"Warning: Ignoring embedding rate of {requests_per_second}/s for {model_id}, "
+                f"its shared rate limiter already allows {limiter.rate}/s"
+            )
+        return limiter
+
+    def _invoke_embedding_model(self, texts: List[str], input_type: str) -> List[List[float]]:
+        """
+        Send a single embedding request to Bedrock.
+        
+        Args:
+            texts: The texts to embed (at most the model's per-request limit)
+            input_type: The Cohere input type ('search_document' or 'search_query')
+            
+        Returns:
+            List of embedding vectors, one per input text
+            
+        Raises:
+            Exception: If the Bedrock call fails (after retrying throttled requests)
+                or the response is malformed
+        """
+        body = json.dumps({
+            "texts": texts,
+            "input_type": input_type,
+            "output_dimension": self.embedding_dimension
+        })
+
+        attempt = 0
+        while True:
+            self.embedding_rate_limiter.acquire()
+            try:
+                response = self.bedrock_runtime.invoke_model(
+                    body=body,
+                    modelId=self.model_id,
+                    accept='application/json',
+                    contentType='application/json'
+                )
+                break
+            except ClientError as e:
+                error_code = e.response.get("Error", {}).get("Code")
+                if error_code not in self._throttling_error_codes or attempt >= self.embedding_max_retries:
+                    raise e
+
+                delay = backoff_delay(attempt)
+                self.log(f"Embedding request throttled, retrying in {delay:.2f}s", title="Warning")
+                time.sleep(delay)
+                attempt += 1
+
+        response_body = json.loads(response.get('body').read())
+
+        embeddings = response_body.get('embeddings')['float']
+
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+
+        if embeddings and len(embeddings[0]) != self.embedding_dimension:
+            raise ValueError(f"Expected {self.embedding_dimension}-dimensional embeddings, got {len(embeddings[0])}")
+
+        return embeddings
     
     def connect_to_postgres(self):
         """
-        Establish a connection to PostgreSQL using credentials from Secrets Manager.
-        Also initializes the connection pool if not already initialized.
+        Check out the instance connection from the connection pool, initializing
+        the pool if not already initialized. An instance connection that is still
+        alive is kept rather than replaced.
         
         Raises:
             pg8000.Error: If database connection fails
         """
-        
-        host = os.environ.get('DB_HOST')
-        port = os.environ.get('DB_PORT', '5432')
-        database = 'postgres'
-        user = os.environ.get('DB_USER')
-        password = os.environ.get('DB_PASSWORD')
+        if self.connection is not None:
+            if self._is_alive(self.connection):
+                return
+            self.log("Database connection was stale, reconnecting")
+            self._return_connection(self.connection, discard=True)
+            self.connection = None
         
         try:
-            self.log(f"Connecting to database at {host}:{port}")
-            
-            # Create single connection for backward compatibility
-            self.connection = pg8000.connect(
-                host=host,
-                port=5432,
-                database=database,
-                user=user,
-                password=password
-            )
-            
+            self.ensure_connection_pool()
+            self.connection = self._get_connection()
             self.log("Successfully connected to PostgreSQL database")
-            
-            # Also initialize the connection pool if not already done
-            credentials = {
-                'host': host,
-                'port': port,
-                'dbname': database,
-                'username': user,
-                'password': password
-            }
-            self._initialize_connection_pool(host, credentials)
 
         except pg8000.Error as e:
             self.log(f"Database connection error: {e}", title="Error")
@@ -139,41 +408,69 @@ class RAGBase():
             self.log(f"Unexpected error during connection: {e}", title="Error")
             raise e
     
+    def ensure_connection_pool(self):
+        """
+        Initialize the connection pool if it isn't already, without opening an
+        instance connection. Pooled connections outlive the instance, so warm
+        invocations reuse them.
+        """
+        if RAGBase._pool_initialized:
+            return
+        
+        credentials = {
+            'host': os.environ.get('DB_HOST'),
+            'port': os.environ.get('DB_PORT', '5432'),
+            'dbname': 'postgres',
+            'username': os.environ.get('DB_USER'),
+            'password': os.environ.get('DB_PASSWORD')
+        }
+        self._initialize_connection_pool(credentials['host'], credentials)
+    
     def _initialize_connection_pool(self, host: str, credentials: Dict[str, str]):
         """
-        Initialize the connection pool if it's empty.
+        Initialize the connection pool if it isn't already. pool_min_size
+        connections are opened in parallel; the rest are opened as checkouts need
+        them, up to pool_max_size.
         
         Args:
             host: Database host
             credentials: Database credentials dictionary
         """
         with RAGBase._pool_lock:
-            # Only initialize if pool is empty and not already initialized
-            if not RAGBase._pool_initialized:
-                self.log(f"Initializing connection pool with {self._pool_size} connections")
-                
-                for i in range(self._pool_size):
-                    try:
-                        conn = pg8000.connect(
-                            host=host,
-                            port=int(credentials['port']),
-                            database=credentials['dbname'],
-                            user=credentials['username'],
-                            password=credentials['password']
-                        )
-                        RAGBase._connection_pool.put(conn)
-                        self.log(f"Created pooled connection {i+1}/{self._pool_size}")
-                    except pg8000.Error as e:
-                        self.log(f"Failed to create pooled connection {i+1}: {e}", title="Error")
-                        # Don't raise here, we might have some connections
-                        continue
-                
-                RAGBase._pool_initialized = True
-                self.log(f"Successfully initialized connection pool")
+            if RAGBase._pool_initialized:
+                return
+            
+            self.log(f"Initializing connection pool with {self.pool_min_size}-{self.pool_max_size} connections at {host}")
+            
+            def connect() -> pg8000.Connection:
+                conn = pg8000.connect(
+                    host=host,
+                    port=int(credentials['port']),
+                    database=credentials['dbname'],
+                    user=credentials['username'],
+                    password=credentials['password']
+                )
+                register_vector_types(conn)
+                return conn
+            
+            pool = ConnectionPool(
+                connect,
+                min_size=self.pool_min_size,
+                max_size=self.pool_max_size,
+                validate=self._is_alive,
+                validate_after_idle_seconds=self.pool_validate_after_idle_seconds,
+                max_lifetime_seconds=self.pool_max_lifetime_seconds,
+                log=self.log
+            )
+            pool.warm()
+            
+            RAGBase._connection_pool = pool
+            RAGBase._pool_initialized = True
     
     def _get_connection(self, timeout: int = 30) -> pg8000.Connection:
         """
-        Get a connection from the pool.
+        Get a connection from the pool. It is only health-checked if it has been
+        idle for longer than pool_validate_after_idle_seconds.
         
         Args:
             timeout: Maximum time to wait for a connection (seconds)
@@ -182,84 +479,107 @@ class RAGBase():
             pg8000.Connection: A database connection from the pool
             
         Raises:
-            Exception: If no connection is available within the timeout period
+            PoolTimeout: If no connection is available within the timeout period
+        """
+        self.ensure_connection_pool()
+        return RAGBase._connection_pool.acquire(timeout)
+    
+    @staticmethod
+    def _is_alive(conn: pg8000.Connection) -> bool:
+        """
+        Check a connection with a trivial query, e.g. after the container was frozen.
         """
         try:
-            conn = RAGBase._connection_pool.get(timeout=timeout)
-            
-            # Test if connection is still alive
-            try:
-                cursor = conn.cursor()
-                cursor.execute("SELECT 1")
-                cursor.close()
-            except Exception as e:
-                # Connection is dead, create a new one
-                self.log(f"Connection was stale ({e}), creating new one")
-                try:
-                    conn.close()
-                except:
-                    pass
-                conn = self._create_new_connection()
-            
-            return conn
-        except Empty:
-            raise Exception(f"No database connection available after {timeout} seconds")
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            return True
+        except Exception:
+            return False
     
-    def _return_connection(self, conn: pg8000.Connection):
+    def _return_connection(self, conn: pg8000.Connection, discard: bool = False):
         """
         Return a connection to the pool.
         
         Args:
             conn: The database connection to return
+            discard: Close the connection instead of reusing it
         """
-        try:
-            RAGBase._connection_pool.put(conn, block=False)
-        except Exception as e:
-            # Pool is full, close the connection
-            self.log(f"Pool is full or error returning connection ({e}), closing connection")
+        pool = RAGBase._connection_pool
+        if pool is None:
             try:
                 conn.close()
             except:
                 pass
+            return
+        pool.release(conn, discard=discard)
     
-    def _create_new_connection(self) -> pg8000.Connection:
+    def _rollback(self, conn: pg8000.Connection, error: Optional[BaseException] = None):
         """
-        Create a new database connection with current credentials.
+        Roll back a pooled connection's transaction after an error. If the error
+        was a pg8000.InterfaceError (e.g. the socket dropped mid-query) or the
+        rollback fails, the connection is broken, and it is closed instead of
+        reused when it goes back to the pool.
         
-        Returns:
-            pg8000.Connection: A new database connection
-            
-        Raises:
-            pg8000.Error: If database connection fails
+        Args:
+            conn: A pooled database connection
+            error: The error that interrupted the transaction, if any
         """
+        broken = isinstance(error, pg8000.InterfaceError)
+        if not broken:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
         
-        host = os.environ.get('DB_HOST')
-        port = os.environ.get('DB_PORT', '5432')
-        database = 'postgres'
-        user = os.environ.get('DB_USER')
-        password = os.environ.get('DB_PASSWORD')
+        pool = RAGBase._connection_pool
+        if broken and pool is not None:
+            self.log("Discarding broken database connection", title="Warning")
+            pool.invalidate(conn)
+    
+    @contextmanager
+    def pooled_connection(self, timeout: int = 30) -> Iterator[pg8000.Connection]:
+        """
+        Check out a pooled connection for the duration of a with block. If the
+        block raises, the transaction is rolled back before the connection is
+        returned, and a broken connection is discarded.
         
-        return pg8000.connect(
-            host=host,
-            port=port,
-            database=database,
-            user=user,
-            password=password
-        )
+        Args:
+            timeout: Maximum time to wait for a connection (seconds)
+        """
+        conn = self._get_connection(timeout)
+        try:
+            yield conn
+        except BaseException as e:
+            self._rollback(conn, e)
+            raise
+        finally:
+            self._return_connection(conn)
+    
+    @classmethod
+    def pool_metrics(cls) -> Dict:
+        """
+        Connection pool size, checkout wait times and open/close counters.
+        """
+        pool = cls._connection_pool
+        return pool.metrics() if pool is not None else {}
     
     def close_connection(self):
         """
-        Close the database connection if it exists.
-        Note: This does NOT close the connection pool, only the instance connection.
+        Return the instance connection to the pool if it exists.
+        Note: This does NOT close the connection pool, only releases the instance connection.
         Use close_connection_pool() to close all pooled connections.
         """
         if self.connection:
             try:
-                self.connection.close()
-                self.log("Database connection closed")
-                self.connection = None
+                # Don't hand the next user an open transaction
+                self.connection.rollback()
+                self._return_connection(self.connection)
+                self.log("Database connection released")
             except Exception as e:
-                self.log(f"Error closing connection: {e}", title="Error")
+                self.log(f"Error releasing connection: {e}", title="Error")
+                self._return_connection(self.connection, discard=True)
+            self.connection = None
     
     @classmethod
     def close_connection_pool(cls):
@@ -269,17 +589,7 @@ class RAGBase():
         """
         with cls._pool_lock:
             if cls._connection_pool:
-                print("Info: Closing all connections in pool")
-                closed_count = 0
-                while not cls._connection_pool.empty():
-                    try:
-                        conn = cls._connection_pool.get_nowait()
-                        conn.close()
-                        closed_count += 1
-                    except Empty:
-                        break
-                    except Exception as e:
-                        print(f"Error: Error closing pooled connection: {e}")
-                
-                print(f"Info: Closed {closed_count} pooled connections")
+                print(f"Info: Closing connection pool: {cls._connection_pool.metrics()}")
+                cls._connection_pool.close()
+                cls._connection_pool = None
                 cls._pool_initialized = False
\ No newline at end of file
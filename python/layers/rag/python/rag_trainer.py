@@ -1,22 +1,78 @@
+import hashlib
 import pg8000
-from typing import List, Dict
+from typing import List, Dict, Optional
 from rag_base import RAGBase
+from vector_codec import encode_vector
+from vector_index import STORAGE_MODES, VectorIndexManager
 
 class RAGTrainer(RAGBase):
     """
     Trainer class for RAG system. Handles ingestion of training data
     (question-SQL pairs, DDL statements, documentation) and storage in vector database.
+    
+    Training is incremental: every datum is identified by a content hash, and only
+    data that is not already stored is embedded and inserted.
     """
-
+    
+    # Columns written for each training datum, in parameter order
+    _insert_columns = ("content", "embedding", "type", "sql", "content_hash")
+    
+    # PostgreSQL's limit on bind parameters in a single statement
+    _max_params_per_statement = 32767
+    
     def __init__(self, config=None):
         super().__init__(config)
         
         # Set embedding input type for training documents
         self.embedding_input_type = "search_document"
         
+        # Embed training batches concurrently (bounded by the shared rate limiter)
+        self.embedding_max_workers = self.config.get("embedding_max_workers", 4)
+        
+        # Rows per multi-row INSERT statement when loading training data
+        self.insert_chunk_size = min(
+            self.config.get("insert_chunk_size", 500),
+            self._max_params_per_statement // len(self._insert_columns)
+        )
+        
         # Initialize training data collection
         self.training_data: List[Dict] = []
     
+    def compute_content_hash(self, datum_type: str, content: str, sql: Optional[str] = None) -> str:
+        """
+        Compute the identity hash of a training datum. Whitespace is normalized so
+        reformatted SQL or DDL hashes the same, and the embedding model ID is included
+        so a model change re-embeds everything.
+        
+        Args:
+            datum_type: The training data type ('question-sql', 'ddl', 'documentation')
+            content: The question, DDL statement, or documentation text
+            sql: The SQL query for question-SQL pairs (optional)
+            
+        Returns:
+            Hex-encoded SHA-256 digest
+        """
+        parts = [
+            datum_type,
+            " ".join(content.split()),
+            " ".join((sql or "").split()),
+            self.model_id
+        ]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+    
+    def _add_training_datum(self, datum_type: str, content: str, sql: Optional[str] = None):
+        """
+        Queue a training datum. Embeddings are generated in train(), and only
+        for data that is not already in the vector store.
+        """
+        self.training_data.append({
+            "content": content,
+            "embedding": None,
+            "type": datum_type,
+            "sql": sql,
+            "content_hash": self.compute_content_hash(datum_type, content, sql)
+        })
+    
     def add_question_sql(self, question: str, sql: str, **kwargs) -> str:
         """
         Adds a question-SQL pair to the training data.
@@ -29,21 +85,11 @@ class RAGTrainer(RAGBase):
         Returns:
             Success message or empty string on failure
         """
-        # Generate embedding for the question
-        embedding = self.generate_embedding(question)
-        
-        if not embedding:
-            self.log("Failed to generate embedding for question", title="Error")
+        if not question or not question.strip() or not sql:
+            self.log("Question and SQL are required", title="Error")
             return ""
         
-        training_datum = {
-            "content": question,
-            "embedding": embedding,
-            "type": "question-sql",
-            "sql": sql
-        }
-        
-        self.training_data.append(training_datum)
+        self._add_training_datum("question-sql", question, sql)
         self.log(f"Added question-SQL pair")
         
         return "success"
@@ -82,7 +128,7 @@ class RAGTrainer(RAGBase):
         self.log(f"Processed question-SQL pairs: {success_count} success, {failed_count} failed")
         
         return {"success": success_count, "failed": failed_count}
-
+    
     def add_ddl(self, ddl: str, **kwargs) -> str:
         """
         Adds a DDL statement to the training data.
@@ -94,21 +140,11 @@ class RAGTrainer(RAGBase):
         Returns:
             Success message or empty string on failure
         """
-        # Generate embedding for the DDL
-        embedding = self.generate_embedding(ddl)
-        
-        if not embedding:
-            self.log("Failed to generate embedding for DDL", title="Error")
+        if not ddl or not ddl.strip():
+            self.log("DDL statement is empty", title="Error")
             return ""
         
-        training_datum = {
-            "content": ddl,
-            "embedding": embedding,
-            "type": "ddl",
-            "sql": None
-        }
-        
-        self.training_data.append(training_datum)
+        self._add_training_datum("ddl", ddl)
         self.log(f"Added DDL statement")
         
         return "success"
@@ -144,7 +180,7 @@ class RAGTrainer(RAGBase):
         self.log(f"Processed DDL statements: {success_count} success, {failed_count} failed")
         
         return {"success": success_count, "failed": failed_count}
-
+    
     def add_documentation(self, documentation: str, **kwargs) -> str:
         """
         Adds documentation to the training data.
@@ -156,21 +192,11 @@ class RAGTrainer(RAGBase):
         Returns:
             Success message or empty string on failure
         """
-        # Generate embedding for the documentation
-        embedding = self.generate_embedding(documentation)
-        
-        if not embedding:
-            self.log("Failed to generate embedding for documentation", title="Error")
+        if not documentation or not documentation.strip():
+            self.log("Documentation is empty", title="Error")
             return ""
         
-        training_datum = {
-            "content": documentation,
-            "embedding": embedding,
-            "type": "documentation",
-            "sql": None
-        }
-        
-        self.training_data.append(training_datum)
+        self._add_training_datum("documentation", documentation)
         self.log(f"Added documentation")
         
         return "success"
@@ -207,11 +233,28 @@ class RAGTrainer(RAGBase):
         
         return {"success": success_count, "failed": failed_count}
     
-    def train(self):
+    def train(self, prune: bool = False) -> Dict:
         """
-        Trains the model by inserting all training data into the vector store.
-        Sets up the database (pgvector extension and table) if needed, then inserts all training data.
+        Trains the model by syncing the training data into the vector store.
+        Sets up the database (pgvector extension and table) if needed, embeds and
+        inserts only the training data whose content hash is not already stored,
+        then builds or refreshes the per-type vector indexes over the loaded rows.
         
+        Args:
+            prune: If True, delete stored rows of the trained types that are no longer
+                in the training data (default: False, since HITL examples are stored
+                outside of the static training corpus)
+                
+        Stored rows embedded with another model (their content hash no longer
+        matches) are re-embedded with the current one and replaced, whether or
+        not prune is set.
+                
+        Returns:
+            Diff report dict with 'added', 'unchanged', 'replaced', 'removed' and
+            'failed' counts. 'replaced' counts rows re-embedded from another model;
+            'removed' counts rows pruned, and is 0 unless prune is True. 'index' maps
+            each training data type to the action taken on its vector index.
+            
         Raises:
             ValueError: If connection is not established
             pg8000.Error: If database operations fail
@@ -219,6 +262,8 @@ class RAGTrainer(RAGBase):
         if not self.connection:
             raise ValueError("Database connection not established. Call connect_to_postgres() first.")
         
+        report = {"added": 0, "unchanged": 0, "replaced": 0, "removed": 0, "failed": 0}
+        
         try:
             with self.connection.cursor() as cursor:
                 # Step 1: Create pgvector extension if it doesn't exist
@@ -229,70 +274,135 @@ class RAGTrainer(RAGBase):
                 
                 # Step 2: Create training_embeddings table if it doesn't exist
                 self.log("Creating training_embeddings table if not exists...")
-                create_table_sql = """
+                create_table_sql = f"""
                 CREATE TABLE IF NOT EXISTS training_embeddings (
                     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
                     content TEXT NOT NULL,
-                    embedding vector(1536),
+                    embedding vector({self.embedding_dimension}),
                     type VARCHAR(50) NOT NULL,
                     sql TEXT,
+                    content_hash CHAR(64),
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
                 """
                 cursor.execute(create_table_sql)
-                self.connection.commit()
-                self.log("training_embeddings table ready")
                 
-                # Step 3: Create index for vector similarity search if it doesn't exist
-                self.log("Creating vector index if not exists...")
-                create_index_sql = """
-                    CREATE INDEX IF NOT EXISTS training_embeddings_embedding_idx 
-                    ON training_embeddings 
-                    USING ivfflat (embedding vector_cosine_ops)
-                    WITH (lists = 100);
-                """
-                cursor.execute(create_index_sql)
+                stored_dimension = self.get_stored_embedding_dimension(cursor)
+                if stored_dimension != self.embedding_dimension:
+                    raise ValueError(
+                        f"training_embeddings stores {stored_dimension}-dimensional embeddings but "
+                        f"embedding_dimension is {self.embedding_dimension}. "
+                        "Re-embed the stored training data with EmbeddingMigrator first."
+                    )
+                
+                self._migrate_content_hash(cursor)
+                self._migrate_storage_mode(cursor)
                 self.connection.commit()
-                self.log("Vector index ready")
+                self.log("training_embeddings table ready")
                 
-                # Step 4: Insert training data
+                # Step 3: Diff training data against the stored content hashes
                 if not self.training_data:
                     self.log("No training data to insert", title="Warning")
-                    return
+                    return report
                 
-                self.log(f"Inserting {len(self.training_data)} training examples...")
+                corpus = {}
+                for datum in self.training_data:
+                    corpus.setdefault(datum['content_hash'], datum)
                 
-                insert_sql = """
-                    INSERT INTO training_embeddings (content, embedding, type, sql)
-                    VALUES (%s, %s, %s, %s)
-                """
+                cursor.execute(
+                    "SELECT content_hash, type, content, sql FROM training_embeddings WHERE type = ANY(%s)",
+                    (sorted({datum['type'] for datum in corpus.values()}),)
+                )
+                stored_hashes = set()
+                # Current hash -> stored hash of rows embedded with another model
+                other_model_hashes = {}
+                for stored_hash, datum_type, content, sql in cursor.fetchall():
+                    content_hash = self.compute_content_hash(datum_type, content, sql)
+                    if content_hash == stored_hash:
+                        stored_hashes.add(stored_hash)
+                        continue
+                    # Re-embed it with the current model, keeping HITL examples that
+                    # are not in the training data
+                    other_model_hashes[content_hash] = stored_hash
+                    corpus.setdefault(content_hash, {
+                        "content": content,
+                        "embedding": None,
+                        "type": datum_type,
+                        "sql": sql,
+                        "content_hash": content_hash
+                    })
+                self.connection.commit()
                 
-                inserted_count = 0
-                for datum in self.training_data:
+                new_data = [datum for content_hash, datum in corpus.items() if content_hash not in stored_hashes]
+                # Only a full training corpus says which stored rows are gone
+                removed_hashes = sorted(stored_hashes - corpus.keys()) if prune else []
+                report["unchanged"] = len(corpus) - len(new_data)
+                
+                self.log(
+                    f"Training data diff: {len(new_data)} new, {report['unchanged']} unchanged, "
+                    f"{len(other_model_hashes)} embedded with another model"
+                    + (f", {len(removed_hashes)} stored but not in training data" if prune else "")
+                )
+                
+                # Step 4: Embed and insert only the new training data
+                if new_data:
+                    embeddings = self.generate_embeddings([datum['content'] for datum in new_data])
+                    
+                    embedded_data = []
+                    for datum, embedding in zip(new_data, embeddings):
+                        if not embedding:
+                            self.log(f"Failed to generate embedding for {datum['type']}", title="Error")
+                            report["failed"] += 1
+                            continue
+                        embedded_data.append({**datum, "embedding": embedding})
+                    
+                    self.log(f"Inserting {len(embedded_data)} training examples...")
+                    
                     try:
-                        # Convert embedding list to pgvector format string
-                        embedding_str = '[' + ','.join(map(str, datum['embedding'])) + ']'
-                        
-                        cursor.execute(
-                            insert_sql,
-                            (
-                                datum['content'],
-                                embedding_str,
-                                datum['type'],
-                                datum['sql']
-                            )
-                        )
-                        inserted_count += 1
-                        
+                        report["added"] = self._bulk_insert_training_data(cursor, embedded_data)
                     except Exception as e:
-                        self.log(f"Error inserting training datum: {e}", title="Error")
+                        self.log(f"Error inserting training data: {e}", title="Error")
                         self.connection.rollback()
                         raise e
+                    stored_hashes.update(datum['content_hash'] for datum in embedded_data)
+                
+                # Step 5: Delete the other model's rows that now have a current-model copy;
+                # those that failed to embed are kept and retried on the next run
+                replaced_hashes = sorted(
+                    stored_hash
+                    for content_hash, stored_hash in other_model_hashes.items()
+                    if content_hash in stored_hashes
+                )
+                if replaced_hashes:
+                    cursor.execute(
+                        "DELETE FROM training_embeddings WHERE content_hash = ANY(%s)",
+                        (replaced_hashes,)
+                    )
+                    report["replaced"] = len(replaced_hashes)
+                    self.log(f"Replacing {len(replaced_hashes)} training examples embedded with another model")
                 
-                # Commit all inserts
+                # Step 6: Optionally prune stored rows that are no longer in the training data
+                if removed_hashes:
+                    cursor.execute(
+                        "DELETE FROM training_embeddings WHERE content_hash = ANY(%s)",
+                        (removed_hashes,)
+                    )
+                    report["removed"] = len(removed_hashes)
+                    self.log(f"Pruning {len(removed_hashes)} stale training examples")
+                
+                # Step 7: Build or refresh the per-type vector indexes now that the data is loaded
+                index_results = VectorIndexManager(self.connection, self.config, self.log).ensure_indexes()
+                report["index"] = {datum_type: result["action"] for datum_type, result in index_results.items()}
+                
+                # Commit all changes
                 self.connection.commit()
-                self.log(f"Successfully inserted {inserted_count} training examples")
+                self.log(
+                    f"Training complete: {report['added']} added, {report['unchanged']} unchanged, "
+                    f"{report['replaced']} replaced, {report['removed']} removed, {report['failed']} failed"
+                )
                 
+                return report
+        
         except pg8000.Error as e:
             self.log(f"Database error during training: {e}", title="Error")
             if self.connection:
@@ -303,5 +413,150 @@ class RAGTrainer(RAGBase):
             if self.connection:
                 self.connection.rollback()
             raise e
-
-    
\ No newline at end of file
+    
+    def get_stored_embedding_dimension(self, cursor, column: str = "embedding") -> Optional[int]:
+        """
+        Get the dimension declared on a vector column of training_embeddings.
+        
+        Args:
+            cursor: An open cursor on the training connection
+            column: The vector column to inspect (default: 'embedding')
+            
+        Returns:
+            The column's dimension, or None if the table or column does not exist
+        """
+        # A vector column's type modifier is its dimension
+        cursor.execute("""
+            SELECT atttypmod
+            FROM pg_attribute
+            WHERE attrelid = to_regclass('training_embeddings')
+              AND attname = %s
+              AND NOT attisdropped;
+        """, (column,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    
+    def _migrate_content_hash(self, cursor):
+        """
+        Add the content_hash column and its unique index to an existing table.
+        Rows stored before hashing existed are backfilled, and duplicate rows
+        (same hash) are removed, keeping the oldest copy. Does not commit.
+        
+        Args:
+            cursor: An open cursor on the training connection
+        """
+        cursor.execute("ALTER TABLE training_embeddings ADD COLUMN IF NOT EXISTS content_hash CHAR(64);")
+        
+        cursor.execute("""
+            SELECT id, type, content, sql
+            FROM training_embeddings
+            WHERE content_hash IS NULL
+            ORDER BY created_at;
+        """)
+        unhashed_rows = cursor.fetchall()
+        
+        if unhashed_rows:
+            self.log(f"Backfilling content hashes for {len(unhashed_rows)} training examples...")
+            
+            cursor.execute("SELECT content_hash FROM training_embeddings WHERE content_hash IS NOT NULL;")
+            seen_hashes = {row[0] for row in cursor.fetchall()}
+            
+            updates = []
+            duplicate_ids = []
+            for row_id, datum_type, content, sql in unhashed_rows:
+                content_hash = self.compute_content_hash(datum_type, content, sql)
+                if content_hash in seen_hashes:
+                    duplicate_ids.append(str(row_id))
+                else:
+                    seen_hashes.add(content_hash)
+                    updates.append((str(row_id), content_hash))
+            
+            if duplicate_ids:
+                cursor.execute(
+                    "DELETE FROM training_embeddings WHERE id = ANY(%s::uuid[])",
+                    (duplicate_ids,)
+                )
+                self.log(f"Removed {len(duplicate_ids)} duplicate training examples")
+            
+            for start in range(0, len(updates), self.insert_chunk_size):
+                chunk = updates[start:start + self.insert_chunk_size]
+                params = [value for update in chunk for value in update]
+                cursor.execute(
+                    "UPDATE training_embeddings AS t SET content_hash = v.content_hash FROM (VALUES "
+                    + ", ".join(["(%s::uuid, %s)"] * len(chunk))
+                    + ") AS v(id, content_hash) WHERE t.id = v.id",
+                    params
+                )
+        
+        cursor.execute("ALTER TABLE training_embeddings ALTER COLUMN content_hash SET NOT NULL;")
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS training_embeddings_content_hash_key
+            ON training_embeddings (content_hash);
+        """)
+    
+    def _migrate_storage_mode(self, cursor):
+        """
+        Add the generated quantized embedding column used by the configured storage
+        mode, and drop the ones left behind by other modes. Existing rows are
+        quantized by Postgres when the column is added, and the vector indexes on a
+        dropped column go with it and are rebuilt by VectorIndexManager. Does not commit.
+        
+        Args:
+            cursor: An open cursor on the training connection
+        """
+        for mode, storage in STORAGE_MODES.items():
+            if storage["column_definition"] is None:
+                continue
+            
+            if mode == self.storage_mode:
+                column_definition = storage["column_definition"].format(dimension=self.embedding_dimension)
+                cursor.execute(
+                    f"ALTER TABLE training_embeddings ADD COLUMN IF NOT EXISTS {storage['column']} {column_definition};"
+                )
+            else:
+                cursor.execute(f"ALTER TABLE training_embeddings DROP COLUMN IF EXISTS {storage['column']};")
+        
+        self.log(f"Embedding storage mode: {self.storage_mode}")
+    
+    def _bulk_insert_training_data(self, cursor, training_data: List[Dict]) -> int:
+        """
+        Insert training data using chunked multi-row INSERT statements, so the whole
+        load takes one round trip per `insert_chunk_size` rows. Rows whose content hash
+        is already stored are skipped. Does not commit.
+        
+        Args:
+            cursor: An open cursor on the training connection
+            training_data: List of training datums with content, embedding, type, sql
+                and content_hash
+                
+        Returns:
+            Number of rows inserted
+        """
+        columns = ", ".join(self._insert_columns)
+        row_placeholder = "(%s, %s::vector, %s, %s, %s)"
+        
+        inserted_count = 0
+        for start in range(0, len(training_data), self.insert_chunk_size):
+            chunk = training_data[start:start + self.insert_chunk_size]
+            
+            params = []
+            for datum in chunk:
+                # Convert embedding list to pgvector format string
+                embedding_str = encode_vector(datum['embedding'])
+                params.extend((
+                    datum['content'],
+                    embedding_str,
+                    datum['type'],
+                    datum['sql'],
+                    datum['content_hash']
+                ))
+            
+            cursor.execute(
+                f"INSERT INTO training_embeddings ({columns}) VALUES "
+                + ", ".join([row_placeholder] * len(chunk))
+                + " ON CONFLICT (content_hash) DO NOTHING",
+                params
+            )
+            inserted_count += cursor.rowcount
+        
+        return inserted_count
@@ -0,0 +1,63 @@
+import random
+import threading
+import time
+
+
+class TokenBucket():
+    """
+    Thread-safe token bucket rate limiter. Tokens refill continuously at `rate`
+    per second up to `capacity`; each call to acquire() consumes one token and
+    blocks until one is available.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        if rate <= 0:
+            raise ValueError("Token bucket rate must be positive")
+
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens from the bucket, sleeping until enough are available.
+
+        Args:
+            tokens: Number of tokens to consume (default: 1)
+
+        Returns:
+            Total number of seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait_time = (tokens - self._tokens) / self.rate
+
+            time.sleep(wait_time)
+            waited += wait_time
+
+
+def backoff_delay(attempt: int, base_delay: float = 0.5, max_delay: float = 20.0) -> float:
+    """
+    Exponential backoff with full jitter.
+
+    Args:
+        attempt: The retry attempt number, starting at 0
+        base_delay: Delay ceiling for the first retry (seconds)
+        max_delay: Upper bound on the delay ceiling (seconds)
+
+    Returns:
+        Number of seconds to sleep before the next attempt
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
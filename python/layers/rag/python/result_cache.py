@@ -0,0 +1,284 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+import boto3
+
+from serializer import dumps, dumps_bytes, loads
+
+# Single-quoted SQL string literals, with '' escapes
+_STRING_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'")
+
+
+def sql_fingerprint(sql: str) -> str:
+    """
+    Hex-encoded SHA-256 digest of SQL with insignificant differences removed:
+    case and whitespace outside string literals, and a trailing semicolon.
+
+    Args:
+        sql: The SQL query
+
+    Returns:
+        The fingerprint
+    """
+    parts = []
+    position = 0
+    for literal in _STRING_LITERAL_PATTERN.finditer(sql):
+        parts.append(" ".join(sql[position:literal.start()].lower().split()))
+        parts.append(literal.group(0))
+        position = literal.end()
+    parts.append(" ".join(sql[position:].lower().split()))
+
+    normalized = " ".join(part for part in parts if part).rstrip("; ")
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class AggregationWatermark():
+    """
+    Reads the timestamp of the last listening history aggregation, which the
+    aggregator Lambda records in the status DynamoDB table. The aggregate tables
+    only change when it moves, so it versions every cached query result.
+
+    The value is cached for `ttl_seconds` to keep DynamoDB off the hot path. A
+    failed read is cached as None for as long, so caching pauses instead of
+    every query waiting on DynamoDB.
+    """
+
+    metric_name = "listening_history_aggregation"
+
+    def __init__(self, table_name: Optional[str] = None, ttl_seconds: float = 30.0):
+        self.table_name = table_name or os.environ.get("AGGREGATION_STATUS_TABLE_NAME")
+        self.ttl_seconds = ttl_seconds
+
+        self._dynamodb = boto3.client("dynamodb") if self.table_name else None
+        self._value: Optional[str] = None
+        self._read_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[str]:
+        """
+        Get the current watermark.
+
+        Returns:
+            The last aggregation timestamp, or None if it is unknown (results
+            must not be cached then)
+
+        Raises:
+            botocore.exceptions.ClientError: If reading the status table fails
+        """
+        if self._dynamodb is None:
+            return None
+
+        with self._lock:
+            if self._read_at is not None and time.monotonic() - self._read_at < self.ttl_seconds:
+                return self._value
+
+            self._value = None
+            self._read_at = time.monotonic()
+
+            response = self._dynamodb.get_item(
+                TableName=self.table_name,
+                Key={"metric_name": {"S": self.metric_name}}
+            )
+            self._value = response.get("Item", {}).get("timestamp", {}).get("S")
+            return self._value
+
+
+class ResultCache():
+    """
+    Two-tier cache of query results.
+
+    The first tier is an in-process LRU bounded by the total size of the cached
+    results (`max_bytes`). The second is the UNLOGGED query_result_cache table
+    shared by every container. Results are stored as JSON, so dates come back as
+    ISO strings and numerics as numbers, as they would be in the API response.
+    Results larger than `max_entry_bytes` are not cached.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, max_entry_bytes: int = 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self._table_ready = False
+        self._pruned_watermark: Optional[str] = None
+
+        self._stats = {"memory_hits": 0, "shared_hits": 0, "misses": 0}
+
+    @staticmethod
+    def cache_key(
+        sql: str,
+        watermark: str,
+        params: Optional[Dict] = None,
+        page: Tuple[int, Optional[int]] = (0, None),
+        as_rows: bool = False
+    ) -> str:
+        """
+        Key for a query's result: its fingerprint and bound parameters, the page
+        of rows as (offset, row limit), whether rows are lists or dicts, the
+        aggregation watermark and the current date (SQL may use CURRENT_DATE).
+        """
+        parts = [
+            sql_fingerprint(sql),
+            dumps(params or {}, sort_keys=True),
+            f"{page[0]}:{page[1]}:{'rows' if as_rows else 'dicts'}",
+            watermark,
+            date.today().isoformat()
+        ]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def encode(result: Dict) -> bytes:
+        return dumps_bytes(result)
+
+    @staticmethod
+    def decode(payload: bytes) -> Dict:
+        return loads(payload)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Look up a result in the in-process tier, marking it recently used.
+        """
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                return None
+            self._entries.move_to_end(key)
+
+        return self.decode(payload)
+
+    def put(self, key: str, payload: bytes):
+        """
+        Store an encoded result in the in-process tier, evicting the least recently
+        used entries until the tier fits in max_bytes.
+        """
+        if len(payload) > self.max_entry_bytes or len(payload) > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+
+            self._entries[key] = payload
+            self._size += len(payload)
+
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def record(self, outcome: str):
+        """
+        Count a lookup outcome ('memory_hits', 'shared_hits' or 'misses').
+        """
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def stats(self) -> Dict:
+        """
+        Hit/miss counters since the container started, with the number and total
+        size of the results held in memory.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+        return stats
+
+    def ensure_table(self, conn, watermark: str):
+        """
+        Create the shared tier if needed, and drop its entries from earlier
+        watermarks the first time this container sees a new one.
+
+        Args:
+            conn: An open database connection
+            watermark: The current aggregation watermark
+        """
+        if self._table_ready and self._pruned_watermark == watermark:
+            return
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                CREATE UNLOGGED TABLE IF NOT EXISTS query_result_cache (
+                    cache_key CHAR(64) PRIMARY KEY,
+                    watermark TEXT NOT NULL,
+                    result BYTEA NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            cursor.execute(
+                "DELETE FROM query_result_cache WHERE watermark <> %s OR created_at < CURRENT_DATE;",
+                (watermark,)
+            )
+            conn.commit()
+        finally:
+            cursor.close()
+
+        self._table_ready = True
+        self._pruned_watermark = watermark
+
+    def get_shared(self, conn, key: str, watermark: str) -> Optional[Tuple[Dict, bytes]]:
+        """
+        Look up a result in the shared tier.
+
+        Args:
+            conn: An open database connection
+            key: The cache key
+            watermark: The current aggregation watermark
+
+        Returns:
+            Tuple of (result, encoded result), or None if it isn't cached
+        """
+        self.ensure_table(conn, watermark)
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT result FROM query_result_cache WHERE cache_key = %s;", (key,))
+            row = cursor.fetchone()
+            conn.commit()
+        finally:
+            cursor.close()
+
+        if row is None:
+            return None
+
+        payload = bytes(row[0])
+        return self.decode(payload), payload
+
+    def put_shared(self, conn, key: str, watermark: str, payload: bytes):
+        """
+        Store an encoded result in the shared tier.
+
+        Args:
+            conn: An open database connection
+            key: The cache key
+            watermark: The aggregation watermark the result was computed at
+            payload: The encoded result
+        """
+        if len(payload) > self.max_entry_bytes:
+            return
+
+        self.ensure_table(conn, watermark)
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """
+                INSERT INTO query_result_cache (cache_key, watermark, result)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (cache_key) DO NOTHING;
+                """,
+                (key, watermark, payload)
+            )
+            conn.commit()
+        finally:
+            cursor.close()
@@ -0,0 +1,59 @@
+from typing import Any, Dict, List, Sequence
+
+RESULT_FORMATS = ("rows", "columnar")
+
+
+def encode_columnar(columns: List[str], rows: Sequence[Sequence[Any]]) -> Dict[str, Any]:
+    """
+    Encode query results column-wise. Column names are sent once instead of
+    once per row, and string columns with repeated values (artist names, album
+    cover URLs) are dictionary-encoded: the column's distinct values are listed
+    once under "dictionaries", and its cells hold indexes into that list.
+
+    Args:
+        columns: Column names
+        rows: Rows as sequences of values in column order
+
+    Returns:
+        Dict with "columns", "rows" (lists of JSON-ready values in column order)
+        and "dictionaries" (column name to distinct values, for encoded columns)
+    """
+    encoded_columns = []
+    dictionaries = {}
+
+    for index, column in enumerate(columns):
+        values = [row[index] for row in rows]
+
+        # A column holds one type, so its first non-null value decides the encoding
+        sample = next((value for value in values if value is not None), None)
+        if isinstance(sample, str):
+            positions = {}
+            codes = [None if value is None else positions.setdefault(value, len(positions)) for value in values]
+            if len(positions) < len(values) - values.count(None):
+                values = codes
+                dictionaries[column] = list(positions)
+
+        encoded_columns.append(values)
+
+    return {
+        "columns": list(columns),
+        "rows": list(map(list, zip(*encoded_columns))),
+        "dictionaries": dictionaries,
+    }
+
+
+def decode_columnar(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Turn a result from encode_columnar back into one dict per row.
+    """
+    columns = payload["columns"]
+    dictionaries = payload.get("dictionaries", {})
+    lookups = [dictionaries.get(column) for column in columns]
+
+    return [
+        {
+            column: value if lookup is None or value is None else lookup[value]
+            for column, lookup, value in zip(columns, lookups, row)
+        }
+        for row in payload["rows"]
+    ]
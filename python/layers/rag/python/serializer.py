@@ -0,0 +1,55 @@
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Union
+from uuid import UUID
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder is used instead
+    orjson = None
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    _ORJSON_SORTED_OPTIONS = _ORJSON_OPTIONS | orjson.OPT_SORT_KEYS
+
+
+def encode_value(value: Any) -> Any:
+    """
+    JSON form of the values database drivers return that JSON has no type for:
+    dates and times as ISO strings, Decimals (e.g. from SUM()) as ints when
+    whole and floats otherwise, and UUIDs as strings.
+
+    Raises:
+        TypeError: If the value has no JSON form
+    """
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj: Any, sort_keys: bool = False) -> bytes:
+    """
+    Serialize to compact UTF-8 JSON in a single pass, converting dates,
+    Decimals and UUIDs on the way. Uses orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=encode_value, option=_ORJSON_SORTED_OPTIONS if sort_keys else _ORJSON_OPTIONS)
+    return json.dumps(obj, default=encode_value, sort_keys=sort_keys, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(obj: Any, sort_keys: bool = False) -> str:
+    """
+    dumps_bytes, as a string, e.g. for a Lambda response body.
+    """
+    return dumps_bytes(obj, sort_keys).decode("utf-8")
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
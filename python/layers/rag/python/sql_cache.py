@@ -0,0 +1,253 @@
+import hashlib
+import re
+from typing import Callable, Dict, List, Optional
+from vector_codec import encode_vector
+
+# Phrases whose meaning depends on the day the question is asked
+_DATE_RELATIVE_PATTERN = re.compile(
+    r"\b("
+    r"today|tonight|yesterday|tomorrow|now|currently|recent|recently|lately|so far|to date|ytd|"
+    r"(this|last|past|previous|next|current)\s+(\d+\s+)?(day|week|weekend|month|quarter|year)s?"
+    r")\b",
+    re.IGNORECASE
+)
+
+# Date literals baked into generated SQL, e.g. DATE '2025-01-31' or '2025-01-31'::date
+_DATE_LITERAL_PATTERN = re.compile(r"'\d{4}-\d{2}-\d{2}")
+
+# Numbers in a question ("top 5", "in 2024", "top ten"), which end up as literals in its SQL
+_NUMBER_WORDS = {
+    "one": "1", "two": "2", "three": "3", "four": "4", "five": "5", "six": "6",
+    "seven": "7", "eight": "8", "nine": "9", "ten": "10", "eleven": "11", "twelve": "12",
+    "fifteen": "15", "twenty": "20", "thirty": "30", "fifty": "50", "hundred": "100",
+}
+_NUMBER_PATTERN = re.compile(r"\b(\d+(?:\.\d+)?|" + "|".join(_NUMBER_WORDS) + r")\b", re.IGNORECASE)
+
+
+class SemanticSQLCache():
+    """
+    Cache of SQL that answered a question successfully, looked up by question
+    embedding similarity so that rephrasings of a question also hit.
+
+    Answers are stored in the sql_answer_cache table with the date they were
+    generated. The LLM resolves relative dates ("this week") into date literals,
+    so an answer to a date-relative question that contains date literals is only
+    reused on the day it was generated.
+
+    Questions that differ only in a number or a name embed very closely, so an
+    answer is also only reused for a question with the same numbers ("top 5"
+    vs "top 10") and, when a resolver is given, the same artists, albums and
+    tracks.
+    """
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self._table_ready = False
+
+    @staticmethod
+    def is_date_relative(question: str) -> bool:
+        """
+        Whether a question's meaning depends on the current date.
+        """
+        return bool(_DATE_RELATIVE_PATTERN.search(question))
+
+    @staticmethod
+    def has_date_literals(sql: str) -> bool:
+        """
+        Whether SQL contains hard-coded dates.
+        """
+        return bool(_DATE_LITERAL_PATTERN.search(sql))
+
+    @staticmethod
+    def numbers(question: str) -> List[str]:
+        """
+        The numbers in a question, digits or spelled out, as sorted digit strings.
+        """
+        return sorted(
+            _NUMBER_WORDS.get(token.casefold(), token)
+            for token in _NUMBER_PATTERN.findall(question)
+        )
+
+    @classmethod
+    def is_reusable(
+        cls,
+        question: str,
+        sql: str,
+        answered_today: bool,
+        cached_question: Optional[str] = None,
+        resolve: Optional[Callable[[str], List[Dict]]] = None
+    ) -> bool:
+        """
+        Whether SQL generated for a similar question can answer this one today.
+
+        Args:
+            question: The question being answered now
+            sql: The candidate SQL
+            answered_today: Whether the candidate SQL was generated today
+            cached_question: The question the candidate SQL was generated for
+            resolve: Entity resolver (e.g. EntityResolver.resolve) used to check
+                that both questions name the same artists, albums and tracks
+
+        Returns:
+            False if the questions have different numbers or entities, or if the
+            question is date-relative and the SQL pins dates that were resolved
+            on another day
+        """
+        if cached_question is not None:
+            if cls.numbers(question) != cls.numbers(cached_question):
+                return False
+            if resolve is not None and cls._entity_ids(resolve(question)) != cls._entity_ids(resolve(cached_question)):
+                return False
+
+        if cls.is_date_relative(question) and cls.has_date_literals(sql):
+            return answered_today
+        return True
+
+    @staticmethod
+    def _entity_ids(entities: List[Dict]) -> set:
+        return {(entity["type"], entity["id"]) for entity in entities}
+
+    @staticmethod
+    def question_hash(question: str) -> str:
+        """
+        Hex-encoded SHA-256 digest of a whitespace- and case-normalized question.
+        """
+        return hashlib.sha256(" ".join(question.casefold().split()).encode("utf-8")).hexdigest()
+
+    def ensure_table(self, conn):
+        """
+        Create the sql_answer_cache table and its vector index if needed.
+        Runs once per container.
+
+        Args:
+            conn: An open database connection
+        """
+        if self._table_ready:
+            return
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS sql_answer_cache (
+                    question_hash CHAR(64) PRIMARY KEY,
+                    question TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    embedding vector({self.dimension}) NOT NULL,
+                    answered_on DATE NOT NULL DEFAULT CURRENT_DATE,
+                    hit_count INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS sql_answer_cache_embedding_idx
+                ON sql_answer_cache USING hnsw (embedding vector_cosine_ops);
+            """)
+            conn.commit()
+        finally:
+            cursor.close()
+
+        self._table_ready = True
+
+    def lookup(
+        self,
+        conn,
+        question: str,
+        query_embedding: List[float],
+        threshold: float,
+        resolve: Optional[Callable[[str], List[Dict]]] = None
+    ) -> Optional[Dict]:
+        """
+        Find a stored answer to a question similar enough to this one.
+
+        Args:
+            conn: An open database connection
+            question: The user's question
+            query_embedding: The embedding of the question
+            threshold: Minimum cosine similarity for a hit
+            resolve: Entity resolver passed to is_reusable
+
+        Returns:
+            Dict with 'question', 'sql' and 'similarity' keys, or None on a miss
+        """
+        self.ensure_table(conn)
+
+        embedding_str = encode_vector(query_embedding)
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """
+                SELECT question_hash, question, sql, answered_on = CURRENT_DATE,
+                       1 - (embedding <=> %s::vector) AS similarity
+                FROM sql_answer_cache
+                ORDER BY embedding <=> %s::vector
+                LIMIT 5;
+                """,
+                (embedding_str, embedding_str)
+            )
+            candidates = cursor.fetchall()
+
+            for question_hash, cached_question, sql, answered_today, similarity in candidates:
+                if similarity < threshold:
+                    break
+                if not self.is_reusable(question, sql, answered_today, cached_question, resolve):
+                    continue
+
+                cursor.execute(
+                    "UPDATE sql_answer_cache SET hit_count = hit_count + 1 WHERE question_hash = %s;",
+                    (question_hash,)
+                )
+                conn.commit()
+                return {"question": cached_question, "sql": sql, "similarity": float(similarity)}
+
+            conn.commit()
+            return None
+        finally:
+            cursor.close()
+
+    def store(self, conn, question: str, query_embedding: List[float], sql: str):
+        """
+        Store SQL that answered a question successfully, replacing any earlier
+        answer to the same question.
+
+        Args:
+            conn: An open database connection
+            question: The user's question
+            query_embedding: The embedding of the question
+            sql: The SQL that answered it
+        """
+        self.ensure_table(conn)
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """
+                INSERT INTO sql_answer_cache (question_hash, question, sql, embedding)
+                VALUES (%s, %s, %s, %s::vector)
+                ON CONFLICT (question_hash) DO UPDATE
+                SET sql = EXCLUDED.sql,
+                    embedding = EXCLUDED.embedding,
+                    answered_on = CURRENT_DATE;
+                """,
+                (self.question_hash(question), question, sql, encode_vector(query_embedding))
+            )
+            conn.commit()
+        finally:
+            cursor.close()
+
+    def invalidate(self, conn, sql: str):
+        """
+        Remove cached answers with this SQL, e.g. after it failed to execute.
+
+        Args:
+            conn: An open database connection
+            sql: The SQL to remove
+        """
+        self.ensure_table(conn)
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM sql_answer_cache WHERE sql = %s;", (sql,))
+            conn.commit()
+        finally:
+            cursor.close()
@@ -1,8 +1,19 @@
 import json
 import pg8000
 import os
+import threading
+import weakref
 from typing import List, Dict, Optional
 from rag_base import RAGBase
+from entity_resolver import EntityResolver
+from granularity_router import GranularityRouter
+from memory_index import MemoryVectorIndex
+from result_cache import AggregationWatermark, ResultCache
+from sql_cache import SemanticSQLCache
+from sql_templates import match_template, render_sql
+from sql_validator import SQLValidator
+from vector_codec import encode_vector
+from vector_index import STORAGE_MODES, TRAINING_DATA_TYPES
 from datetime import datetime
 
 llm_model_id = os.environ.get(
@@ -16,6 +27,29 @@ class SQLGenerator(RAGBase):
     training examples, and SQL generation via LLM.
     """
     
+    # ANN search parameters last applied to each pooled connection
+    _search_params_by_connection = weakref.WeakKeyDictionary()
+    
+    # Prepared statements for each pooled connection, keyed by SQL text
+    _prepared_statements = weakref.WeakKeyDictionary()
+    
+    # In-memory snapshot of training_embeddings shared by all instances (retrieval_engine="memory")
+    _memory_index: Optional[MemoryVectorIndex] = None
+    _memory_index_lock = threading.Lock()
+    
+    # Dictionary of artists, albums and tracks shared by all instances
+    _entity_resolver: Optional[EntityResolver] = None
+    _entity_resolver_lock = threading.Lock()
+    
+    # Semantic SQL answer cache shared by all instances
+    _sql_cache: Optional[SemanticSQLCache] = None
+    _sql_cache_lock = threading.Lock()
+    
+    # Query result cache and the aggregation watermark versioning it, shared by all instances
+    _result_cache: Optional[ResultCache] = None
+    _aggregation_watermark: Optional[AggregationWatermark] = None
+    _result_cache_lock = threading.Lock()
+    
     def __init__(self, config=None):
         super().__init__(config)
         
@@ -29,6 +63,80 @@ class SQLGenerator(RAGBase):
         
         # Retrieval configuration
         self.top_k = self.config.get("top_k", 10)  # Number of similar examples to retrieve
+        
+        # ANN search parameters (can be overridden per query)
+        self.ivfflat_probes = self.config.get("ivfflat_probes", 10)  # IVFFlat lists scanned per query
+        self.hnsw_ef_search = self.config.get("hnsw_ef_search", 40)  # HNSW candidate list size
+        
+        # In the quantized storage modes, candidates fetched per result for full-precision reranking
+        self.rerank_candidates_factor = self.config.get("rerank_candidates_factor", 4)
+        
+        self.retrieve_context_sql = self._build_retrieve_context_sql()
+        
+        # "pgvector" searches in the database; "memory" searches an in-process snapshot
+        self.retrieval_engine = self.config.get("retrieval_engine", "pgvector")
+        self.memory_index_refresh_seconds = self.config.get("memory_index_refresh_seconds", 60)
+        
+        if self.retrieval_engine == "memory" and not MemoryVectorIndex.available():
+            self.log("numpy is not installed, falling back to pgvector retrieval", title="Warning")
+            self.retrieval_engine = "pgvector"
+        
+        # Reuse SQL for questions similar enough to an answered one instead of calling the LLM.
+        # Training pairs are stored as document embeddings and compared with a query
+        # embedding, so identical questions score lower than against past answers
+        self.sql_cache_enabled = self.config.get("sql_cache_enabled", True)
+        self.sql_cache_threshold = self.config.get("sql_cache_threshold", 0.97)
+        self.training_sql_threshold = self.config.get("training_sql_threshold", 0.95)
+        self.sql_cache = self._get_sql_cache(self.embedding_dimension)
+        
+        # Resolve artist, album and track names in the question to IDs for the prompt
+        self.entity_resolution_enabled = self.config.get("entity_resolution_enabled", True)
+        self.entity_resolver = self._get_entity_resolver(
+            refresh_seconds=self.config.get("entity_dictionary_refresh_seconds", 900),
+            threshold=self.config.get("entity_match_threshold", 0.88),
+            log=self.log
+        )
+        
+        # Rewrite generated SQL to read monthly/yearly aggregates for whole months and years
+        self.granularity_routing_enabled = self.config.get("granularity_routing_enabled", True)
+        self.granularity_router = GranularityRouter(self.log)
+        
+        if self.granularity_routing_enabled and not GranularityRouter.available():
+            self.log("sqlglot is not installed, generated SQL will not be rewritten", title="Warning")
+            self.granularity_routing_enabled = False
+        
+        # Answer frequent question shapes with verified SQL templates instead of the LLM
+        self.sql_templates_enabled = self.config.get("sql_templates_enabled", True)
+        
+        # Cache query results until the listening history aggregator next runs.
+        # The shared tier is a table every container reads
+        self.result_cache_enabled = self.config.get("result_cache_enabled", True)
+        self.result_cache_shared = self.config.get("result_cache_shared", True)
+        self.result_cache, self.aggregation_watermark = self._get_result_cache(
+            max_bytes=self.config.get("result_cache_max_bytes", 32 * 1024 * 1024),
+            max_entry_bytes=self.config.get("result_cache_max_entry_bytes", 1024 * 1024),
+            watermark_ttl_seconds=self.config.get("aggregation_watermark_ttl_seconds", 30)
+        )
+        
+        if self.result_cache_enabled and not self.aggregation_watermark.table_name:
+            self.log("AGGREGATION_STATUS_TABLE_NAME is not set, query results will not be cached", title="Warning")
+            self.result_cache_enabled = False
+        
+        # Generated SQL must be a single SELECT over the aggregate tables. Queries returning
+        # an unbounded number of rows get LIMIT max_result_rows, and queries the planner
+        # estimates above either budget are rejected before they run (None disables a budget)
+        self.max_result_rows = self.config.get("max_result_rows", 1000)
+        self.sql_validator = SQLValidator(max_rows=self.max_result_rows)
+        self.max_query_cost = self.config.get("max_query_cost", 1_000_000)
+        self.max_query_rows = self.config.get("max_query_rows", 5_000_000)
+        
+        if not SQLValidator.available():
+            self.log("sqlglot is not installed, generated SQL will only get basic validation", title="Warning")
+        
+        # Queries run in a READ ONLY transaction with this timeout (None disables it),
+        # and generated SQL is read through a server-side cursor fetch_batch_size rows at a time
+        self.statement_timeout_ms = self.config.get("statement_timeout_ms", 15000)
+        self.fetch_batch_size = self.config.get("fetch_batch_size", 200)
 
     def system_message(self, message: str) -> dict:
         return {"role": "system", "content": message}
@@ -48,6 +156,8 @@ class SQLGenerator(RAGBase):
         question: str,
         question_sql_list: List[Dict],
         ddl_list: List[Dict],
+        doc_list: Optional[List[Dict]] = None,
+        entity_list: Optional[List[Dict]] = None,
         **kwargs,
     ):
         """
@@ -58,6 +168,8 @@ class SQLGenerator(RAGBase):
             question: The question to generate SQL for
             question_sql_list: List of dicts with 'question', 'sql', 'similarity' keys
             ddl_list: List of dicts with 'content', 'similarity' keys
+            doc_list: List of documentation dicts with 'content', 'similarity' keys (optional)
+            entity_list: Entities resolved from the question, as returned by resolve_entities (optional)
             tenant_id: The tenant ID to use for filtering (optional)
 
         Returns:
@@ -77,6 +189,26 @@ class SQLGenerator(RAGBase):
             for ddl in ddl_list:
                 initial_prompt += f"{ddl['content']}\n\n"
 
+        # Add documentation to prompt
+        if doc_list:
+            initial_prompt += "\n===Additional Context\n"
+            for doc in doc_list:
+                initial_prompt += f"{doc['content']}\n\n"
+
+        # Add the artists, albums and tracks the question may mention, so the SQL can filter on their IDs
+        if entity_list:
+            initial_prompt += (
+                "\n===Candidate Entities\n"
+                "These artists, albums or tracks from the listening history have names matching words in the question. "
+                "They are candidates only; the question may use those words in another sense:\n"
+            )
+            for entity in entity_list:
+                by_artist = f" by {entity['artist_name']}" if entity.get("artist_name") else ""
+                initial_prompt += (
+                    f"- {entity['type']} '{entity['name']}'{by_artist} "
+                    f"(matched \"{entity['matched']}\"): {entity['type']}_id = '{entity['id']}'\n"
+                )
+
         current_date = datetime.now().strftime("%Y-%m-%d")
 
         # Add response guidelines
@@ -88,7 +220,7 @@ class SQLGenerator(RAGBase):
             "4. If the question has been asked and answered before, please repeat the answer exactly as it was given before.\n"
             "5. Ensure that the output SQL is PostgreSQL compatible and executable, and free of syntax errors.\n"
             "6. When returning a list, always limit the results to 10 at the max using LIMIT, unless you are asked to create a playlist. In that case, you can return up to 50 songs.\n"
-            "7. If asking about a specific artist, album, or track, ensure to filter using ILIKE for partial matches and to capture different casing.\n"
+            "7. If the question is about an artist, album, or track listed under Candidate Entities, you may filter on its artist_id, album_id or track_id. Ignore candidates the question does not refer to. Otherwise, filter using ILIKE for partial matches and to capture different casing.\n"
             f"8. Use the current date as {current_date} whenever the user asks for 'this week', 'this month', etc.\n"
             "9. Do not include any newlines or breaks in the query, it should be one long string.\n"
             f"10. When performing date arithmetic, ALWAYS cast date strings using the DATE keyword. For example: DATE '{current_date}' - INTERVAL '7 days'. Never use string literals directly with INTERVAL operations.\n"
@@ -113,38 +245,167 @@ class SQLGenerator(RAGBase):
         return message_log
 
 
-    def is_valid_sql(self, sql: str) -> tuple[bool, str]:
+    def is_valid_sql(self, sql: str, check_cost: bool = True) -> tuple[bool, str]:
         """
         Validate if the generated SQL is valid and safe to execute.
         
+        The SQL must parse as a single read-only SELECT over the aggregate tables.
+        With check_cost, the planner's estimates for it must also fit the
+        max_query_cost and max_query_rows budgets.
+        
         Args:
             sql: The SQL query string to validate
+            check_cost: Whether to EXPLAIN the query on a pooled connection
             
         Returns:
             Tuple of (is_valid: bool, error_message: str)
             If valid, error_message will be empty string
             If invalid, error_message will contain the reason
         """
-        if not sql:
-            return False, "SQL query is empty"
+        tree, error_msg = self.sql_validator.check(sql)
+        if error_msg:
+            return False, error_msg
         
-        # Strip whitespace and convert to uppercase for checking
-        sql_stripped = sql.strip()
-        sql_upper = sql_stripped.upper()
-
-        # TODO: implement
+        if check_cost and RAGBase._pool_initialized and (self.max_query_cost or self.max_query_rows):
+            with self.pooled_connection() as conn:
+                error_msg = self._check_query_cost(conn, self.sql_validator.apply_limit(sql, tree))
+            if error_msg:
+                return False, error_msg
         
         # If we get here, it's valid
         return True, ""
 
-    def get_similar_question_sql(self, query_embedding: List[float], top_k: Optional[int] = None) -> List[Dict]:
+    def _check_query_cost(self, conn: pg8000.Connection, sql: str) -> str:
+        """
+        Plan a query without running it and compare the planner's estimates with
+        the budgets: the total cost, and the most rows any step of the plan produces,
+        which catches cartesian joins and scans over years of daily rows.
+        
+        Args:
+            conn: A pooled database connection
+            sql: The SQL query to plan
+            
+        Returns:
+            An error message if the query is over budget or can't be planned,
+            otherwise an empty string
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql)
+            result = cursor.fetchone()[0]
+        except pg8000.Error as e:
+            self._rollback(conn, e)
+            return f"Database rejected the query: {e}"
+        finally:
+            cursor.close()
+        
+        return self._plan_budget_error(result)
+    
+    def _plan_budget_error(self, explain_result) -> str:
+        """
+        Compare an EXPLAIN (FORMAT JSON) result with the max_query_cost and
+        max_query_rows budgets.
+        
+        Args:
+            explain_result: The EXPLAIN output, as JSON text or parsed
+            
+        Returns:
+            An error message if the query is over budget, otherwise an empty string
+        """
+        plan = (json.loads(explain_result) if isinstance(explain_result, str) else explain_result)[0]["Plan"]
+        
+        max_rows = 0
+        pending = [plan]
+        while pending:
+            node = pending.pop()
+            max_rows = max(max_rows, node.get("Plan Rows", 0))
+            pending.extend(node.get("Plans", []))
+        
+        if self.max_query_cost and plan["Total Cost"] > self.max_query_cost:
+            return (
+                f"Query is too expensive: estimated cost {plan['Total Cost']:.0f} exceeds {self.max_query_cost}. "
+                "Narrow the date range, use monthly or yearly tables, or avoid joins between large tables."
+            )
+        if self.max_query_rows and max_rows > self.max_query_rows:
+            return (
+                f"Query processes too many rows: estimated {max_rows} exceeds {self.max_query_rows}. "
+                "Narrow the date range, use monthly or yearly tables, or avoid joins between large tables."
+            )
+        
+        return ""
+
+    def optimize_sql(self, sql: str) -> str:
+        """
+        Rewrite generated SQL to scan the coarsest aggregate tables that answer it,
+        e.g. yearly_track_aggregates instead of a year of daily_track_aggregates.
+        CURRENT_DATE in the date filter is resolved to today's date, so the result
+        is meant to be executed right away, not stored.
+        
+        Args:
+            sql: The generated SQL
+            
+        Returns:
+            The rewritten SQL, or sql unchanged if it can't be rewritten
+        """
+        if not self.granularity_routing_enabled:
+            return sql
+        
+        try:
+            rewritten = self.granularity_router.rewrite(sql)
+        except Exception as e:
+            self.log(f"Error optimizing SQL, running it as generated: {e}", title="Warning")
+            return sql
+        
+        return rewritten or sql
+
+    def _apply_search_params(self, conn: pg8000.Connection, probes: Optional[int] = None, ef_search: Optional[int] = None):
+        """
+        Set the ANN index search parameters for a connection. The settings are
+        session-level, so they are only sent when they differ from what the
+        connection already uses.
+        
+        Args:
+            conn: The pooled connection the similarity search will run on
+            probes: Number of IVFFlat lists to scan (defaults to self.ivfflat_probes)
+            ef_search: Size of the HNSW candidate list (defaults to self.hnsw_ef_search)
+        """
+        params = (
+            probes if probes is not None else self.ivfflat_probes,
+            ef_search if ef_search is not None else self.hnsw_ef_search
+        )
+        
+        if SQLGenerator._search_params_by_connection.get(conn) == params:
+            return
+        
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT set_config('ivfflat.probes', %s, false), set_config('hnsw.ef_search', %s, false)",
+                (str(params[0]), str(params[1]))
+            )
+            # Commit so a later rollback on this connection can't revert the settings
+            conn.commit()
+        finally:
+            cursor.close()
+        
+        SQLGenerator._search_params_by_connection[conn] = params
+
+    def get_similar_question_sql(
+        self,
+        query_embedding: List[float],
+        top_k: Optional[int] = None,
+        probes: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ) -> List[Dict]:
         """
         Retrieve the most similar question-SQL pairs from the vector database.
-        Uses connection pool for parallel-safe execution.
+        Shares retrieve_context's single-statement search path.
         
         Args:
             query_embedding: The embedding vector for the user's question
             top_k: Number of similar examples to retrieve (defaults to self.top_k)
+            probes: IVFFlat lists to scan for this query (defaults to self.ivfflat_probes)
+            ef_search: HNSW candidate list size for this query (defaults to self.hnsw_ef_search)
             
         Returns:
             List of dicts with 'question', 'sql', and 'similarity' keys
@@ -155,69 +416,24 @@ class SQLGenerator(RAGBase):
         if top_k is None:
             top_k = self.top_k
         
-        # Convert embedding to pgvector format
-        embedding_str = '[' + ','.join(map(str, query_embedding)) + ']'
-        
-        # Get connection from pool
-        conn = self._get_connection()
-        
-        try:
-            cursor = conn.cursor()
-            
-            try:
-                # Query for most similar question-SQL pairs using cosine similarity
-                # The <=> operator computes cosine distance (lower is more similar)
-                query = """
-                    SELECT 
-                        content,
-                        sql,
-                        1 - (embedding <=> %s::vector) as similarity
-                    FROM training_embeddings
-                    WHERE type = 'question-sql'
-                    ORDER BY embedding <=> %s::vector
-                    LIMIT %s;
-                """
-                
-                cursor.execute(query, (embedding_str, embedding_str, top_k))
-                results = cursor.fetchall()
-
-                if not results:
-                    self.log("No question-sql entries found")
-                    return []
-                
-                # Format results
-                similar_examples = []
-                for row in results:
-                    similar_examples.append({
-                        "question": row[0],
-                        "sql": row[1],
-                        "similarity": float(row[2])
-                    })
-                
-                self.log(f"Retrieved {len(similar_examples)} similar question-SQL pairs")
-                return similar_examples
-                
-            finally:
-                cursor.close()
-                
-        except pg8000.Error as e:
-            self.log(f"Database error during similarity search: {e}", title="Error")
-            raise e
-        except Exception as e:
-            self.log(f"Unexpected error during similarity search: {e}", title="Error")
-            raise e
-        finally:
-            # Always return connection to pool
-            self._return_connection(conn)
+        return self.retrieve_context(query_embedding, {"question-sql": top_k}, probes, ef_search)["question-sql"]
 
-    def get_related_documentation(self, query_embedding: List[float], top_k: Optional[int] = None) -> List[Dict]:
+    def get_related_documentation(
+        self,
+        query_embedding: List[float],
+        top_k: Optional[int] = None,
+        probes: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ) -> List[Dict]:
         """
         Retrieve the most relevant documentation from the vector database.
-        Uses connection pool for parallel-safe execution.
+        Shares retrieve_context's single-statement search path.
         
         Args:
             query_embedding: The embedding vector for the user's question
             top_k: Number of documentation entries to retrieve (defaults to self.top_k)
+            probes: IVFFlat lists to scan for this query (defaults to self.ivfflat_probes)
+            ef_search: HNSW candidate list size for this query (defaults to self.hnsw_ef_search)
             
         Returns:
             List of dicts with 'content' and 'similarity' keys
@@ -228,66 +444,24 @@ class SQLGenerator(RAGBase):
         if top_k is None:
             top_k = self.top_k
         
-        # Convert embedding to pgvector format
-        embedding_str = '[' + ','.join(map(str, query_embedding)) + ']'
-
-        # Get connection from pool
-        conn = self._get_connection()
-        
-        try:
-            cursor = conn.cursor()
-            
-            try:
-                # Query for most relevant documentation using cosine similarity
-                query = """
-                    SELECT 
-                        content,
-                        1 - (embedding <=> %s::vector) as similarity
-                    FROM training_embeddings
-                    WHERE type = 'documentation'
-                    ORDER BY embedding <=> %s::vector
-                    LIMIT %s;
-                """
-                
-                cursor.execute(query, (embedding_str, embedding_str, top_k))
-                results = cursor.fetchall()
-
-                if not results:
-                    self.log("No documentation entries found")
-                    return []
-                
-                # Format results
-                documentation = []
-                for row in results:
-                    documentation.append({
-                        "content": row[0],
-                        "similarity": float(row[1])
-                    })
-                
-                self.log(f"Retrieved {len(documentation)} related documentation entries")
-                return documentation
-                
-            finally:
-                cursor.close()
-                
-        except pg8000.Error as e:
-            self.log(f"Database error during documentation search: {e}", title="Error")
-            raise e
-        except Exception as e:
-            self.log(f"Unexpected error during documentation search: {e}", title="Error")
-            raise e
-        finally:
-            # Always return connection to pool
-            self._return_connection(conn)
+        return self.retrieve_context(query_embedding, {"documentation": top_k}, probes, ef_search)["documentation"]
 
-    def get_related_ddl(self, query_embedding: List[float], top_k: Optional[int] = None) -> List[Dict]:
+    def get_related_ddl(
+        self,
+        query_embedding: List[float],
+        top_k: Optional[int] = None,
+        probes: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ) -> List[Dict]:
         """
         Retrieve the most relevant DDL statements from the vector database.
-        Uses connection pool for parallel-safe execution.
+        Shares retrieve_context's single-statement search path.
         
         Args:
             query_embedding: The embedding vector for the user's question
             top_k: Number of DDL statements to retrieve (defaults to self.top_k)
+            probes: IVFFlat lists to scan for this query (defaults to self.ivfflat_probes)
+            ef_search: HNSW candidate list size for this query (defaults to self.hnsw_ef_search)
             
         Returns:
             List of dicts with 'content' and 'similarity' keys
@@ -297,58 +471,475 @@ class SQLGenerator(RAGBase):
         """
         if top_k is None:
             top_k = self.top_k
+        
+        return self.retrieve_context(query_embedding, {"ddl": top_k}, probes, ef_search)["ddl"]
 
-        # Convert embedding to pgvector format
-        embedding_str = '[' + ','.join(map(str, query_embedding)) + ']'
+    def _run_prepared(self, conn: pg8000.Connection, sql: str, params: Dict) -> tuple[tuple, List[str]]:
+        """
+        Run SQL with :name placeholders as a prepared statement, preparing it on
+        first use on this connection so later runs reuse its plan.
         
-        # Get connection from pool
-        conn = self._get_connection()
+        Args:
+            conn: A pooled database connection
+            sql: The SQL to run
+            params: Values for the placeholders
+            
+        Returns:
+            Tuple of (rows, column names)
+        """
+        statements = SQLGenerator._prepared_statements.setdefault(conn, {})
+        statement = statements.get(sql)
+        if statement is None:
+            statement = conn.prepare(sql)
+            statements[sql] = statement
         
         try:
-            cursor = conn.cursor()
+            rows = statement.run(**params)
+        except pg8000.Error as e:
+            # Re-prepare on the next call in case the statement was invalidated
+            statements.pop(sql, None)
+            raise e
+        
+        columns = [column["name"] for column in statement.row_desc or []]
+        return rows, columns
+
+    def _build_retrieve_context_sql(self) -> str:
+        """
+        Build the statement that fetches the nearest neighbours of every training
+        data type in one round trip. The embedding is bound once and shared by all
+        branches; each type filter is a literal so the planner can use that type's
+        partial index. In the quantized storage modes each branch takes
+        :candidates_<type> rows from the quantized index and reranks them by
+        full-precision cosine distance.
+        
+        Returns:
+            The SQL text, with :embedding, :k_<type> and :candidates_<type> parameters
+        """
+        storage = STORAGE_MODES[self.storage_mode]
+        query_vector = "CAST(:embedding AS vector)"
+        
+        branches = []
+        for datum_type in TRAINING_DATA_TYPES:
+            param = datum_type.replace("-", "_")
+            sql_column = "sql" if datum_type == "question-sql" else "NULL AS sql"
             
-            try:
-                # Query for most relevant DDL statements using cosine similarity
-                query = """
-                    SELECT 
-                        content,
-                        1 - (embedding <=> %s::vector) as similarity
+            if storage["column"] == "embedding":
+                branches.append(f"""
+            (
+                SELECT '{datum_type}' AS type, content, {sql_column},
+                       1 - (embedding <=> {query_vector}) AS similarity
+                FROM training_embeddings
+                WHERE type = '{datum_type}'
+                ORDER BY embedding <=> {query_vector}
+                LIMIT :k_{param}
+            )""")
+            else:
+                quantized_vector = storage["query_cast"].format(embedding=":embedding", dimension=self.embedding_dimension)
+                branches.append(f"""
+            (
+                SELECT '{datum_type}' AS type, content, {sql_column},
+                       1 - (embedding <=> {query_vector}) AS similarity
+                FROM (
+                    SELECT content, sql, embedding
                     FROM training_embeddings
-                    WHERE type = 'ddl'
-                    ORDER BY embedding <=> %s::vector
-                    LIMIT %s;
-                """
-                
-                cursor.execute(query, (embedding_str, embedding_str, top_k))
-                results = cursor.fetchall()
+                    WHERE type = '{datum_type}'
+                    ORDER BY {storage['column']} {storage['operator']} {quantized_vector}
+                    LIMIT :candidates_{param}
+                ) AS candidates
+                ORDER BY embedding <=> {query_vector}
+                LIMIT :k_{param}
+            )""")
+        
+        return "\n            UNION ALL".join(branches)
 
-                if not results:
-                    self.log("No DDL entries found")
-                    return []
-                
-                # Format results
-                ddl_statements = []
-                for row in results:
-                    ddl_statements.append({
-                        "content": row[0],
-                        "similarity": float(row[1])
-                    })
-                
-                self.log(f"Retrieved {len(ddl_statements)} related DDL statements")
-                return ddl_statements
-                
-            finally:
-                cursor.close()
+    def retrieve_context(
+        self,
+        query_embedding: List[float],
+        k_by_type: Optional[Dict[str, int]] = None,
+        probes: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ) -> Dict[str, List[Dict]]:
+        """
+        Retrieve similar question-SQL pairs, related DDL and related documentation
+        in a single statement on a single pooled connection. The statement is
+        prepared once per connection and reused across invocations. In the quantized
+        storage modes, rerank_candidates_factor candidates per result are fetched
+        from the quantized index and reranked against the full-precision vectors.
+        
+        Args:
+            query_embedding: The embedding vector for the user's question
+            k_by_type: Number of results per training data type, keyed by
+                'question-sql', 'ddl' and 'documentation' (defaults to self.top_k each;
+                types missing from a provided dict are not retrieved)
+            probes: IVFFlat lists to scan for this query (defaults to self.ivfflat_probes)
+            ef_search: HNSW candidate list size for this query (defaults to self.hnsw_ef_search)
+            
+        Returns:
+            Dict keyed by training data type. 'question-sql' holds dicts with 'question',
+            'sql' and 'similarity' keys; 'ddl' and 'documentation' hold dicts with
+            'content' and 'similarity' keys.
+        """
+        if k_by_type is None:
+            k_by_type = {"question-sql": self.top_k, "ddl": self.top_k, "documentation": self.top_k}
+        
+        if self.retrieval_engine == "memory":
+            return self._retrieve_context_from_memory(query_embedding, k_by_type)
+        
+        params, ef_search = self._retrieve_context_params(query_embedding, k_by_type, ef_search)
+        
+        try:
+            # The connection is rolled back, or discarded if broken, on errors
+            with self.pooled_connection() as conn:
+                self._apply_search_params(conn, probes, ef_search)
                 
+                rows, _ = self._run_prepared(conn, self.retrieve_context_sql, params)
+            
+            return self._context_from_rows(rows)
+            
         except pg8000.Error as e:
-            self.log(f"Database error during DDL search: {e}", title="Error")
+            self.log(f"Database error during context retrieval: {e}", title="Error")
             raise e
         except Exception as e:
-            self.log(f"Unexpected error during DDL search: {e}", title="Error")
+            self.log(f"Unexpected error during context retrieval: {e}", title="Error")
             raise e
-        finally:
-            # Always return connection to pool
-            self._return_connection(conn)
+
+    def _retrieve_context_params(
+        self,
+        query_embedding: List[float],
+        k_by_type: Dict[str, int],
+        ef_search: Optional[int]
+    ) -> tuple[Dict, Optional[int]]:
+        """
+        Parameters for retrieve_context_sql, and the HNSW ef_search to run it with.
+        """
+        params = {"embedding": encode_vector(query_embedding)}
+        for datum_type in TRAINING_DATA_TYPES:
+            k = k_by_type.get(datum_type, 0)
+            params[f"k_{datum_type.replace('-', '_')}"] = k
+            params[f"candidates_{datum_type.replace('-', '_')}"] = k * self.rerank_candidates_factor
+        
+        if self.storage_mode != "full":
+            # HNSW returns at most ef_search rows, so it must cover the rerank candidates
+            ef_search = max(
+                ef_search if ef_search is not None else self.hnsw_ef_search,
+                max(k_by_type.values(), default=0) * self.rerank_candidates_factor
+            )
+        
+        return params, ef_search
+
+    def _context_from_rows(self, rows) -> Dict[str, List[Dict]]:
+        """
+        Group the (type, content, sql, similarity) rows of retrieve_context_sql by
+        training data type.
+        """
+        context = {"question-sql": [], "ddl": [], "documentation": []}
+        for datum_type, content, sql, similarity in rows:
+            if datum_type == "question-sql":
+                context[datum_type].append({
+                    "question": content,
+                    "sql": sql,
+                    "similarity": float(similarity)
+                })
+            else:
+                context[datum_type].append({
+                    "content": content,
+                    "similarity": float(similarity)
+                })
+        
+        self.log(
+            f"Retrieved {len(context['question-sql'])} question-SQL pairs, "
+            f"{len(context['ddl'])} DDL statements and "
+            f"{len(context['documentation'])} documentation entries"
+        )
+        return context
+
+    @classmethod
+    def _get_memory_index(cls, refresh_seconds: float, log) -> MemoryVectorIndex:
+        """
+        Get the shared in-memory index, creating it on first use.
+        """
+        with cls._memory_index_lock:
+            if cls._memory_index is None:
+                cls._memory_index = MemoryVectorIndex(refresh_seconds, log)
+            return cls._memory_index
+
+    def _retrieve_context_from_memory(self, query_embedding: List[float], k_by_type: Dict[str, int]) -> Dict[str, List[Dict]]:
+        """
+        retrieve_context backed by the in-memory snapshot. A pooled connection is
+        only checked out when the snapshot is missing or due for a version check.
+        
+        Args:
+            query_embedding: The embedding vector for the user's question
+            k_by_type: Number of results per training data type
+            
+        Returns:
+            Dict keyed by training data type, as returned by retrieve_context
+        """
+        index = self._get_memory_index(self.memory_index_refresh_seconds, self.log)
+        dimension = len(query_embedding)
+        
+        # A snapshot of another dimension was loaded before an embedding migration
+        if index.is_stale() or index.needs_dimension_reload(dimension):
+            try:
+                with self.pooled_connection() as conn:
+                    if not index.reload_for_dimension(conn, dimension):
+                        index.refresh(conn)
+            except Exception as e:
+                if not index.is_loaded:
+                    self.log(f"Error loading in-memory vector index: {e}", title="Error")
+                    raise e
+                # Keep serving the previous snapshot until the next check succeeds
+                self.log(f"Error refreshing in-memory vector index, using previous snapshot: {e}", title="Warning")
+        
+        context = index.search(query_embedding, k_by_type)
+        
+        self.log(
+            f"Retrieved {len(context['question-sql'])} question-SQL pairs, "
+            f"{len(context['ddl'])} DDL statements and "
+            f"{len(context['documentation'])} documentation entries from memory"
+        )
+        return context
+
+    @classmethod
+    def _get_entity_resolver(cls, refresh_seconds: float, threshold: float, log) -> EntityResolver:
+        """
+        Get the shared entity dictionary, creating it on first use.
+        """
+        with SQLGenerator._entity_resolver_lock:
+            if SQLGenerator._entity_resolver is None:
+                SQLGenerator._entity_resolver = EntityResolver(refresh_seconds, threshold, log)
+            return SQLGenerator._entity_resolver
+
+    def resolve_entities(self, question: str) -> List[Dict]:
+        """
+        Find the artists, albums and tracks a question mentions, so the prompt can
+        give the LLM their IDs. The dictionary is reloaded when the aggregation
+        watermark moves; if that fails the previous dictionary is used.
+        
+        Args:
+            question: The user's question
+            
+        Returns:
+            List of entity dicts ('type', 'id', 'name', 'artist_name', 'matched',
+            'score'), best match first; empty if none are found or the
+            dictionary can't be loaded
+        """
+        if not self.entity_resolution_enabled:
+            return []
+        
+        version = self._get_aggregation_watermark()
+        if self.entity_resolver.is_stale(version):
+            try:
+                with self.pooled_connection() as conn:
+                    self.entity_resolver.refresh(conn, version)
+            except Exception as e:
+                self.log(f"Error loading entity dictionary: {e}", title="Warning")
+        
+        entities = self.entity_resolver.resolve(question)
+        if entities:
+            self.log(
+                "Resolved entities: "
+                + ", ".join(f"{entity['type']} '{entity['name']}' ({entity['score']})" for entity in entities)
+            )
+        return entities
+
+    def match_sql_template(self, question: str) -> Optional[Dict]:
+        """
+        Match a question to a verified SQL template, filling its slots from the
+        question without calling the LLM.
+        
+        Args:
+            question: The user's question
+            
+        Returns:
+            Dict with 'template' (name), 'sql' (with :name placeholders),
+            'params' and 'rendered_sql' (parameters inlined, for display) keys,
+            or None if no template fits
+        """
+        if not self.sql_templates_enabled:
+            return None
+        
+        match = match_template(question)
+        if match is None:
+            self.log("No SQL template matches question")
+            return None
+        
+        match["rendered_sql"] = render_sql(match["sql"], match["params"])
+        self.log(f"Matched SQL template '{match['template']}' with {match['params']}")
+        return match
+
+    @classmethod
+    def _get_sql_cache(cls, dimension: int) -> SemanticSQLCache:
+        """
+        Get the shared semantic SQL cache, creating it on first use.
+        """
+        with SQLGenerator._sql_cache_lock:
+            if SQLGenerator._sql_cache is None or SQLGenerator._sql_cache.dimension != dimension:
+                SQLGenerator._sql_cache = SemanticSQLCache(dimension)
+            return SQLGenerator._sql_cache
+
+    def lookup_cached_sql(
+        self,
+        question: str,
+        query_embedding: List[float],
+        question_sql_examples: Optional[List[Dict]] = None
+    ) -> Optional[Dict]:
+        """
+        Find SQL that already answers the question, so the LLM call can be skipped.
+        Checks the retrieved training pairs first, then past answers in the
+        semantic SQL cache. SQL is only reused for a question with the same
+        numbers and artists, albums and tracks, and SQL with hard-coded dates is
+        not reused for date-relative questions unless it was generated today.
+        
+        Args:
+            question: The user's question
+            query_embedding: The embedding of the question
+            question_sql_examples: Retrieved question-SQL pairs, most similar first
+            
+        Returns:
+            Dict with 'sql', 'question', 'similarity' and 'source' ('training' or
+            'cache') keys, or None if the LLM has to generate the SQL
+        """
+        if not self.sql_cache_enabled or not query_embedding:
+            return None
+        
+        # Resolving the question loads the entity dictionary if needed, so the
+        # candidates' questions can be resolved against it too
+        resolve = None
+        if self.entity_resolution_enabled:
+            self.resolve_entities(question)
+            resolve = self.entity_resolver.resolve
+        
+        for example in question_sql_examples or []:
+            if example["similarity"] < self.training_sql_threshold:
+                break
+            if SemanticSQLCache.is_reusable(
+                question, example["sql"], answered_today=False, cached_question=example["question"], resolve=resolve
+            ):
+                self.log(f"Reusing SQL of training question '{example['question']}' ({example['similarity']:.3f})")
+                return {**example, "source": "training"}
+        
+        try:
+            with self.pooled_connection() as conn:
+                cached = self.sql_cache.lookup(conn, question, query_embedding, self.sql_cache_threshold, resolve)
+        except Exception as e:
+            self.log(f"Error reading SQL answer cache: {e}", title="Warning")
+            cached = None
+        
+        if cached is None:
+            self.log("No cached SQL answer for question")
+            return None
+        
+        self.log(f"Reusing cached SQL of question '{cached['question']}' ({cached['similarity']:.3f})")
+        return {**cached, "source": "cache"}
+
+    def cache_sql_answer(self, question: str, query_embedding: List[float], sql: str):
+        """
+        Store SQL that answered a question successfully in the semantic SQL cache.
+        Errors are logged and ignored.
+        
+        Args:
+            question: The user's question
+            query_embedding: The embedding of the question
+            sql: The SQL that answered it
+        """
+        if not self.sql_cache_enabled or not query_embedding:
+            return
+        
+        try:
+            with self.pooled_connection() as conn:
+                self.sql_cache.store(conn, question, query_embedding, sql)
+        except Exception as e:
+            self.log(f"Error writing SQL answer cache: {e}", title="Warning")
+
+    def invalidate_cached_sql(self, sql: str):
+        """
+        Remove SQL from the semantic SQL cache, e.g. after it failed to execute.
+        Errors are logged and ignored.
+        
+        Args:
+            sql: The SQL to remove
+        """
+        try:
+            with self.pooled_connection() as conn:
+                self.sql_cache.invalidate(conn, sql)
+        except Exception as e:
+            self.log(f"Error invalidating SQL answer cache: {e}", title="Warning")
+
+    @classmethod
+    def _get_result_cache(
+        cls,
+        max_bytes: int,
+        max_entry_bytes: int,
+        watermark_ttl_seconds: float
+    ) -> tuple[ResultCache, AggregationWatermark]:
+        """
+        Get the shared query result cache and aggregation watermark, creating them on first use.
+        """
+        with SQLGenerator._result_cache_lock:
+            if SQLGenerator._result_cache is None:
+                SQLGenerator._result_cache = ResultCache(max_bytes, max_entry_bytes)
+            if SQLGenerator._aggregation_watermark is None:
+                SQLGenerator._aggregation_watermark = AggregationWatermark(ttl_seconds=watermark_ttl_seconds)
+            return SQLGenerator._result_cache, SQLGenerator._aggregation_watermark
+
+    def _get_aggregation_watermark(self) -> Optional[str]:
+        """
+        Get the last listening history aggregation timestamp, or None if it can't be read.
+        """
+        try:
+            return self.aggregation_watermark.get()
+        except Exception as e:
+            self.log(f"Error reading aggregation watermark, not caching query results: {e}", title="Warning")
+            return None
+
+    def _get_cached_result(self, conn: pg8000.Connection, cache_key: str, watermark: str) -> Optional[Dict]:
+        """
+        Look up a query result in the in-process tier, then the shared tier.
+        Errors are logged and treated as a miss.
+        """
+        result = self.result_cache.get(cache_key)
+        if result is not None:
+            self.result_cache.record("memory_hits")
+            self.log(f"Query result cache hit (memory): {self.result_cache.stats()}")
+            return result
+        
+        if self.result_cache_shared:
+            try:
+                cached = self.result_cache.get_shared(conn, cache_key, watermark)
+            except Exception as e:
+                self.log(f"Error reading query result cache: {e}", title="Warning")
+                self._rollback(conn, e)
+                cached = None
+            
+            if cached is not None:
+                result, payload = cached
+                self.result_cache.put(cache_key, payload)
+                self.result_cache.record("shared_hits")
+                self.log(f"Query result cache hit (shared): {self.result_cache.stats()}")
+                return result
+        
+        self.result_cache.record("misses")
+        return None
+
+    def _cache_result(self, conn: pg8000.Connection, cache_key: str, watermark: str, result: Dict):
+        """
+        Store a successful query result in both tiers. Errors are logged and ignored.
+        """
+        try:
+            payload = ResultCache.encode(result)
+        except TypeError as e:
+            self.log(f"Query result can't be cached: {e}", title="Warning")
+            return
+        
+        self.result_cache.put(cache_key, payload)
+        
+        if self.result_cache_shared:
+            try:
+                self.result_cache.put_shared(conn, cache_key, watermark, payload)
+            except Exception as e:
+                self.log(f"Error writing query result cache: {e}", title="Warning")
+                self._rollback(conn, e)
 
     def call_llm(self, message_log: List[Dict], **kwargs) -> str:
         """
@@ -416,26 +1007,124 @@ class SQLGenerator(RAGBase):
             self.log(f"Error calling LLM: {e}", title="Error")
             raise e
 
-    def execute_query(self, sql: str) -> Dict:
+    def _begin_read_only(self, conn: pg8000.Connection):
+        """
+        Start a READ ONLY transaction on a connection with statement_timeout_ms
+        applied to its statements. Committing or rolling back ends both.
+        
+        Args:
+            conn: A pooled database connection
+        """
+        # SET TRANSACTION must be the first statement of the transaction
+        conn.commit()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SET TRANSACTION READ ONLY")
+            if self.statement_timeout_ms:
+                cursor.execute(f"SET LOCAL statement_timeout = {int(self.statement_timeout_ms)}")
+        finally:
+            cursor.close()
+    
+    def _fetch_rows(self, conn: pg8000.Connection, sql: str, offset: int, limit: Optional[int], as_rows: bool = False) -> tuple[List, List[str], bool]:
+        """
+        Read up to `limit` rows of a query starting at row `offset` through a
+        server-side cursor, fetching fetch_batch_size rows at a time, so only
+        the requested rows are ever held in memory. Must run inside a transaction.
+        
+        Args:
+            conn: A pooled database connection
+            sql: The SQL query
+            offset: Rows to skip
+            limit: Most rows to return, or None for all of them
+            as_rows: Return rows as lists in column order instead of dicts
+            
+        Returns:
+            Tuple of (rows, column names, whether more rows follow)
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"DECLARE query_rows NO SCROLL CURSOR FOR {sql.strip().rstrip(';')}")
+            if offset:
+                cursor.execute(f"MOVE FORWARD {int(offset)} IN query_rows")
+            
+            data = []
+            columns = []
+            has_more = False
+            while True:
+                # Reading one row past the limit tells whether another page exists
+                batch_size = self.fetch_batch_size
+                if limit is not None:
+                    batch_size = min(batch_size, limit + 1 - len(data))
+                cursor.execute(f"FETCH FORWARD {int(batch_size)} FROM query_rows")
+                rows = cursor.fetchall()
+                if cursor.description:
+                    columns = [desc[0] for desc in cursor.description]
+                
+                for row in rows:
+                    if len(data) == limit:
+                        has_more = True
+                        break
+                    data.append(list(row) if as_rows else dict(zip(columns, row)))
+                
+                if has_more or len(rows) < batch_size:
+                    break
+            
+            cursor.execute("CLOSE query_rows")
+        finally:
+            cursor.close()
+        
+        return data, columns, has_more
+    
+    def execute_query(
+        self,
+        sql: str,
+        params: Optional[Dict] = None,
+        page_size: Optional[int] = None,
+        offset: int = 0,
+        as_rows: bool = False
+    ) -> Dict:
         """
         Execute a SQL query against the RDS database and return results.
         Uses connection pool for parallel-safe execution.
         
+        Queries run in a READ ONLY transaction with a statement_timeout, so a
+        slow query is cancelled instead of holding a pooled connection. No more
+        than max_result_rows rows are returned in total, across all pages.
+        
+        With params, the SQL uses :name placeholders and runs as a prepared
+        statement, so SQL templates reuse one plan per connection.
+        
+        Without params, the SQL gets a LIMIT if it returns an unbounded number of
+        rows, is planned with EXPLAIN first so queries over the cost budgets fail
+        fast, and its rows are read in batches through a server-side cursor.
+        
+        Results are cached under the query's fingerprint, the page and the last
+        listening history aggregation timestamp, so a repeated query is answered
+        from the cache until the aggregate tables change. Cached results carry
+        dates as ISO strings.
+        
         Args:
             sql: The SQL query string to execute
+            params: Values for the :name placeholders in sql
+            page_size: Rows per page, or None for all rows up to max_result_rows
+            offset: Rows to skip, the previous page's next_offset
+            as_rows: Return 'data' as lists of values in column order instead
+                of one dict per row, for compact response formats
             
         Returns:
             Dict with the following structure:
             {
                 'success': bool,
-                'data': List[Dict] | None,  # Query results as list of dicts
+                'data': List[Dict] | List[List] | None,  # Query results as list of dicts, or lists with as_rows
                 'columns': List[str] | None,  # Column names
                 'row_count': int,  # Number of rows returned
+                'has_more': bool,  # Whether another page of rows follows
+                'next_offset': int | None,  # offset of the next page, if any
                 'error': str | None  # Error message if failed
             }
         """
-        # First validate the SQL
-        is_valid, error_msg = self.is_valid_sql(sql)
+        # First validate the SQL. The cost is checked below on a cache miss
+        is_valid, error_msg = self.is_valid_sql(sql, check_cost=False)
         if not is_valid:
             self.log(f"Invalid SQL query: {error_msg}", title="Error")
             return {
@@ -443,66 +1132,120 @@ class SQLGenerator(RAGBase):
                 'data': None,
                 'columns': None,
                 'row_count': 0,
+                'has_more': False,
+                'next_offset': None,
                 'error': error_msg
             }
         
+        if params is None:
+            sql = self.sql_validator.apply_limit(sql)
+        
+        # Rows this page may return without passing the total row cap
+        offset = max(0, int(offset))
+        limit = self.max_result_rows - offset if self.max_result_rows else None
+        if page_size:
+            limit = min(page_size, limit) if limit is not None else page_size
+        if limit is not None and limit <= 0:
+            return {
+                'success': True,
+                'data': [],
+                'columns': [],
+                'row_count': 0,
+                'has_more': False,
+                'next_offset': None,
+                'error': None
+            }
+        
+        watermark = self._get_aggregation_watermark() if self.result_cache_enabled else None
+        cache_key = ResultCache.cache_key(sql, watermark, params, (offset, limit), as_rows) if watermark else None
+        
         # Get connection from pool
         conn = self._get_connection()
         
         try:
-            cursor = conn.cursor()
+            if cache_key:
+                cached = self._get_cached_result(conn, cache_key, watermark)
+                if cached is not None:
+                    return cached
             
-            try:
-                # Execute the query
-                self.log(f"Executing SQL query: {sql[:100]}...")
-                cursor.execute(sql)
-                
-                # Fetch all results
-                results = cursor.fetchall()
-                
-                # Get column names from cursor description
-                columns = [desc[0] for desc in cursor.description] if cursor.description else []
-                
-                # Convert results to list of dicts
-                data = []
-                for row in results:
-                    row_dict = {}
-                    for i, col_name in enumerate(columns):
-                        row_dict[col_name] = row[i]
-                    data.append(row_dict)
-                
-                row_count = len(data)
-                self.log(f"Query executed successfully. Retrieved {row_count} rows")
-                
-                return {
-                    'success': True,
-                    'data': data,
-                    'columns': columns,
-                    'row_count': row_count,
-                    'error': None
-                }
-                
-            finally:
-                cursor.close()
-                
+            self._begin_read_only(conn)
+            
+            # Templates are verified and bounded; generated SQL must fit the planner budgets
+            if params is None and (self.max_query_cost or self.max_query_rows):
+                error_msg = self._check_query_cost(conn, sql)
+                if error_msg:
+                    self.log(f"Rejected SQL query: {error_msg}", title="Error")
+                    conn.rollback()
+                    return {
+                        'success': False,
+                        'data': None,
+                        'columns': None,
+                        'row_count': 0,
+                        'has_more': False,
+                        'next_offset': None,
+                        'error': error_msg
+                    }
+            
+            # Execute the query
+            self.log(f"Executing SQL query: {sql[:100]}...")
+            if params is not None:
+                # Template results are small, so they are paged in memory
+                results, columns = self._run_prepared(conn, sql, params)
+                end = offset + limit if limit is not None else len(results)
+                data = [list(row) if as_rows else dict(zip(columns, row)) for row in results[offset:end]]
+                has_more = len(results) > end
+            else:
+                data, columns, has_more = self._fetch_rows(conn, sql, offset, limit, as_rows)
+            
+            # End the read-only transaction before the result is cached
+            conn.commit()
+            
+            row_count = len(data)
+            self.log(f"Query executed successfully. Retrieved {row_count} rows")
+            
+            if has_more and self.max_result_rows and offset + row_count >= self.max_result_rows:
+                self.log(f"Result truncated at max_result_rows ({self.max_result_rows})", title="Warning")
+                has_more = False
+            
+            result = {
+                'success': True,
+                'data': data,
+                'columns': columns,
+                'row_count': row_count,
+                'has_more': has_more,
+                'next_offset': offset + row_count if has_more else None,
+                'error': None
+            }
+            
+            if cache_key:
+                self._cache_result(conn, cache_key, watermark, result)
+            
+            return result
+        
         except pg8000.Error as e:
             error_msg = f"Database error executing query: {e}"
             self.log(error_msg, title="Error")
+            self._rollback(conn, e)
             return {
                 'success': False,
                 'data': None,
                 'columns': None,
                 'row_count': 0,
+                'has_more': False,
+                'next_offset': None,
                 'error': error_msg
             }
         except Exception as e:
             error_msg = f"Unexpected error executing query: {e}"
             self.log(error_msg, title="Error")
+            self._rollback(conn, e)
             return {
                 'success': False,
                 'data': None,
                 'columns': None,
                 'row_count': 0,
+                'has_more': False,
+                'next_offset': None,
                 'error': error_msg
             }
         finally:
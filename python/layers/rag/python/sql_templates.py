@@ -0,0 +1,428 @@
+import calendar
+import re
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+# Largest result a template returns, whatever the question asks for
+MAX_LIMIT = 50
+DEFAULT_LIMIT = 10
+
+# Stands in for the time period while a question is matched against the templates
+_PERIOD_TOKEN = "<period>"
+
+_MONTH_NAMES = "|".join(name.lower() for name in calendar.month_name if name)
+_PREPOSITION = r"(?:(?:over|in|during|for|from|of|on) )?(?:the )?"
+
+# Time periods, in the order they are tried
+_PERIOD_PATTERNS = [
+    ("rolling", re.compile(rf"\b{_PREPOSITION}(?:last|past) (?P<count>\d+) (?P<unit>day|week|month|year)s\b")),
+    ("rolling", re.compile(rf"\b{_PREPOSITION}(?:last|past) (?P<unit>day|week|month|year)\b")),
+    ("current", re.compile(rf"\b{_PREPOSITION}this (?P<unit>week|month|year)\b")),
+    ("day", re.compile(r"\b(?:(?:on|for|from) )?(?P<day>today|yesterday)\b")),
+    ("month", re.compile(rf"\b(?:in|during|for|of) (?P<month>{_MONTH_NAMES})(?: (?P<year>(?:19|20)\d{{2}}))?\b")),
+    ("year", re.compile(r"\b(?:in|during|for|of) (?P<year>(?:19|20)\d{2})\b")),
+]
+
+# Question phrasing shared by the templates
+_LEAD = r"(?:(?:what|who|which) (?:are|were|was|is|have been) |show me |list |give me |tell me )?(?:my |the )?"
+_TOP = r"(?:top (?P<limit>\d+) |top )?(?:most (?:played|listened to|streamed) )?"
+_ARTIST = r"(?P<artist>[^<]+?)"
+_BY_ARTIST = rf" (?:by|from) {_ARTIST}"
+_LISTENED = r"(?: (?:did i|have i|i) (?:play(?:ed)?|listen(?:ed)? to|stream(?:ed)?)(?: (?:the )?most)?)?"
+_PLAYED = r"(?:play(?:ed)?|listen(?:ed)? to|stream(?:ed)?)"
+
+# Words that make an artist slot a combination, an exclusion or a qualifier
+# rather than a name ("drake or kendrick", "artists other than drake", "drake
+# on repeat"). Such questions are left to the LLM
+_ARTIST_REJECT_WORDS = frozenset({
+    "or", "and", "nor", "other", "than", "except", "excluding", "besides",
+    "without", "not", "but", "vs", "versus", "instead", "repeat", "loop",
+})
+
+
+class SQLTemplate():
+    """
+    Verified SQL for a frequent question shape, with typed slots that are bound
+    as query parameters.
+
+    Slot types:
+        date_range: binds start_date (inclusive) and end_date (exclusive)
+        limit: binds limit, from "top N" (1 for a singular noun), capped at MAX_LIMIT
+        artist: binds artist_pattern, an escaped ILIKE pattern for the artist name
+
+    Granularity is part of the template: each table granularity is its own template.
+    """
+
+    def __init__(self, name: str, sql: str, slots: Tuple[str, ...], patterns: List[str]):
+        self.name = name
+        self.sql = sql
+        self.slots = slots
+        self.patterns = [re.compile(pattern) for pattern in patterns]
+
+    def match(self, question: str, period: Optional[Tuple[date, date]]) -> Optional[Dict]:
+        """
+        Match a normalized question (with its time period replaced by the period
+        token) and fill the slots.
+
+        Args:
+            question: The normalized question
+            period: The (start, end) date range taken out of the question, if any
+
+        Returns:
+            Dict of query parameters, or None if the question doesn't fit
+        """
+        for pattern in self.patterns:
+            match = pattern.fullmatch(question)
+            if match is None:
+                continue
+
+            groups = match.groupdict()
+            params = {}
+
+            if "date_range" in self.slots:
+                if period is None:
+                    return None
+                params["start_date"], params["end_date"] = period
+
+            if "limit" in self.slots:
+                if groups.get("limit"):
+                    limit = int(groups["limit"])
+                elif groups.get("kind", "").endswith("s"):
+                    limit = DEFAULT_LIMIT
+                else:
+                    limit = 1
+                params["limit"] = max(1, min(limit, MAX_LIMIT))
+
+            if "artist" in self.slots:
+                artist = (groups.get("artist") or "").strip()
+                if not is_artist_name(artist):
+                    return None
+                params["artist_pattern"] = f"%{escape_like(artist)}%"
+
+            return params
+
+        return None
+
+
+def _top_entities(kind: str, by_artist: bool = False) -> List[str]:
+    """
+    Phrasings of "top N <kind> [by <artist>] <period>".
+    """
+    by = _BY_ARTIST if by_artist else ""
+    return [
+        rf"{_LEAD}{_TOP}(?P<kind>{kind}){by}{_LISTENED} {_PERIOD_TOKEN}",
+        rf"(?:what|which) (?P<kind>{kind}){by} (?:did|have) i {_PLAYED} (?:the )?most {_PERIOD_TOKEN}",
+    ]
+
+
+def _unique_count(kind: str) -> List[str]:
+    """
+    Phrasings of "how many unique <kind> did I listen to <period>".
+    """
+    return [rf"how many (?:unique |different |distinct )?{kind} (?:did|have) i {_PLAYED} {_PERIOD_TOKEN}"]
+
+
+_TRACK_COLUMNS = "track_id, track_name, artist_name, album_name"
+_ALBUM_COLUMNS = "album_id, album_name, artist_name"
+_ARTIST_COLUMNS = "artist_id, artist_name, genre"
+_DATE_RANGE = "date >= CAST(:start_date AS date) AND date < CAST(:end_date AS date)"
+
+TEMPLATES = [
+    SQLTemplate(
+        "total_plays",
+        f"""
+            SELECT SUM(daily_play_count) AS total_plays
+            FROM daily_track_aggregates
+            WHERE {_DATE_RANGE};
+        """,
+        ("date_range",),
+        [
+            rf"how many (?:times|songs|tracks) did i {_PLAYED} music {_PERIOD_TOKEN}",
+            rf"how (?:much music|many plays|many streams) did i (?:have|{_PLAYED}) {_PERIOD_TOKEN}",
+        ]
+    ),
+    SQLTemplate(
+        "unique_tracks",
+        f"SELECT COUNT(DISTINCT track_id) AS count FROM daily_track_aggregates WHERE {_DATE_RANGE};",
+        ("date_range",),
+        _unique_count("(?:tracks|songs)")
+    ),
+    SQLTemplate(
+        "unique_artists",
+        f"SELECT COUNT(DISTINCT artist_id) AS count FROM daily_artist_aggregates WHERE {_DATE_RANGE};",
+        ("date_range",),
+        _unique_count("artists")
+    ),
+    SQLTemplate(
+        "unique_albums",
+        f"SELECT COUNT(DISTINCT album_id) AS count FROM daily_album_aggregates WHERE {_DATE_RANGE};",
+        ("date_range",),
+        _unique_count("albums")
+    ),
+    SQLTemplate(
+        "top_tracks",
+        f"""
+            SELECT {_TRACK_COLUMNS}, SUM(daily_play_count) AS total_plays, album_cover_url
+            FROM daily_track_aggregates
+            WHERE {_DATE_RANGE}
+            GROUP BY {_TRACK_COLUMNS}, album_cover_url
+            ORDER BY total_plays DESC
+            LIMIT :limit;
+        """,
+        ("date_range", "limit"),
+        _top_entities("tracks?|songs?")
+    ),
+    SQLTemplate(
+        "top_artist_tracks",
+        f"""
+            SELECT {_TRACK_COLUMNS}, SUM(daily_play_count) AS total_plays, album_cover_url
+            FROM daily_track_aggregates
+            WHERE {_DATE_RANGE}
+                AND artist_name ILIKE :artist_pattern
+            GROUP BY {_TRACK_COLUMNS}, album_cover_url
+            ORDER BY total_plays DESC
+            LIMIT :limit;
+        """,
+        ("date_range", "limit", "artist"),
+        _top_entities("tracks?|songs?", by_artist=True)
+    ),
+    SQLTemplate(
+        "top_albums",
+        f"""
+            SELECT {_ALBUM_COLUMNS}, SUM(daily_play_count) AS total_plays, album_cover_url
+            FROM daily_album_aggregates
+            WHERE {_DATE_RANGE}
+            GROUP BY {_ALBUM_COLUMNS}, album_cover_url
+            ORDER BY total_plays DESC
+            LIMIT :limit;
+        """,
+        ("date_range", "limit"),
+        _top_entities("albums?")
+    ),
+    SQLTemplate(
+        "top_artist_albums",
+        f"""
+            SELECT {_ALBUM_COLUMNS}, SUM(daily_play_count) AS total_plays, album_cover_url
+            FROM daily_album_aggregates
+            WHERE {_DATE_RANGE}
+                AND artist_name ILIKE :artist_pattern
+            GROUP BY {_ALBUM_COLUMNS}, album_cover_url
+            ORDER BY total_plays DESC
+            LIMIT :limit;
+        """,
+        ("date_range", "limit", "artist"),
+        _top_entities("albums?", by_artist=True)
+    ),
+    SQLTemplate(
+        "top_artists",
+        f"""
+            SELECT {_ARTIST_COLUMNS}, SUM(daily_play_count) AS total_plays, artist_image_url
+            FROM daily_artist_aggregates
+            WHERE {_DATE_RANGE}
+            GROUP BY {_ARTIST_COLUMNS}, artist_image_url
+            ORDER BY total_plays DESC
+            LIMIT :limit;
+        """,
+        ("date_range", "limit"),
+        _top_entities("artists?")
+    ),
+    SQLTemplate(
+        "artist_plays",
+        f"""
+            SELECT artist_id, artist_name, SUM(daily_play_count) AS total_plays
+            FROM daily_artist_aggregates
+            WHERE {_DATE_RANGE}
+                AND artist_name ILIKE :artist_pattern
+            GROUP BY artist_id, artist_name
+            ORDER BY total_plays DESC;
+        """,
+        ("date_range", "artist"),
+        [
+            rf"how many times (?:did|have) i {_PLAYED} {_ARTIST}(?: songs| tracks| music)? {_PERIOD_TOKEN}",
+            rf"how many (?:plays|streams) (?:did|does|has) {_ARTIST} (?:have|get|had|got) {_PERIOD_TOKEN}",
+            rf"{_LEAD}(?:plays|streams) (?:of|for) {_ARTIST} {_PERIOD_TOKEN}",
+        ]
+    ),
+    SQLTemplate(
+        "artist_daily_trend",
+        f"""
+            SELECT date, artist_name, SUM(daily_play_count) AS total_plays
+            FROM daily_artist_aggregates
+            WHERE {_DATE_RANGE}
+                AND artist_name ILIKE :artist_pattern
+            GROUP BY date, artist_name
+            ORDER BY date DESC;
+        """,
+        ("date_range", "artist"),
+        [
+            rf"{_LEAD}(?:listening )?(?:trends?|history|plays) (?:for|of) {_ARTIST} {_PERIOD_TOKEN} (?:by|per) day",
+            rf"{_LEAD}daily (?:listening )?(?:trends?|history|plays) (?:for|of) {_ARTIST} {_PERIOD_TOKEN}",
+        ]
+    ),
+    SQLTemplate(
+        "artist_monthly_trend",
+        """
+            SELECT year_month, artist_name, SUM(monthly_play_count) AS total_plays
+            FROM monthly_artist_aggregates
+            WHERE year_month >= TO_CHAR(CAST(:start_date AS date), 'YYYY-MM')
+                AND year_month <= TO_CHAR(CAST(:end_date AS date) - 1, 'YYYY-MM')
+                AND artist_name ILIKE :artist_pattern
+            GROUP BY year_month, artist_name
+            ORDER BY year_month DESC;
+        """,
+        ("date_range", "artist"),
+        [
+            rf"{_LEAD}(?:listening )?(?:trends?|history|plays) (?:for|of) {_ARTIST} {_PERIOD_TOKEN} (?:by|per) month",
+            rf"{_LEAD}monthly (?:listening )?(?:trends?|history|plays) (?:for|of) {_ARTIST} {_PERIOD_TOKEN}",
+        ]
+    ),
+]
+
+_TEMPLATES_BY_NAME = {template.name: template for template in TEMPLATES}
+
+
+def is_artist_name(text: str) -> bool:
+    """
+    Whether the text an artist slot captured reads as a single artist name.
+    """
+    words = text.split()
+    return bool(words) and not any(word.strip(",&+/") in _ARTIST_REJECT_WORDS for word in words)
+
+
+def escape_like(value: str) -> str:
+    """
+    Escape the LIKE wildcards in a value so it matches literally.
+    """
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def normalize_question(question: str) -> str:
+    """
+    Casefold a question, collapse whitespace and drop trailing punctuation.
+    """
+    return " ".join(question.replace("’", "'").casefold().split()).rstrip("?!.,;: ")
+
+
+def _shift_months(day: date, months: int) -> date:
+    """
+    Move a date by a number of months, clamping the day to the target month's length.
+    """
+    month_index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(month_index, 12)
+    return date(year, month + 1, min(day.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def _resolve_period(kind: str, groups: Dict, today: date) -> Tuple[date, date]:
+    """
+    Turn a matched time period into a (start, end) date range, end exclusive.
+    """
+    tomorrow = today + timedelta(days=1)
+
+    if kind == "rolling":
+        count = int(groups.get("count") or 1)
+        unit = groups["unit"]
+        if unit == "day":
+            return today - timedelta(days=count), tomorrow
+        if unit == "week":
+            return today - timedelta(weeks=count), tomorrow
+        return _shift_months(today, -count * (12 if unit == "year" else 1)), tomorrow
+
+    if kind == "current":
+        unit = groups["unit"]
+        if unit == "week":
+            return today - timedelta(days=today.weekday()), tomorrow
+        if unit == "month":
+            return today.replace(day=1), tomorrow
+        return today.replace(month=1, day=1), tomorrow
+
+    if kind == "day":
+        if groups["day"] == "today":
+            return today, tomorrow
+        return today - timedelta(days=1), today
+
+    if kind == "month":
+        month = [name.lower() for name in calendar.month_name].index(groups["month"])
+        if groups.get("year"):
+            year = int(groups["year"])
+        else:
+            # A bare month name means its latest occurrence
+            year = today.year if month <= today.month else today.year - 1
+        start = date(year, month, 1)
+        return start, _shift_months(start, 1)
+
+    year = int(groups["year"])
+    return date(year, 1, 1), date(year + 1, 1, 1)
+
+
+def extract_period(question: str, today: Optional[date] = None) -> Tuple[str, Optional[Tuple[date, date]]]:
+    """
+    Find the time period in a normalized question.
+
+    Args:
+        question: The normalized question
+        today: The date relative periods are resolved against (default: today)
+
+    Returns:
+        Tuple of (question with the period replaced by the period token,
+        (start, end) date range). The range is None if the question has no
+        period, or more than one (e.g. a comparison), and the question is then
+        returned unchanged.
+    """
+    today = today or date.today()
+
+    for kind, pattern in _PERIOD_PATTERNS:
+        match = pattern.search(question)
+        if match is None:
+            continue
+
+        remainder = question[:match.start()] + _PERIOD_TOKEN + question[match.end():]
+        if any(other.search(remainder) for _, other in _PERIOD_PATTERNS):
+            return question, None
+
+        return remainder, _resolve_period(kind, match.groupdict(), today)
+
+    return question, None
+
+
+def match_template(question: str, today: Optional[date] = None) -> Optional[Dict]:
+    """
+    Match a question to a SQL template and fill its slots locally.
+
+    Args:
+        question: The user's question
+        today: The date relative periods are resolved against (default: today)
+
+    Returns:
+        Dict with 'template' (name), 'sql' (with :name placeholders) and 'params'
+        keys, or None if no template fits and the LLM has to write the SQL
+    """
+    normalized, period = extract_period(normalize_question(question), today)
+
+    for template in TEMPLATES:
+        params = template.match(normalized, period)
+        if params is not None:
+            return {"template": template.name, "sql": template.sql, "params": params}
+
+    return None
+
+
+def get_template(name: str) -> Optional[SQLTemplate]:
+    """
+    Get a template by name.
+    """
+    return _TEMPLATES_BY_NAME.get(name)
+
+
+def render_sql(sql: str, params: Dict) -> str:
+    """
+    Inline parameters into template SQL, for display and logging only. Queries
+    are always executed with bound parameters.
+    """
+    def literal(match: re.Match) -> str:
+        value = params[match.group(1)]
+        if isinstance(value, (int, float)):
+            return str(value)
+        return "'" + str(value).replace("'", "''") + "'"
+
+    rendered = re.sub(r"(?<!:):(\w+)", literal, sql)
+    return "\n".join(line.strip() for line in rendered.strip().splitlines())
@@ -0,0 +1,149 @@
+from typing import Iterable, Optional, Tuple
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.errors import SqlglotError
+except ImportError:  # sqlglot is optional; generated SQL then gets only basic checks
+    sqlglot = None
+    exp = None
+    SqlglotError = None
+
+# Tables generated SQL may read
+AGGREGATE_TABLES = frozenset(
+    f"{granularity}_{entity}_aggregates"
+    for granularity in ("daily", "monthly", "yearly")
+    for entity in ("track", "artist", "album")
+)
+
+# Functions that read server files or state, write, sleep or reach other servers
+_BLOCKED_FUNCTIONS = frozenset({
+    "set_config", "current_setting", "nextval", "setval", "currval", "lastval",
+    "query_to_xml", "query_to_xml_and_xmlschema", "table_to_xml", "cursor_to_xml", "database_to_xml",
+})
+_BLOCKED_FUNCTION_PREFIXES = ("pg_", "dblink", "lo_", "txid_")
+
+
+def _function_name(node) -> str:
+    if isinstance(node, exp.Anonymous):
+        return str(node.this).lower()
+    return (node.sql_name() or "").lower()
+
+
+class SQLValidator():
+    """
+    Static checks on generated SQL before it reaches the database: it must be
+    a single read-only SELECT over the aggregate tables, without row locks,
+    SELECT INTO or functions that touch server state.
+    """
+
+    def __init__(self, tables: Iterable[str] = AGGREGATE_TABLES, max_rows: int = 1000):
+        self.tables = frozenset(table.lower() for table in tables)
+        self.max_rows = max_rows
+
+    @staticmethod
+    def available() -> bool:
+        return sqlglot is not None
+
+    def check(self, sql: str) -> Tuple[Optional["exp.Expression"], str]:
+        """
+        Parse and check a query.
+
+        Args:
+            sql: The SQL query string
+
+        Returns:
+            Tuple of (parsed query, error message). The error message is empty
+            if the query is accepted. The parsed query is None when it is
+            rejected, and when sqlglot is not installed.
+        """
+        if not sql or not sql.strip():
+            return None, "SQL query is empty"
+
+        if sqlglot is None:
+            return None, self._basic_check(sql)
+
+        try:
+            statements = [statement for statement in sqlglot.parse(sql, read="postgres") if statement is not None]
+        except SqlglotError as e:
+            return None, f"SQL could not be parsed: {str(e).splitlines()[0]}"
+
+        if len(statements) != 1:
+            return None, f"Expected a single SQL statement, found {len(statements)}"
+        tree = statements[0]
+
+        if not isinstance(tree, (exp.Select, exp.SetOperation)):
+            return None, f"Only SELECT queries are allowed, found {tree.key.upper()}"
+
+        for node in tree.walk():
+            if isinstance(node, (exp.DML, exp.DDL, exp.Command, exp.Set, exp.Copy)):
+                return None, f"Only SELECT queries are allowed, found {node.key.upper()}"
+            if isinstance(node, exp.Select):
+                if node.args.get("into"):
+                    return None, "SELECT INTO is not allowed"
+                if node.args.get("locks"):
+                    return None, "Row locks (FOR UPDATE/SHARE) are not allowed"
+            if isinstance(node, exp.Func):
+                name = _function_name(node)
+                if name in _BLOCKED_FUNCTIONS or name.startswith(_BLOCKED_FUNCTION_PREFIXES):
+                    return None, f"Function {name} is not allowed"
+
+        cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+        for table in tree.find_all(exp.Table):
+            if not isinstance(table.this, exp.Identifier):
+                continue  # Table functions such as generate_series, checked above
+            if table.db and table.db.lower() != "public":
+                return None, f"Unknown table {table.db}.{table.name}"
+            if table.name.lower() not in self.tables and table.name.lower() not in cte_names:
+                return None, f"Unknown table {table.name}, only {', '.join(sorted(self.tables))} can be queried"
+
+        return tree, ""
+
+    @staticmethod
+    def _basic_check(sql: str) -> str:
+        """
+        Keyword checks used when sqlglot is not installed.
+        """
+        statement = sql.strip().rstrip(";").strip()
+        if ";" in statement:
+            return "Expected a single SQL statement"
+        if statement.split(None, 1)[0].upper() not in ("SELECT", "WITH"):
+            return "Only SELECT queries are allowed"
+        return ""
+
+    def apply_limit(self, sql: str, tree: Optional["exp.Expression"] = None) -> str:
+        """
+        Append LIMIT max_rows to a checked query that returns an unbounded
+        number of rows. The SQL text is otherwise kept as written.
+
+        Args:
+            sql: A query that passed check
+            tree: The parsed query returned by check, parsed again if omitted
+
+        Returns:
+            The query with a LIMIT, or sql unchanged if it has one already
+        """
+        if sqlglot is None or not self.max_rows:
+            return sql
+
+        if tree is None:
+            tree, error = self.check(sql)
+            if tree is None:
+                return sql
+
+        if tree.args.get("limit") or tree.args.get("fetch"):
+            return sql
+
+        # A single aggregate row, e.g. SELECT COUNT(*) without GROUP BY. Window
+        # aggregates (SUM(x) OVER ()) and aggregates in subqueries keep every row
+        if isinstance(tree, exp.Select) and not tree.args.get("group") and all(
+            any(
+                function.find_ancestor(exp.Window, exp.Select) is tree
+                for function in expression.find_all(exp.AggFunc)
+            )
+            for expression in tree.expressions
+        ):
+            return sql
+
+        # On its own line, so a trailing -- comment can't swallow it
+        return f"{sql.strip().rstrip(';').rstrip()}\nLIMIT {int(self.max_rows)}"
@@ -0,0 +1,108 @@
+import struct
+from array import array
+from typing import List, Optional, Union
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; vectors decode to lists without it
+    np = None
+
+# pg8000 only speaks the text format for parameters and results, so vectors are
+# sent as text literals and received either as text or, when the query selects
+# vector_send(embedding), as the bytea of pgvector's binary wire format.
+
+# 9 significant digits is the shortest precision that round-trips every float4,
+# and pgvector stores float4, so this is lossless and about a third smaller than
+# repr() of the float64 values returned by Bedrock
+_format_component = "{:.9g}".format
+
+# pgvector binary format header: int16 dimensions, int16 unused
+_BINARY_HEADER = struct.Struct(">HH")
+
+# OID of the vector type; assigned when the extension is created, so looked up
+# once per process
+_vector_oid: Optional[int] = None
+
+
+def encode_vector(embedding) -> str:
+    """
+    Format an embedding as a pgvector text literal.
+
+    Args:
+        embedding: A sequence of floats or a NumPy array
+
+    Returns:
+        The vector literal, e.g. '[0.1,0.2,0.3]'
+    """
+    if np is not None and isinstance(embedding, np.ndarray):
+        components = embedding.astype(np.float32, copy=False).tolist()
+    else:
+        components = array("f", embedding)
+    return "[" + ",".join(map(_format_component, components)) + "]"
+
+
+def decode_vector(text: str) -> Union["np.ndarray", List[float]]:
+    """
+    Parse a pgvector text literal.
+
+    Args:
+        text: The vector literal, e.g. '[0.1,0.2,0.3]'
+
+    Returns:
+        A float32 NumPy array, or a list of floats if numpy is not installed
+    """
+    components = text[1:-1].split(",") if len(text) > 2 else []
+    if np is None:
+        return [float(component) for component in components]
+    return np.array(components, dtype=np.float32)
+
+
+def decode_vector_binary(data: bytes) -> Union["np.ndarray", List[float]]:
+    """
+    Decode the output of vector_send(), pgvector's binary wire format: a big-endian
+    int16 dimension count, an unused int16, then big-endian float4 components.
+
+    Args:
+        data: The bytea returned by vector_send()
+
+    Returns:
+        A float32 NumPy array, or a list of floats if numpy is not installed
+
+    Raises:
+        ValueError: If the payload length does not match its dimension count
+    """
+    dimensions, _ = _BINARY_HEADER.unpack_from(data)
+    if len(data) != _BINARY_HEADER.size + 4 * dimensions:
+        raise ValueError(f"Malformed vector: {len(data)} bytes for {dimensions} dimensions")
+
+    if np is None:
+        return list(struct.unpack_from(f">{dimensions}f", data, _BINARY_HEADER.size))
+    return np.frombuffer(data, dtype=">f4", offset=_BINARY_HEADER.size).astype(np.float32)
+
+
+def register_vector_types(conn):
+    """
+    Register pg8000 adapters on a connection so NumPy arrays can be passed as
+    vector parameters and vector columns are returned as NumPy arrays rather
+    than strings. The vector input adapter is skipped until the pgvector
+    extension exists.
+
+    Args:
+        conn: An open pg8000 connection
+    """
+    global _vector_oid
+
+    if np is not None:
+        conn.register_out_adapter(np.ndarray, encode_vector)
+
+    if _vector_oid is None:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT to_regtype('vector')::oid;")
+            _vector_oid = cursor.fetchone()[0]
+            conn.commit()
+        finally:
+            cursor.close()
+
+    if _vector_oid is not None:
+        conn.register_in_adapter(_vector_oid, decode_vector)
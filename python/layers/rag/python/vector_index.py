@@ -0,0 +1,247 @@
+import math
+from typing import Callable, Dict, Optional
+
+# Training data types stored in training_embeddings, each with its own partial index
+TRAINING_DATA_TYPES = ("question-sql", "ddl", "documentation")
+
+# How each storage mode is searched: the column the ANN index covers, its operator
+# class and distance operator, and the expression that casts a query vector to the
+# column's type. Quantized modes search a generated column derived from the
+# full-precision embedding, which is kept for reranking.
+STORAGE_MODES = {
+    "full": {
+        "column": "embedding",
+        "column_definition": None,
+        "opclass": "vector_cosine_ops",
+        "operator": "<=>",
+        "query_cast": "CAST({embedding} AS vector)"
+    },
+    "halfvec": {
+        "column": "embedding_halfvec",
+        "column_definition": "halfvec({dimension}) GENERATED ALWAYS AS (embedding::halfvec({dimension})) STORED",
+        "opclass": "halfvec_cosine_ops",
+        "operator": "<=>",
+        "query_cast": "CAST({embedding} AS halfvec({dimension}))"
+    },
+    "binary": {
+        "column": "embedding_bit",
+        "column_definition": "bit({dimension}) GENERATED ALWAYS AS (binary_quantize(embedding)::bit({dimension})) STORED",
+        "opclass": "bit_hamming_ops",
+        "operator": "<~>",
+        "query_cast": "binary_quantize(CAST({embedding} AS vector))"
+    }
+}
+
+
+class VectorIndexManager():
+    """
+    Manages the lifecycle of the approximate nearest neighbor (ANN) indexes on
+    training_embeddings. Each training data type gets its own partial index, so a
+    similarity search filtered by type only walks rows of that type. Chooses the
+    index type and parameters from each type's row count, builds the indexes after
+    data is loaded, and rebuilds or reindexes them as the table grows. The indexed
+    column and operator class follow the configured storage mode.
+
+    Build state is tracked in the vector_index_state table so that later runs
+    can tell whether an index is stale.
+    """
+
+    # Single index over all types, replaced by the per-type partial indexes
+    legacy_index_name = "training_embeddings_embedding_idx"
+
+    def __init__(self, connection, config: Optional[Dict] = None, log: Callable = print):
+        if config is None:
+            config = {}
+
+        self.connection = connection
+        self.log = log
+
+        # "auto" picks HNSW for small/medium tables and IVFFlat for very large ones
+        self.index_method = config.get("index_method", "auto")
+
+        # Above this many rows "auto" switches from HNSW to IVFFlat
+        self.hnsw_max_rows = config.get("hnsw_max_rows", 1_000_000)
+
+        # HNSW build parameters
+        self.hnsw_m = config.get("hnsw_m", 16)
+        self.hnsw_ef_construction = config.get("hnsw_ef_construction", 64)
+
+        # Rebuild once the table has grown by this factor since the last build
+        self.reindex_growth_factor = config.get("reindex_growth_factor", 2.0)
+
+        # Which column/operator class the indexes cover (see STORAGE_MODES)
+        self.storage_mode = config.get("storage_mode", "full")
+
+    @staticmethod
+    def ivfflat_lists(row_count: int) -> int:
+        """
+        Number of IVFFlat lists for a table size, following the pgvector
+        guidance of rows / 1000 up to 1M rows and sqrt(rows) beyond that.
+        """
+        if row_count <= 1_000_000:
+            return max(1, row_count // 1000)
+        return int(math.sqrt(row_count))
+
+    @staticmethod
+    def ivfflat_probes(lists: int) -> int:
+        """
+        Recommended number of IVFFlat probes for a given number of lists.
+        """
+        return max(1, int(math.ceil(math.sqrt(lists))))
+
+    @staticmethod
+    def index_name(datum_type: str) -> str:
+        """
+        Name of the partial index for a training data type.
+        """
+        return f"training_embeddings_{datum_type.replace('-', '_')}_embedding_idx"
+
+    def choose_index(self, row_count: int, datum_type: str) -> Dict:
+        """
+        Choose the index method and build parameters for a table size.
+
+        Args:
+            row_count: Number of rows the index will cover
+            datum_type: The training data type the partial index is restricted to
+
+        Returns:
+            Dict with 'method' and its build parameters, plus 'definition',
+            the USING/WITH/WHERE clause used to create the index
+        """
+        storage = STORAGE_MODES[self.storage_mode]
+        operand = f"{storage['column']} {storage['opclass']}"
+
+        method = self.index_method
+        if method == "auto":
+            method = "hnsw" if row_count <= self.hnsw_max_rows else "ivfflat"
+
+        if method == "hnsw":
+            return {
+                "method": "hnsw",
+                "m": self.hnsw_m,
+                "ef_construction": self.hnsw_ef_construction,
+                "definition": (
+                    f"USING hnsw ({operand}) "
+                    f"WITH (m = {self.hnsw_m}, ef_construction = {self.hnsw_ef_construction}) "
+                    f"WHERE type = '{datum_type}'"
+                )
+            }
+
+        if method == "ivfflat":
+            lists = self.ivfflat_lists(row_count)
+            return {
+                "method": "ivfflat",
+                "lists": lists,
+                "probes": self.ivfflat_probes(lists),
+                "definition": (
+                    f"USING ivfflat ({operand}) WITH (lists = {lists}) "
+                    f"WHERE type = '{datum_type}'"
+                )
+            }
+
+        raise ValueError(f"Unsupported index method: {method}")
+
+    def ensure_state_table(self, cursor):
+        """
+        Create the table that records how and when each index was last built.
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS vector_index_state (
+                index_name TEXT PRIMARY KEY,
+                definition TEXT NOT NULL,
+                row_count INTEGER NOT NULL,
+                built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+
+    def ensure_indexes(self) -> Dict[str, Dict]:
+        """
+        Build, rebuild or reindex the per-type ANN indexes as needed. Should be called
+        after bulk loads, once the rows the indexes are trained on are present.
+        Also migrates away from the legacy single index. Does not commit.
+
+        Returns:
+            Dict mapping each training data type to the result of _ensure_index
+        """
+        with self.connection.cursor() as cursor:
+            self.ensure_state_table(cursor)
+
+            cursor.execute("SELECT to_regclass(%s::text) IS NOT NULL;", (self.legacy_index_name,))
+            if cursor.fetchone()[0]:
+                self.log(f"Dropping legacy vector index {self.legacy_index_name}")
+                cursor.execute(f"DROP INDEX {self.legacy_index_name};")
+            cursor.execute("DELETE FROM vector_index_state WHERE index_name = %s;", (self.legacy_index_name,))
+
+            cursor.execute("SELECT type, COUNT(*) FROM training_embeddings GROUP BY type;")
+            row_counts = dict(cursor.fetchall())
+
+            results = {
+                datum_type: self._ensure_index(cursor, datum_type, row_counts.get(datum_type, 0))
+                for datum_type in TRAINING_DATA_TYPES
+            }
+
+            if any(result["action"] not in ("unchanged", "skipped") for result in results.values()):
+                # Refresh planner statistics so the new indexes are costed correctly
+                cursor.execute("ANALYZE training_embeddings;")
+
+            return results
+
+    def _ensure_index(self, cursor, datum_type: str, row_count: int) -> Dict:
+        """
+        Build, rebuild or reindex the partial index for one training data type.
+
+        Args:
+            cursor: An open cursor on the training connection
+            datum_type: The training data type the index covers
+            row_count: Number of stored rows of that type
+
+        Returns:
+            Dict with the 'action' taken ('created', 'rebuilt', 'reindexed', 'unchanged'
+            or 'skipped'), the 'row_count' and the chosen index parameters
+        """
+        index_name = self.index_name(datum_type)
+
+        if row_count == 0:
+            # IVFFlat centroids trained on an empty table are useless; wait for data
+            self.log(f"No {datum_type} embeddings yet, skipping vector index build")
+            return {"action": "skipped", "row_count": 0}
+
+        cursor.execute(
+            "SELECT definition, row_count FROM vector_index_state WHERE index_name = %s;",
+            (index_name,)
+        )
+        state = cursor.fetchone()
+
+        cursor.execute("SELECT to_regclass(%s::text) IS NOT NULL;", (index_name,))
+        index_exists = cursor.fetchone()[0]
+
+        chosen = self.choose_index(row_count, datum_type)
+
+        if state is None or not index_exists:
+            action = "created"
+        elif state[0] != chosen["definition"]:
+            action = "rebuilt"
+        elif row_count >= state[1] * self.reindex_growth_factor:
+            action = "reindexed"
+        else:
+            self.log(f"Vector index {index_name} is up to date ({chosen['method']}, {row_count} rows)")
+            return {"action": "unchanged", "row_count": row_count, **chosen}
+
+        self.log(f"Vector index {index_name} {action}: {chosen['definition']} over {row_count} rows")
+
+        if action == "reindexed":
+            cursor.execute(f"REINDEX INDEX {index_name};")
+        else:
+            cursor.execute(f"DROP INDEX IF EXISTS {index_name};")
+            cursor.execute(f"CREATE INDEX {index_name} ON training_embeddings {chosen['definition']};")
+
+        cursor.execute("""
+            INSERT INTO vector_index_state (index_name, definition, row_count, built_at)
+            VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (index_name) DO UPDATE
+            SET definition = EXCLUDED.definition,
+                row_count = EXCLUDED.row_count,
+                built_at = EXCLUDED.built_at;
+        """, (index_name, chosen["definition"], row_count))
+
+        return {"action": action, "row_count": row_count, **chosen}
@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+
+from connection_pool import ConnectionPool
+
+
+class FakeConnection():
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_released_connection_is_reused():
+    pool = ConnectionPool(FakeConnection, min_size=0, max_size=1)
+    conn = pool.acquire()
+    pool.release(conn)
+
+    assert pool.acquire() is conn
+    assert not conn.closed
+
+
+def test_invalidated_connection_is_closed_on_release():
+    pool = ConnectionPool(FakeConnection, min_size=0, max_size=1)
+    conn = pool.acquire()
+    pool.invalidate(conn)
+    pool.release(conn)
+
+    assert conn.closed
+    assert pool.metrics()["size"] == 0
+    assert pool.acquire() is not conn
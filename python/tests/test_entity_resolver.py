@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+
+from entity_resolver import EntityResolver
+
+ROWS = [
+    ("artist", "a1", "Drake", None, 500),
+    ("track", "t1", "Yesterday", "The Beatles", 40),
+    ("album", "b1", "Hours", "Tycho", 30),
+    ("track", "t2", "Weekend", "Mac Miller", 20),
+]
+
+
+@pytest.fixture
+def resolver():
+    resolver = EntityResolver(log=lambda *args, **kwargs: None)
+    resolver._snapshot = EntityResolver._build(ROWS)
+    return resolver
+
+
+def resolved_ids(resolver, question):
+    return [entity["id"] for entity in resolver.resolve(question)]
+
+
+@pytest.mark.parametrize("question", [
+    "what songs did i play yesterday",
+    "Yesterday what did I listen to",
+    "how many hours did i listen this month",
+    "what did i play last weekend",
+])
+def test_everyday_words_are_not_names(resolver, question):
+    assert resolved_ids(resolver, question) == []
+
+
+@pytest.mark.parametrize("question, entity_id", [
+    ("how many times did i play Yesterday", "t1"),
+    ("how many times did i play 'yesterday' this year", "t1"),
+    ("top songs from hours", "b1"),
+    ("how many times did i play drake", "a1"),
+])
+def test_names_marked_in_the_question_resolve(resolver, question, entity_id):
+    assert resolved_ids(resolver, question) == [entity_id]
@@ -0,0 +1,136 @@
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+
+import sqlglot
+from sqlglot import exp
+
+from granularity_router import GranularityRouter
+
+TODAY = date(2025, 10, 17)
+
+router = GranularityRouter(log=lambda *args, **kwargs: None)
+
+
+def date_range(where):
+    tree = sqlglot.parse_one(f"SELECT 1 FROM daily_track_aggregates WHERE {where}", read="postgres")
+    condition = tree.args["where"].this
+    conjuncts = list(condition.flatten()) if isinstance(condition, exp.And) else [condition]
+    return router._extract_date_range(conjuncts, TODAY)
+
+
+@pytest.mark.parametrize("start, end, parts", [
+    # Whole year
+    (date(2024, 1, 1), date(2025, 1, 1), [("yearly", (date(2024, 1, 1), date(2025, 1, 1)))]),
+    # Whole months within a year
+    (date(2024, 3, 1), date(2024, 6, 1), [("monthly", (date(2024, 3, 1), date(2024, 6, 1)))]),
+    # Partial months on both edges, around a whole year
+    (date(2023, 11, 15), date(2025, 2, 10), [
+        ("daily", (date(2023, 11, 15), date(2023, 12, 1))),
+        ("monthly", (date(2023, 12, 1), date(2024, 1, 1))),
+        ("yearly", (date(2024, 1, 1), date(2025, 1, 1))),
+        ("monthly", (date(2025, 1, 1), date(2025, 2, 1))),
+        ("daily", (date(2025, 2, 1), date(2025, 2, 10))),
+    ]),
+    # An end after today covers the current year in full
+    (date(2025, 1, 1), date(2026, 1, 1), [("yearly", (date(2025, 1, 1), None))]),
+    # Open ranges
+    (None, None, [("yearly", (None, None))]),
+    (None, date(2024, 3, 1), [
+        ("yearly", (None, date(2024, 1, 1))),
+        ("monthly", (date(2024, 1, 1), date(2024, 3, 1))),
+    ]),
+    (date(2025, 9, 1), None, [("monthly", (date(2025, 9, 1), None))]),
+    # Rolling 30 days up to today holds no whole month
+    (date(2025, 9, 17), date(2025, 10, 17), [("daily", (date(2025, 9, 17), date(2025, 10, 17)))]),
+    (date(2025, 9, 20), date(2025, 10, 10), [("daily", (date(2025, 9, 20), date(2025, 10, 10)))]),
+])
+def test_split_range(start, end, parts):
+    assert GranularityRouter.split_range(start, end, TODAY) == parts
+
+
+@pytest.mark.parametrize("where, expected", [
+    ("date BETWEEN '2024-01-01' AND '2024-12-31'", (date(2024, 1, 1), date(2025, 1, 1))),
+    ("date BETWEEN DATE '2024-02-01' AND DATE '2024-02-29'", (date(2024, 2, 1), date(2024, 3, 1))),
+    ("EXTRACT(YEAR FROM date) = 2024", (date(2024, 1, 1), date(2025, 1, 1))),
+    ("EXTRACT(YEAR FROM date) = 2024 AND EXTRACT(MONTH FROM date) = 2", (date(2024, 2, 1), date(2024, 3, 1))),
+    ("date >= CURRENT_DATE - INTERVAL '7 days'", (date(2025, 10, 10), None)),
+    ("date >= CURRENT_DATE - INTERVAL '1 month' AND date < CURRENT_DATE", (date(2025, 9, 17), date(2025, 10, 17))),
+    ("date > CURRENT_DATE - 30", (date(2025, 9, 18), None)),
+    ("date >= DATE_TRUNC('month', CURRENT_DATE)", (date(2025, 10, 1), None)),
+    (
+        "date >= DATE_TRUNC('year', CURRENT_DATE) - INTERVAL '1 year' AND date < DATE_TRUNC('year', CURRENT_DATE)",
+        (date(2024, 1, 1), date(2025, 1, 1)),
+    ),
+    ("'2024-06-30' >= date", (None, date(2024, 7, 1))),
+])
+def test_extract_date_range(where, expected):
+    extracted, remaining = date_range(where)
+    assert extracted == expected
+    assert remaining == []
+
+
+def test_extract_date_range_keeps_other_conditions():
+    extracted, remaining = date_range("date >= '2024-01-01' AND artist_name ILIKE '%drake%'")
+    assert extracted == (date(2024, 1, 1), None)
+    assert [condition.sql() for condition in remaining] == ["artist_name ILIKE '%drake%'"]
+
+
+@pytest.mark.parametrize("where", [
+    "date >= NOW() - INTERVAL '7 days'",
+    "EXTRACT(MONTH FROM date) = 2",
+    "EXTRACT(DOW FROM date) = 1",
+    "date >= '2025-01-01' AND date < '2024-01-01'",
+])
+def test_unsupported_date_filters_are_rejected(where):
+    extracted, _ = date_range(where)
+    assert extracted is None
+
+
+@pytest.mark.parametrize("sql", [
+    # Joins
+    "SELECT t.artist_name, SUM(t.daily_play_count) FROM daily_track_aggregates t "
+    "JOIN daily_artist_aggregates a ON a.artist_id = t.artist_id WHERE t.date >= '2024-01-01' GROUP BY 1",
+    # date outside the range filter
+    "SELECT date, SUM(daily_play_count) FROM daily_track_aggregates WHERE date >= '2024-01-01' GROUP BY date",
+    "SELECT track_name, SUM(daily_play_count) FROM daily_track_aggregates WHERE date >= '2024-01-01' "
+    "GROUP BY track_name ORDER BY MAX(date)",
+    # OR on date
+    "SELECT track_name, SUM(daily_play_count) FROM daily_track_aggregates "
+    "WHERE date >= '2024-01-01' OR date < '2020-01-01' GROUP BY 1",
+    # Row-level results
+    "SELECT track_name, daily_play_count FROM daily_track_aggregates WHERE date >= '2024-01-01'",
+    # Only whole days in range
+    "SELECT track_name, SUM(daily_play_count) FROM daily_track_aggregates "
+    "WHERE date >= CURRENT_DATE - INTERVAL '7 days' AND date < CURRENT_DATE GROUP BY 1",
+])
+def test_queries_that_must_read_daily_rows_are_not_rewritten(sql):
+    assert router.rewrite(sql, TODAY) is None
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT artist_name, STRING_AGG(genre, ','), SUM(daily_play_count) FROM daily_artist_aggregates WHERE date >= '2025-01-01' GROUP BY 1",
+    "SELECT artist_name, ARRAY_AGG(genre) FROM daily_artist_aggregates WHERE date >= '2025-01-01' GROUP BY 1",
+    "SELECT artist_name, JSON_AGG(genre) FROM daily_artist_aggregates WHERE date >= '2025-01-01' GROUP BY 1",
+    "SELECT artist_name, JSONB_AGG(genre) FROM daily_artist_aggregates WHERE date >= '2025-01-01' GROUP BY 1",
+    "SELECT artist_name, AVG(daily_play_count) FROM daily_artist_aggregates WHERE date >= '2025-01-01' GROUP BY 1",
+    "SELECT artist_name, MAX(daily_play_count) FROM daily_artist_aggregates WHERE date >= '2025-01-01' GROUP BY 1",
+    "SELECT artist_name, COUNT(artist_id) FROM daily_artist_aggregates WHERE date >= '2025-01-01' GROUP BY 1",
+    "SELECT artist_name, SUM(1) FROM daily_artist_aggregates WHERE date >= '2025-01-01' GROUP BY 1",
+])
+def test_non_additive_aggregates_are_not_rewritten(sql):
+    assert router.rewrite(sql, TODAY) is None
+
+
+def test_additive_aggregates_are_rewritten():
+    sql = (
+        "SELECT artist_name, MAX(artist_image_url), COUNT(DISTINCT genre), SUM(daily_play_count) "
+        "FROM daily_artist_aggregates WHERE date >= '2024-01-01' AND date < '2025-01-01' GROUP BY 1"
+    )
+    rewritten = router.rewrite(sql, TODAY)
+    assert "FROM yearly_artist_aggregates WHERE year >= 2024 AND year < 2025" in rewritten
+    assert "daily_artist_aggregates WHERE" not in rewritten
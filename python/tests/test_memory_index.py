@@ -0,0 +1,61 @@
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+
+from memory_index import MemoryVectorIndex
+
+
+class FakeConnection():
+    # training_embeddings with one row; `column` is the embedding column's (attnum, atttypmod)
+
+    def __init__(self, dimension, column):
+        self.dimension = dimension
+        self.column = column
+        self.loads = 0
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchone(self):
+        return (1, "2025-10-17", list(self.column))
+
+    def fetchall(self):
+        self.loads += 1
+        embedding = struct.pack(">HH", self.dimension, 0) + struct.pack(f">{self.dimension}f", *[1.0] * self.dimension)
+        return [("ddl", "CREATE TABLE t ()", None, embedding)]
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_index(conn):
+    index = MemoryVectorIndex(log=lambda *args, **kwargs: None)
+    index.refresh(conn)
+    return index
+
+
+def test_version_check_reloads_after_column_swap():
+    index = make_index(FakeConnection(4, (3, 4)))
+    index._checked_at = 0.0
+
+    assert index.refresh(FakeConnection(8, (7, 8)))
+    assert index.dimension == 8
+
+
+def test_dimension_mismatch_forces_one_reload():
+    conn = FakeConnection(4, (3, 4))
+    index = make_index(conn)
+    assert not index.needs_dimension_reload(4)
+
+    assert index.reload_for_dimension(conn, 8)
+    assert not index.needs_dimension_reload(8)
+    assert not index.reload_for_dimension(conn, 8)
+    assert conn.loads == 2
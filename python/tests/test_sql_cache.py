@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+
+from sql_cache import SemanticSQLCache
+
+SQL = "SELECT track_name FROM daily_track_aggregates LIMIT 5"
+
+ENTITIES = {
+    "drake": {"type": "artist", "id": "a1"},
+    "kendrick": {"type": "artist", "id": "a2"},
+}
+
+
+def resolve(question):
+    return [entity for name, entity in ENTITIES.items() if name in question.lower()]
+
+
+@pytest.mark.parametrize("question, cached_question", [
+    ("top 10 songs of all time", "top 5 songs of all time"),
+    ("top ten songs of all time", "top 5 songs of all time"),
+    ("what were my top songs in 2023", "what were my top songs in 2024"),
+    ("top songs by kendrick", "top songs by drake"),
+    ("top songs by drake", "my top songs"),
+])
+def test_questions_with_other_numbers_or_entities_are_not_reused(question, cached_question):
+    assert not SemanticSQLCache.is_reusable(question, SQL, True, cached_question, resolve)
+
+
+@pytest.mark.parametrize("question, cached_question", [
+    ("top five songs of all time", "what are my 5 most played songs"),
+    ("what are drake's most played songs", "top songs by drake"),
+])
+def test_rephrasings_are_reused(question, cached_question):
+    assert SemanticSQLCache.is_reusable(question, SQL, True, cached_question, resolve)
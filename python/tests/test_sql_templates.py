@@ -0,0 +1,32 @@
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+
+from sql_templates import match_template
+
+TODAY = date(2025, 10, 17)
+
+
+@pytest.mark.parametrize("question", [
+    "top 10 songs by drake or kendrick this year",
+    "top 5 songs by artists other than drake this year",
+    "how many times did i play drake on repeat this week",
+    "top songs by drake and kendrick this month",
+    "top albums by anyone except drake this year",
+])
+def test_non_name_artist_slots_fall_back_to_llm(question):
+    assert match_template(question, TODAY) is None
+
+
+@pytest.mark.parametrize("question, template, pattern", [
+    ("top 10 songs by drake this year", "top_artist_tracks", "%drake%"),
+    ("how many times did i play taylor swift this week", "artist_plays", "%taylor swift%"),
+])
+def test_artist_names_bind(question, template, pattern):
+    match = match_template(question, TODAY)
+    assert match["template"] == template
+    assert match["params"]["artist_pattern"] == pattern
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "rag", "python"))
+
+from sql_validator import SQLValidator
+
+validator = SQLValidator(max_rows=1000)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT track_name, SUM(daily_play_count) OVER () FROM daily_track_aggregates",
+    "SELECT (SELECT COUNT(*) FROM daily_track_aggregates) AS total FROM daily_track_aggregates",
+    "SELECT artist_name, SUM(daily_play_count) FROM daily_track_aggregates GROUP BY artist_name",
+])
+def test_unbounded_queries_get_a_limit(sql):
+    assert validator.apply_limit(sql).endswith("\nLIMIT 1000")
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*) FROM daily_track_aggregates",
+    "SELECT SUM(daily_play_count), MAX(date) FROM daily_track_aggregates",
+    "SELECT track_name FROM daily_track_aggregates LIMIT 10",
+])
+def test_bounded_queries_are_unchanged(sql):
+    assert validator.apply_limit(sql) == sql
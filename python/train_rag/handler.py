@@ -2,6 +2,8 @@
 from utils.get_questions import get_questions
 from utils.get_ddls import get_ddls
 from rag_trainer import RAGTrainer
+from serializer import dumps
+from embedding_migration import EmbeddingMigrator
 
 def handler(event, context):
     trainer = RAGTrainer()
@@ -14,12 +16,42 @@ def handler(event, context):
     trainer.process_ddls(ddls)
 
     trainer.connect_to_postgres()
-
-    trainer.train()
-
-    trainer.close_connection()
+    try:
+        # Re-embed the stored training data when EMBEDDING_DIMENSION has changed
+        migration_report = None
+        if event.get("migrate_embeddings"):
+            migrator = EmbeddingMigrator()
+            migrator.connection = trainer.connection
+            with trainer.connection.cursor() as cursor:
+                table_exists = migrator.get_stored_embedding_dimension(cursor) is not None
+            trainer.connection.commit()
+
+            if not table_exists:
+                # First training run: train() creates the table at the current dimension
+                print("training_embeddings does not exist yet, skipping the embedding migration")
+            else:
+                migration_report = migrator.migrate()
+
+            # Embeddings that failed to re-embed keep the old dimension live, which train() rejects
+            if migration_report and not migration_report["swapped"] and migration_report["failed"]:
+                return {
+                    "statusCode": 500,
+                    "body": dumps({
+                        "error": "Embedding migration incomplete, run it again to retry",
+                        "migration": migration_report
+                    })
+                }
+
+        # Only new or changed examples are embedded and inserted
+        report = trainer.train()
+    finally:
+        trainer.close_connection()
 
     return {
         "statusCode": 200,
-        "body": "Model trained successfully!"
+        "body": dumps({
+            "message": "Model trained successfully!",
+            "report": report,
+            "migration": migration_report
+        })
     }
\ No newline at end of file
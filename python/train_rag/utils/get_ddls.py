@@ -116,6 +116,36 @@ def get_ddls():
                 album_cover_url TEXT NOT NULL,
                 PRIMARY KEY (year, album_id)
             );
+        """,
+        """
+            -- Trigram indexes on the daily name columns, used by ILIKE '%name%' filters
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            CREATE INDEX IF NOT EXISTS idx_daily_track_track_name_trgm ON daily_track_aggregates USING gin (track_name gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS idx_daily_track_artist_name_trgm ON daily_track_aggregates USING gin (artist_name gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS idx_daily_track_album_name_trgm ON daily_track_aggregates USING gin (album_name gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS idx_daily_artist_artist_name_trgm ON daily_artist_aggregates USING gin (artist_name gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS idx_daily_album_album_name_trgm ON daily_album_aggregates USING gin (album_name gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS idx_daily_album_artist_name_trgm ON daily_album_aggregates USING gin (artist_name gin_trgm_ops);
+        """,
+        """
+            -- Trigram indexes on the monthly name columns, used by ILIKE '%name%' filters
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            CREATE INDEX IF NOT EXISTS idx_monthly_track_track_name_trgm ON monthly_track_aggregates USING gin (track_name gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS idx_monthly_track_artist_name_trgm ON monthly_track_aggregates USING gin (artist_name gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS idx_monthly_track_album_name_trgm ON monthly_track_aggregates USING gin (album_name gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS idx_monthly_artist_artist_name_trgm ON monthly_artist_aggregates USING gin (artist_name gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS idx_monthly_album_album_name_trgm ON monthly_album_aggregates USING gin (album_name gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS idx_monthly_album_artist_name_trgm ON monthly_album_aggregates USING gin (artist_name gin_trgm_ops);
+        """,
+        """
+            -- Trigram indexes on the yearly name columns, used by ILIKE '%name%' filters
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            CREATE INDEX IF NOT EXISTS idx_yearly_track_track_name_trgm ON yearly_track_aggregates USING gin (track_name gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS idx_yearly_track_artist_name_trgm ON yearly_track_aggregates USING gin (artist_name gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS idx_yearly_track_album_name_trgm ON yearly_track_aggregates USING gin (album_name gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS idx_yearly_artist_artist_name_trgm ON yearly_artist_aggregates USING gin (artist_name gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS idx_yearly_album_album_name_trgm ON yearly_album_aggregates USING gin (album_name gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS idx_yearly_album_artist_name_trgm ON yearly_album_aggregates USING gin (artist_name gin_trgm_ops);
         """
     ]
     
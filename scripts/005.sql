@@ -0,0 +1,36 @@
+-- Migration 005: Add trigram indexes on name columns for partial-match searches
+-- The btree name indexes from 003 can't serve ILIKE '%name%', which is how the
+-- chatbot filters on names it couldn't resolve to an ID. pg_trgm GIN indexes can.
+
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- DAILY AGGREGATES
+
+CREATE INDEX IF NOT EXISTS idx_daily_track_track_name_trgm ON daily_track_aggregates USING gin (track_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_daily_track_artist_name_trgm ON daily_track_aggregates USING gin (artist_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_daily_track_album_name_trgm ON daily_track_aggregates USING gin (album_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_daily_artist_artist_name_trgm ON daily_artist_aggregates USING gin (artist_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_daily_album_album_name_trgm ON daily_album_aggregates USING gin (album_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_daily_album_artist_name_trgm ON daily_album_aggregates USING gin (artist_name gin_trgm_ops);
+
+-- MONTHLY AGGREGATES
+
+CREATE INDEX IF NOT EXISTS idx_monthly_track_track_name_trgm ON monthly_track_aggregates USING gin (track_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_monthly_track_artist_name_trgm ON monthly_track_aggregates USING gin (artist_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_monthly_track_album_name_trgm ON monthly_track_aggregates USING gin (album_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_monthly_artist_artist_name_trgm ON monthly_artist_aggregates USING gin (artist_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_monthly_album_album_name_trgm ON monthly_album_aggregates USING gin (album_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_monthly_album_artist_name_trgm ON monthly_album_aggregates USING gin (artist_name gin_trgm_ops);
+
+-- YEARLY AGGREGATES
+
+CREATE INDEX IF NOT EXISTS idx_yearly_track_track_name_trgm ON yearly_track_aggregates USING gin (track_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_yearly_track_artist_name_trgm ON yearly_track_aggregates USING gin (artist_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_yearly_track_album_name_trgm ON yearly_track_aggregates USING gin (album_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_yearly_artist_artist_name_trgm ON yearly_artist_aggregates USING gin (artist_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_yearly_album_album_name_trgm ON yearly_album_aggregates USING gin (album_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_yearly_album_artist_name_trgm ON yearly_album_aggregates USING gin (artist_name gin_trgm_ops);
+
+COMMIT;